@@ -41,8 +41,64 @@ options:
     required: true
   command:
     description:
-      - tmsh command to run on the remote host
-    required: true
+      - tmsh command to run on the remote host. Either C(command) or
+        C(commands) must be specified
+    required: false
+  commands:
+    description:
+      - List of tmsh commands to run on the remote host. The commands are run
+        over a single SSH connection, several at a time
+    required: false
+    version_added: "2.1"
+  concurrency:
+    description:
+      - Number of commands in C(commands) that are run at the same time, each
+        on its own channel of the SSH connection. This must not exceed the
+        MaxSessions setting of sshd on the BIG-IP, which defaults to 10
+    required: false
+    default: 4
+    version_added: "2.1"
+  persist:
+    description:
+      - Number of seconds to keep the SSH connection open after the task
+        finishes. Later tasks for the same server and user reuse it through a
+        local control socket instead of logging in again. When C(0), the
+        connection is closed when the task finishes
+    required: false
+    default: 0
+    version_added: "2.1"
+  dest:
+    description:
+      - Local file to write the stdout of C(command) to, instead of returning
+        it. With C(commands), this is a directory and the stdout of each
+        command is written to a file in it named after the position of the
+        command in the list, such as C(0.out)
+    required: false
+    version_added: "2.1"
+  lines:
+    description:
+      - Return the stdout as a list of lines, in C(stdout_lines), instead of
+        as a single string
+    required: false
+    default: false
+    choices: [ "yes", "no" ]
+    version_added: "2.1"
+  parse:
+    description:
+      - Parse the stdout of C(tmsh list) commands, and of C(tmsh show)
+        commands run with C(field-fmt), into C(parsed). Objects are keyed by
+        their type and then their name, for example
+        C(parsed['ltm pool']['/Common/pool1'].monitor)
+    required: false
+    default: false
+    choices: [ "yes", "no" ]
+    version_added: "2.1"
+  control_path:
+    description:
+      - Directory holding the control sockets of persistent connections
+    required: false
+    default: "~/.ansible/bigip_command"
+    version_added: "2.1"
   password:
     description:
       - BIG-IP password
@@ -61,6 +117,13 @@ options:
 notes:
    - Requires the paramiko Python package on the ansible host. This is as easy
      as pip install paramiko
+   - The shell and roles of the account, and the version and provisioned
+     modules of the device, are cached for an hour in ~/.ansible/bigip_facts
+   - A persistent connection is kept by a background process on the ansible
+     host that exits after C(persist) seconds without a request. Its control
+     socket is only accessible to the user running ansible. A task whose
+     password differs from the one the connection was opened with runs its
+     commands over a connection of its own
 
 requirements: [ "paramiko", "requests" ]
 author: Tim Rupp <caphrim007@gmail.com> (@caphrim007)
@@ -75,6 +138,20 @@ EXAMPLES = '''
       command: "tmsh load sys config default"
       validate_certs: "no"
   delegate_to: localhost
+
+- name: Collect health check output over one connection
+  bigip_command:
+      server: "bigip.localhost.localdomain"
+      user: "admin"
+      password: "admin"
+      commands:
+          - "tmsh show sys cpu"
+          - "tmsh show sys memory"
+          - "tmsh show ltm pool"
+      concurrency: 4
+      persist: 300
+      validate_certs: "no"
+  delegate_to: localhost
 '''
 
 RETURN = '''
@@ -87,6 +164,33 @@ stderr:
     description: The stderr output from running the given command
     returned: changed
     type: string
+stdout_lines:
+    description: The stdout output split into lines
+    returned: changed and lines is true
+    type: list
+    sample: ["auth user admin {", "}"]
+parsed:
+    description: The objects in the stdout output, by type and then by name
+    returned: changed and parse is true
+    type: dict
+    sample: {"ltm pool": {"/Common/pool1": {"monitor": "/Common/http"}}}
+parsed_index:
+    description:
+      - The types of the objects found for each name in the stdout output.
+        Names are listed both with and without their partition
+    returned: changed and parse is true
+    type: dict
+    sample: {"/Common/pool1": ["ltm pool"], "pool1": ["ltm pool"]}
+dest:
+    description: The local file that the stdout output was written to
+    returned: changed and dest is set
+    type: string
+    sample: "/tmp/config.txt"
+size:
+    description: The number of bytes written to dest
+    returned: changed and dest is set
+    type: int
+    sample: 7303
 command:
     description: The command specified by the user
     returned: changed
@@ -102,9 +206,29 @@ app_mode_cmd:
     returned: changed
     type: string
     sample: "list auth user"
+results:
+    description:
+      - The output of each command in C(commands), in the order they were
+        given. Each item has the keys command, stdout, stderr and rc, and
+        app_mode_cmd in Appliance mode. stdout is replaced by stdout_lines
+        when C(lines) is set, and by dest and size when C(dest) is set
+    returned: changed
+    type: list
+    sample: [{"command": "tmsh show sys cpu", "stdout": "", "stderr": "", "rc": 0}]
 '''
 
+import errno
+import fcntl
+import hashlib
+import json
+import os
+import select
 import socket
+import tempfile
+import threading
+import time
+
+from Queue import Queue
 
 try:
     import paramiko
@@ -120,6 +244,142 @@ except ImportError:
 else:
     REQUESTS_AVAILABLE = True
 
+# Seconds between SSH keepalives on a persistent connection
+KEEPALIVE_INTERVAL = 30
+
+# Seconds to wait for a control master to answer a request
+CONTROL_TIMEOUT = 600
+
+# Maximum number of bytes read from a channel at a time
+READ_SIZE = 32768
+
+# Local cache of device and account facts, and the number of seconds
+# they are trusted before being read from the device again
+FACTS_CACHE_DIR = '~/.ansible/bigip_facts'
+FACTS_TTL = 3600
+
+
+class BigIpCommandError(Exception):
+    pass
+
+
+def tmsh_command(command, app_mode):
+    """Adjusts a command to the shell of the user
+
+    Appliance mode drops the user directly into tmsh, so any leading tmsh
+    syntax can be removed from the provided command. If the user has some
+    BIG-IPs that are in Appliance Mode and some that are not, then it may be
+    necessary to add the non-app mode syntax to the command before it is
+    executed.
+    """
+    if app_mode:
+        if command[0:4] == 'tmsh':
+            return command[4:].strip()
+        return command
+    else:
+        if command[0:4] != 'tmsh':
+            return 'tmsh ' + command
+        return command
+
+
+class DeviceFacts(object):
+    """Capabilities of a BIG-IP and of the connecting account
+
+    The facts are cached on the local host in one file per BIG-IP under
+    FACTS_CACHE_DIR, and are read from the device again once they are older
+    than FACTS_TTL seconds. The account facts (shell and roles) are kept per
+    user, while the device facts (version and provisioned modules) are
+    shared by every user of the device.
+    """
+
+    def __init__(self, server, user, password, validate_certs, ttl=FACTS_TTL):
+        self.server = server
+        self.user = user
+        self.password = password
+        self.validate_certs = validate_certs
+        self.ttl = ttl
+
+        directory = os.path.expanduser(FACTS_CACHE_DIR)
+        self.path = os.path.join(directory, '%s.json' % server)
+        self._cache = None
+
+    def _load(self):
+        if self._cache is None:
+            try:
+                with open(self.path) as fh:
+                    self._cache = json.load(fh)
+            except (IOError, ValueError):
+                self._cache = {}
+        return self._cache
+
+    def _save(self):
+        directory = os.path.dirname(self.path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory, 0700)
+
+        # Written to a temporary file first so that concurrent tasks for the
+        # same device never read a partially written cache
+        fd, tmp = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, 'w') as fh:
+            json.dump(self._cache, fh)
+        os.rename(tmp, self.path)
+
+    def _get(self, uri):
+        resp = requests.get('https://%s/mgmt/tm/%s' % (self.server, uri),
+                            auth=(self.user, self.password),
+                            verify=self.validate_certs)
+        if resp.status_code != 200:
+            raise Exception('Failed to query the REST API')
+        return resp.json()
+
+    def _cached(self, key, fetch, refresh):
+        cache = self._load()
+        entry = cache.get(key)
+        if refresh or not entry or time.time() - entry['fetched'] > self.ttl:
+            entry = fetch()
+            entry['fetched'] = time.time()
+            cache[key] = entry
+            self._save()
+        return entry
+
+    def _read_account(self):
+        result = self._get('auth/user/%s' % self.user)
+        roles = set([p['role'] for p in result.get('partitionAccess', [])])
+
+        # The REST API does not list a shell if the console has been
+        # deactivated for the account
+        return dict(shell=result.get('shell'), roles=sorted(roles))
+
+    def _read_device(self):
+        version = None
+        for entry in self._get('sys/version').get('entries', {}).values():
+            stats = entry.get('nestedStats', {}).get('entries', {})
+            if 'Version' in stats:
+                version = stats['Version']['description']
+
+        modules = []
+        for item in self._get('sys/provision').get('items', []):
+            if item.get('level', 'none') != 'none':
+                modules.append(item['name'])
+
+        return dict(version=version, modules=sorted(modules))
+
+    def account(self, refresh=False):
+        return self._cached('account:%s' % self.user, self._read_account, refresh)
+
+    def device(self, refresh=False):
+        return self._cached('device', self._read_device, refresh)
+
+    def invalidate(self):
+        self._cache = {}
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+    def appliance_mode(self):
+        return self.account()['shell'] == 'tmsh'
+
 
 class BigIpCommon(object):
     def __init__(self, *args, **kwargs):
@@ -127,35 +387,316 @@ class BigIpCommon(object):
         self.params = kwargs
 
     def appliance_mode(self):
-        user = self.params['user']
-        server = self.params['server']
-        password = self.params['password']
-        validate_certs = self.params['validate_certs']
+        facts = DeviceFacts(self.params['server'], self.params['user'],
+                            self.params['password'],
+                            self.params['validate_certs'])
+        return facts.appliance_mode()
 
-        self._uri = 'https://%s/mgmt/tm/auth/user/%s' % (server, user)
-        self._headers = {
-            'Content-Type': 'application/json'
-        }
 
-        resp = requests.get(self._uri,
-                            auth=(user, password),
-                            verify=validate_certs)
+class StringSink(object):
+    """Collects the output of a stream into a string"""
 
-        if resp.status_code != 200:
-            raise Exception('Failed to query the REST API to check appliance mode')
-        else:
-            result = resp.json()
-            if 'shell' in result and result['shell'] == 'tmsh':
-                return True
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(data)
+
+    def close(self):
+        pass
+
+    def value(self):
+        return ''.join(self._chunks)
+
+    def result(self):
+        return dict(stdout=self.value())
+
+
+class LineSink(StringSink):
+    """Splits the output of a stream into lines as it is read
+
+    Only the last, incomplete, line of the data read so far is held apart
+    from the list of lines.
+    """
+
+    def __init__(self):
+        self._lines = []
+        self._partial = ''
+
+    def write(self, data):
+        lines = (self._partial + data).split('\n')
+        self._partial = lines.pop()
+        self._lines.extend(lines)
+
+    def close(self):
+        if self._partial:
+            self._lines.append(self._partial)
+            self._partial = ''
+
+    def result(self):
+        return dict(stdout_lines=self._lines)
+
+
+class FileSink(StringSink):
+    """Writes the output of a stream straight to a local file
+
+    Memory use does not depend on the size of the output.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.size = 0
+        self._fh = open(path, 'wb')
+
+    def write(self, data):
+        self._fh.write(data)
+        self.size += len(data)
+
+    def close(self):
+        self._fh.close()
+
+    def result(self):
+        return dict(dest=self.path, size=self.size)
+
+
+TOKEN_OPEN = object()
+TOKEN_CLOSE = object()
+TOKEN_NEWLINE = object()
+
+
+class QuotedWord(str):
+    """A word of tmsh output that was quoted, and so is never a brace"""
+    pass
+
+
+class RawText(str):
+    """The unparsed body of a top level tmsh object"""
+    pass
+
+
+class TmshParser(object):
+    """Parses the output of tmsh list and show commands
+
+    The output is read once, line by line, and split into words and braces
+    without the use of regular expressions, so the time taken grows linearly
+    with the size of the output.
+
+    Each top level object, such as "ltm pool /Common/pool1 { ... }", is
+    stored in objects under its type and then its name. Objects of types
+    without names, such as "sys global-settings { ... }", are stored under
+    their type alone. While the objects are parsed, index records the types
+    of each name, both with and without its partition.
+
+    Inside an object, each line is a property. A property without a value is
+    a flag and is given the value None, a property with several values is
+    given a list of them, and a property followed by braces is given the
+    parsed contents of the braces. Braces that only hold flags, such as the
+    vlans of a virtual server, are given the list of those flags instead.
+
+    The definitions of iRules are not tmsh syntax and are kept as text.
+    """
+
+    # Types of objects whose body is kept as text
+    RAW_TYPES = ('ltm rule', 'gtm rule')
+
+    def __init__(self):
+        self.objects = {}
+        self.index = {}
+
+    def parse(self, lines):
+        """Parses an iterable of lines and returns the objects found"""
+        stack = []
+        words = []
+
+        # Tracks whether the innermost brace was opened on the current line,
+        # as in "vlans { /Common/external /Common/internal }"
+        inline = False
+
+        for token in self._tokenize(lines):
+            if token is TOKEN_NEWLINE:
+                if words and stack:
+                    self._add_property(stack[-1][1], words)
+                words = []
+                inline = False
+            elif token is TOKEN_OPEN:
+                stack.append((words, {}))
+                words = []
+                inline = True
+            elif token is TOKEN_CLOSE:
+                if not stack:
+                    words = []
+                    continue
+
+                key, block = stack.pop()
+                if words and inline:
+                    value = list(words)
+                else:
+                    if words:
+                        self._add_property(block, words)
+                    value = self._block_value(block)
+                words = []
+                inline = False
+
+                if stack:
+                    stack[-1][1][' '.join(key)] = value
+                elif key:
+                    self._add_object(key, value)
+            elif isinstance(token, RawText):
+                # Only produced right after the opening brace of a top level
+                # object, which the raw text runs up to the end of
+                key = stack.pop()[0]
+                self._add_object(key, dict(definition=token))
+                words = []
             else:
-                return False
+                words.append(token)
 
+        return self.objects
+
+    def _tokenize(self, lines):
+        lines = iter(lines)
+        depth = 0
+
+        for line in lines:
+            if '"' in line:
+                tokens = self._split_quoted(line.rstrip('\r\n'), lines)
+            else:
+                tokens = line.split()
+                if tokens and tokens[0][0] == '#':
+                    continue
+
+            header = depth == 0
+            for word in tokens:
+                if isinstance(word, QuotedWord):
+                    yield word
+                elif word == '{':
+                    depth += 1
+                    yield TOKEN_OPEN
+                elif word == '}':
+                    depth -= 1
+                    yield TOKEN_CLOSE
+                else:
+                    yield word
+
+            if header and depth == 1 and ' '.join(tokens[0:2]) in self.RAW_TYPES:
+                depth = 0
+                yield RawText(self._read_raw(lines))
+            yield TOKEN_NEWLINE
+
+    def _split_quoted(self, line, lines):
+        """Splits a line that holds quoted words
+
+        The quotes are removed from the words. A quoted word may continue
+        onto the following lines, which are then read from lines.
+        """
+        tokens = []
+        pos = 0
+        size = len(line)
+
+        while pos < size:
+            char = line[pos]
+            if char.isspace():
+                pos += 1
+            elif char == '"':
+                chars = []
+                pos += 1
+                while True:
+                    if pos >= size:
+                        # The quoted word continues on the next line
+                        chars.append('\n')
+                        line = next(lines, None)
+                        if line is None:
+                            break
+                        line = line.rstrip('\r\n')
+                        pos = 0
+                        size = len(line)
+                        continue
+
+                    char = line[pos]
+                    if char == '\\' and pos + 1 < size:
+                        chars.append(line[pos + 1])
+                        pos += 2
+                    elif char == '"':
+                        pos += 1
+                        break
+                    else:
+                        chars.append(char)
+                        pos += 1
+                tokens.append(QuotedWord(''.join(chars)))
+            else:
+                end = pos
+                while end < size and not line[end].isspace():
+                    end += 1
+                tokens.append(line[pos:end])
+                pos = end
+        return tokens
+
+    def _read_raw(self, lines):
+        """Reads the text of a top level object up to its closing brace"""
+        body = []
+        depth = 1
+
+        for line in lines:
+            line = line.rstrip('\r\n')
+            pos = 0
+            size = len(line)
+            while pos < size:
+                char = line[pos]
+                if char == '\\':
+                    pos += 1
+                elif char == '{':
+                    depth += 1
+                elif char == '}':
+                    depth -= 1
+                    if depth == 0:
+                        break
+                pos += 1
+
+            if depth == 0:
+                body.append(line[:pos])
+                break
+            body.append(line)
+
+        return '\n'.join(body).rstrip()
+
+    def _add_property(self, block, words):
+        if len(words) == 1:
+            value = None
+        elif len(words) == 2:
+            value = words[1]
+        else:
+            value = words[1:]
+        block[words[0]] = value
+
+    def _block_value(self, block):
+        if block and all(x is None for x in block.itervalues()):
+            return sorted(block.keys())
+        return block
+
+    def _add_object(self, words, value):
+        if len(words) > 2:
+            kind = ' '.join(words[:-1])
+            name = words[-1]
+            self.objects.setdefault(kind, {})[name] = value
+
+            self.index.setdefault(name, []).append(kind)
+            short = name.rsplit('/', 1)[-1]
+            if short != name:
+                self.index.setdefault(short, []).append(kind)
+        else:
+            self.objects[' '.join(words)] = value
+
+
+class SshRunner(BigIpCommon):
+    """Runs commands over a single SSH transport
+
+    The key exchange and authentication happen once. Each command is then
+    run on its own channel of the transport, up to concurrency at a time.
+    """
 
-class BigIpSsh(BigIpCommon):
     def __init__(self, *args, **kwargs):
-        super(BigIpSsh, self).__init__(*args, **kwargs)
+        super(SshRunner, self).__init__(*args, **kwargs)
 
-        self.result = {}
+        self._app_mode = None
         self.api = paramiko.SSHClient()
 
         user = self.params['user']
@@ -167,38 +708,450 @@ class BigIpSsh(BigIpCommon):
             self.api.set_missing_host_key_policy(paramiko.AutoAddPolicy())
 
         self.api.connect(server, username=user, password=password)
+        self.transport = self.api.get_transport()
+
+    def is_active(self):
+        return self.transport is not None and self.transport.is_active()
+
+    def close(self):
+        self.api.close()
+
+    @property
+    def app_mode(self):
+        # The shell of a user does not change for the life of a connection,
+        # so it is only looked up once
+        if self._app_mode is None:
+            self._app_mode = self.appliance_mode()
+        return self._app_mode
+
+    def execute(self, command, stdout):
+        """Runs a command, passing its output to the stdout sink
+
+        stdout and stderr are drained together, READ_SIZE bytes at a time, as
+        soon as either has data. Reading one stream to the end before the
+        other can stall the command once the unread stream fills the channel
+        window.
+        """
+        stderr = StringSink()
+        channel = self.transport.open_session()
+        try:
+            channel.exec_command(command)
+            while True:
+                drained = False
+                if channel.recv_ready():
+                    stdout.write(channel.recv(READ_SIZE))
+                    drained = True
+                if channel.recv_stderr_ready():
+                    stderr.write(channel.recv_stderr(READ_SIZE))
+                    drained = True
+
+                if drained:
+                    continue
+                elif channel.exit_status_ready():
+                    # Data may still arrive between the checks above and
+                    # the exit status, so the buffers are checked again
+                    if not channel.recv_ready() and not channel.recv_stderr_ready():
+                        break
+                else:
+                    select.select([channel], [], [], 1)
+            rc = channel.recv_exit_status()
+        finally:
+            channel.close()
+            stdout.close()
+
+        result = stdout.result()
+        result.update(stderr=stderr.value(), rc=rc)
+        return result
+
+    def run(self, commands, concurrency=1, dests=None, lines=False):
+        """Runs the commands and returns their output in the given order
+
+        The stdout of each command is written to the matching path in dests
+        when it is given, and is otherwise returned either as a string or,
+        when lines is True, as a list of lines.
+        """
+        app_mode = self.app_mode
+        results = [None] * len(commands)
+        queue = Queue()
+
+        for index, command in enumerate(commands):
+            queue.put((index, command))
+
+        def sink(index):
+            if dests:
+                return FileSink(dests[index])
+            elif lines:
+                return LineSink()
+            else:
+                return StringSink()
+
+        def worker():
+            while True:
+                item = queue.get()
+                if item is None:
+                    break
+
+                index, command = item
+                try:
+                    result = self.execute(tmsh_command(command, app_mode),
+                                          sink(index))
+                except Exception, e:
+                    result = dict(stdout='', stderr=str(e), rc=-1, failed=True)
+                results[index] = result
+
+        workers = []
+        for x in range(max(1, min(concurrency, len(commands)))):
+            queue.put(None)
+            thread = threading.Thread(target=worker)
+            thread.daemon = True
+            thread.start()
+            workers.append(thread)
+
+        for thread in workers:
+            thread.join()
+
+        return app_mode, results
+
+
+class ControlMaster(object):
+    """Keeps an SshRunner open and serves it over a unix socket
+
+    The master is a background process that answers one JSON request per
+    connection to its socket. It exits once no request has been received
+    for persist seconds, or when the SSH connection is lost.
+    """
+
+    def __init__(self, path, params):
+        self.path = path
+        self.params = params
+        self.persist = params['persist']
+        self.runner = None
+        self.error = None
+        self.reported = False
+        self.active = 0
+        self.last_request = time.time()
+        self.lock = threading.Lock()
+
+    def start(self):
+        """Binds the control socket and forks the master process
+
+        The socket is bound before forking so that a client can connect
+        straight away; the connection waits in the backlog until the master
+        is ready to accept it.
+        """
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            listener.bind(self.path)
+        except socket.error, e:
+            listener.close()
+            if e.errno != errno.EADDRINUSE:
+                raise
+            # Another task started a master first, and it will be used
+            return
+        os.chmod(self.path, 0600)
+        listener.listen(16)
+
+        pid = os.fork()
+        if pid > 0:
+            listener.close()
+            os.waitpid(pid, 0)
+            return
+
+        try:
+            os.setsid()
+            if os.fork() > 0:
+                os._exit(0)
+
+            # The module output must not be held open by the master, or
+            # ansible would wait for it to exit
+            null = os.open(os.devnull, os.O_RDWR)
+            for fd in range(3):
+                os.dup2(null, fd)
+
+            self.serve(listener)
+        finally:
+            os._exit(0)
+
+    def serve(self, listener):
+        try:
+            self.runner = SshRunner(**self.params)
+            self.runner.transport.set_keepalive(KEEPALIVE_INTERVAL)
+        except Exception, e:
+            self.error = str(e)
+
+        try:
+            while True:
+                ready = select.select([listener], [], [], 1)[0]
+                if ready:
+                    conn = listener.accept()[0]
+                    with self.lock:
+                        self.active += 1
+                    thread = threading.Thread(target=self.handle, args=(conn,))
+                    thread.daemon = True
+                    thread.start()
+
+                    # A failed master only reports its error once so that
+                    # the next task can try to connect again
+                    if self.error:
+                        thread.join()
+                        if self.reported:
+                            break
+                elif self._expired():
+                    break
+        finally:
+            self._unlink()
+            listener.close()
+            if self.runner:
+                self.runner.close()
+
+    def _expired(self):
+        with self.lock:
+            if self.active:
+                return False
+            if self.runner and not self.runner.is_active():
+                return True
+            return time.time() - self.last_request > self.persist
+
+    def _unlink(self):
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+    def handle(self, conn):
+        try:
+            message = read_message(conn)
+            if not message:
+                return
+
+            request = json.loads(message)
+            if request.get('password') != self.params['password']:
+                response = dict(mismatch=True)
+            elif self.error:
+                response = dict(failed=True, msg=self.error)
+                self.reported = True
+            elif not self.runner.is_active():
+                self._unlink()
+                response = dict(stale=True)
+            else:
+                app_mode, results = self.runner.run(request['commands'],
+                                                    request['concurrency'],
+                                                    request['dests'],
+                                                    request['lines'])
+                response = dict(app_mode=app_mode, results=results)
+            conn.sendall(json.dumps(response))
+        except Exception, e:
+            try:
+                conn.sendall(json.dumps(dict(failed=True, msg=str(e))))
+            except socket.error:
+                pass
+        finally:
+            conn.close()
+            with self.lock:
+                self.active -= 1
+                self.last_request = time.time()
+
+
+def read_message(conn):
+    """Reads a request or response terminated by the end of the stream"""
+    chunks = []
+    while True:
+        data = conn.recv(65536)
+        if not data:
+            break
+        chunks.append(data)
+    return ''.join(chunks)
+
+
+def control_path(params):
+    """Returns the control socket of the persistent connection for params
+
+    The name only depends on the user and server. The password is sent with
+    every request and checked by the master instead, so that it can not be
+    recovered from the names of the sockets.
+    """
+    directory = os.path.expanduser(params['control_path'])
+    if not os.path.isdir(directory):
+        os.makedirs(directory, 0700)
+
+    key = '%s@%s' % (params['user'], params['server'])
+    name = 'bigip-%s' % hashlib.sha1(key).hexdigest()[:16]
+    return os.path.join(directory, name)
+
+
+def run_direct(params, commands, concurrency, dests=None, lines=False):
+    """Runs commands over an SSH connection that is closed afterwards"""
+    runner = SshRunner(**params)
+    try:
+        return runner.run(commands, concurrency, dests, lines)
+    finally:
+        runner.close()
+
+
+class ControlClient(object):
+    """Runs commands through a persistent connection, starting it if needed"""
+
+    def __init__(self, params):
+        self.params = params
+        self.path = control_path(params)
+
+    def run(self, commands, concurrency, dests=None, lines=False):
+        request = dict(commands=commands, concurrency=concurrency,
+                       dests=dests, lines=lines,
+                       password=self.params['password'])
+
+        for attempt in range(2):
+            response = self._request(request)
+            if response is None or response.get('stale'):
+                self._start()
+                continue
+            elif response.get('mismatch'):
+                # The master was opened with another password, so this
+                # task logs in on its own
+                return run_direct(self.params, commands, concurrency,
+                                  dests, lines)
+            elif response.get('failed'):
+                raise BigIpCommandError(response['msg'])
+            return response['app_mode'], response['results']
+
+        raise BigIpCommandError(
+            'Unable to reach the persistent connection at %s' % self.path
+        )
+
+    def _request(self, request):
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        conn.settimeout(CONTROL_TIMEOUT)
+        try:
+            conn.connect(self.path)
+        except socket.error, e:
+            if e.errno not in (errno.ENOENT, errno.ECONNREFUSED):
+                raise
+            return None
+
+        try:
+            conn.sendall(json.dumps(request))
+            conn.shutdown(socket.SHUT_WR)
+            return json.loads(read_message(conn))
+        finally:
+            conn.close()
+
+    def _start(self):
+        """Starts a master unless another task has just started one
+
+        Tasks that start at the same time take turns holding a lock, so that
+        a task never removes the socket of a master that another task has
+        just started.
+        """
+        with open(self.path + '.lock', 'a') as lock:
+            os.chmod(self.path + '.lock', 0600)
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                if self._is_listening():
+                    return
+
+                # A socket that refuses connections was left behind by a
+                # master that did not exit cleanly
+                try:
+                    os.unlink(self.path)
+                except OSError:
+                    pass
+                ControlMaster(self.path, self.params).start()
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _is_listening(self):
+        # The master closes connections that send no request
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            conn.connect(self.path)
+            return True
+        except socket.error:
+            return False
+        finally:
+            conn.close()
+
+
+class BigIpSsh(BigIpCommon):
+    def __init__(self, *args, **kwargs):
+        super(BigIpSsh, self).__init__(*args, **kwargs)
+
+        self.result = {}
+
+    def _dests(self, commands):
+        """Returns the local files that the output of commands is written to
+
+        With a single command, dest is the file itself. With a list of
+        commands it is a directory holding one file per command, named after
+        the position of the command in the list.
+        """
+        dest = self.params['dest']
+        if not dest:
+            return None
+
+        dest = os.path.abspath(os.path.expanduser(dest))
+        if self.params['command']:
+            return [dest]
+
+        if not os.path.isdir(dest):
+            os.makedirs(dest)
+        return [os.path.join(dest, '%d.out' % x) for x in range(len(commands))]
+
+    def _run(self, commands):
+        concurrency = self.params['concurrency']
+        dests = self._dests(commands)
+        lines = self.params['lines']
+
+        if self.params['persist']:
+            client = ControlClient(self.params)
+            return client.run(commands, concurrency, dests, lines)
+
+        return run_direct(self.params, commands, concurrency, dests, lines)
+
+    def _parse(self, output):
+        parser = TmshParser()
+
+        if 'dest' in output:
+            with open(output['dest']) as fh:
+                parser.parse(fh)
+        elif 'stdout_lines' in output:
+            parser.parse(output['stdout_lines'])
+        else:
+            parser.parse(output['stdout'].splitlines())
+
+        return dict(parsed=parser.objects, parsed_index=parser.index)
 
     def flush(self):
         result = {}
 
         command = self.params['command']
+        commands = self.params['commands']
 
-        # Appliance mode drops the user directly into tmsh, so any leading tmsh
-        # syntax can be removed from the provided command
-        if self.appliance_mode():
-            result['app_mode'] = True
+        if command:
+            app_mode, outputs = self._run([command])
+            output = outputs[0]
 
-            if command[0:4] == 'tmsh':
-                cmd = command[4:].strip()
-                result['app_mode_cmd'] = cmd
-            else:
-                cmd = command
-        else:
-            # If the user has some BIG-IPs that are in Appliance Mode and some
-            # that are not, then it may be necessary to add the non-app mode
-            # syntax to the command before it is executed.
-            result['app_mode'] = False
+            result['app_mode'] = app_mode
+            if app_mode and command[0:4] == 'tmsh':
+                result['app_mode_cmd'] = tmsh_command(command, app_mode)
 
-            if command[0:4] != 'tmsh':
-                cmd = 'tmsh ' + command
-            else:
-                cmd = command
+            result.update(output)
+            result['command'] = command
+
+            if self.params['parse']:
+                result.update(self._parse(output))
+        else:
+            app_mode, outputs = self._run(commands)
 
-        stdin, stdout, stderr = self.api.exec_command(cmd)
+            result['app_mode'] = app_mode
+            result['results'] = []
+            for command, output in zip(commands, outputs):
+                output['command'] = command
+                if app_mode and command[0:4] == 'tmsh':
+                    output['app_mode_cmd'] = tmsh_command(command, app_mode)
+                if self.params['parse']:
+                    output.update(self._parse(output))
+                result['results'].append(output)
 
-        result['stdout'] = ''.join(stdout.readlines())
-        result['stderr'] = ''.join(stderr.readlines())
-        result['command'] = command
         result['changed'] = True
 
         return result
@@ -208,12 +1161,21 @@ def main():
     argument_spec = f5_argument_spec()
 
     meta_args = dict(
-        command=dict(required=True)
+        command=dict(),
+        commands=dict(type='list'),
+        concurrency=dict(default=4, type='int'),
+        persist=dict(default=0, type='int'),
+        dest=dict(),
+        lines=dict(default='no', type='bool'),
+        parse=dict(default='no', type='bool'),
+        control_path=dict(default='~/.ansible/bigip_command')
     )
     argument_spec.update(meta_args)
 
     module = AnsibleModule(
         argument_spec=argument_spec,
+        mutually_exclusive=[['command', 'commands']],
+        required_one_of=[['command', 'commands']],
         supports_check_mode=False
     )
 
@@ -228,6 +1190,8 @@ def main():
         result = obj.flush()
 
         module.exit_json(**result)
+    except BigIpCommandError, e:
+        module.fail_json(msg=str(e))
     except socket.timeout, e:
         module.fail_json(msg="Timed out connecting to the BIG-IP")
     except socket.gaierror:
@@ -135,6 +135,7 @@ EXAMPLES = """
   delegate_to: localhost
 """
 
+import atexit
 import json
 import socket
 
@@ -146,6 +147,90 @@ else:
     requests_found = True
 
 
+# Largest number of connections that a REST session keeps open to the BIG-IP
+REST_POOL_SIZE = 4
+
+# Upper bounds, in milliseconds, of the buckets of the REST latency histogram
+LATENCY_BUCKETS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# Seconds to wait for the device to release a login token
+LOGOUT_TIMEOUT = 10
+
+
+def icr_session(hostname, username, password, validate_certs=True):
+    """Returns a pooled iControl REST session
+
+    Connections are kept alive and reused by every request made with the
+    session, so that the TLS handshake happens once per connection rather
+    than once per request. The session logs in once and sends the token it
+    is given with each request, falling back to basic auth on BIG-IPs that
+    do not hand out tokens. The token is released when the module exits,
+    rather than being left to expire.
+
+    Responses may be compressed, and the time taken by each request is
+    counted in the session.latency histogram.
+    """
+    session = requests.session()
+    session.verify = validate_certs
+    session.headers.update({
+        'Content-Type': 'application/json',
+        'Accept-Encoding': 'gzip, deflate'
+    })
+
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1,
+                                            pool_maxsize=REST_POOL_SIZE)
+    session.mount('https://', adapter)
+
+    session.latency = dict((str(x), 0) for x in LATENCY_BUCKETS)
+    session.latency['inf'] = 0
+
+    def record_latency(resp, *args, **kwargs):
+        elapsed = resp.elapsed.total_seconds() * 1000
+        for bound in LATENCY_BUCKETS:
+            if elapsed <= bound:
+                session.latency[str(bound)] += 1
+                break
+        else:
+            session.latency['inf'] += 1
+
+    session.hooks['response'].append(record_latency)
+
+    payload = dict(
+        username=username,
+        password=password,
+        loginProviderName='tmos'
+    )
+    resp = session.post('https://%s/mgmt/shared/authn/login' % hostname,
+                        data=json.dumps(payload))
+    try:
+        token = resp.json()['token']['token']
+    except (ValueError, KeyError, TypeError):
+        session.auth = (username, password)
+    else:
+        session.headers['X-F5-Auth-Token'] = token
+        atexit.register(icr_logout, session, hostname, token)
+
+    return session
+
+
+def icr_logout(session, hostname, token):
+    """Releases the login token of a session"""
+    try:
+        session.delete('https://%s/mgmt/shared/authz/tokens/%s' % (hostname, token),
+                       timeout=LOGOUT_TIMEOUT)
+    except requests.exceptions.RequestException:
+        # The token expires on its own
+        pass
+
+
+def icr_stats(obj):
+    """Returns the REST latency histogram of obj for the module result"""
+    session = getattr(obj, 'api', None)
+    if requests_found and isinstance(session, requests.Session):
+        return dict(rest_latency=session.latency)
+    return dict()
+
+
 class BigIpCommon(object):
     def __init__(self, user, password, server, nameservers=[], forwarders=[],
                  search_domains=[], cache=None, ip_version=None, append=False,
@@ -204,13 +289,15 @@ class BigIpRest(BigIpCommon):
                                         forwarders, search_domains, cache,
                                         ip_version, append, validate_certs)
 
+        self.api = icr_session(self._hostname, self._username,
+                               self._password, self._validate_certs)
+
         self._headers = dict()
         self._headers['Content-Type'] = 'application/json'
 
     def dhcp_enabled(self):
         uri = 'https://%s/mgmt/tm/sys/db/dhclient.mgmt' % (self._hostname)
-        resp = requests.get(uri,
-                            auth=(self._username, self._password),
+        resp = self.api.get(uri,
                             verify=self._validate_certs)
 
         if resp.status_code == 200:
@@ -226,8 +313,7 @@ class BigIpRest(BigIpCommon):
         result = {}
 
         uri = 'https://%s/mgmt/tm/sys/dns' % (self._hostname)
-        resp = requests.get(uri,
-                            auth=(self._username, self._password),
+        resp = self.api.get(uri,
                             verify=self._validate_certs)
 
         if resp.status_code == 200:
@@ -251,8 +337,7 @@ class BigIpRest(BigIpCommon):
 
     def _read_cache(self):
         uri = 'https://%s/mgmt/tm/sys/db/dns.cache' % (self._hostname)
-        resp = requests.get(uri,
-                            auth=(self._username, self._password),
+        resp = self.api.get(uri,
                             verify=self._validate_certs)
 
         if resp.status_code == 200:
@@ -261,8 +346,7 @@ class BigIpRest(BigIpCommon):
 
     def _read_forwarders(self):
         uri = 'https://%s/mgmt/tm/sys/db/dns.proxy.__iter__' % (self._hostname)
-        resp = requests.get(uri,
-                            auth=(self._username, self._password),
+        resp = self.api.get(uri,
                             verify=self._validate_certs)
 
         if resp.status_code == 200:
@@ -325,8 +409,7 @@ class BigIpRest(BigIpCommon):
 
         if payload:
             uri = 'https://%s/mgmt/tm/sys/dns' % (self._hostname)
-            resp = requests.patch(uri,
-                                  auth=(self._username, self._password),
+            resp = self.api.patch(uri,
                                   data=json.dumps(payload),
                                   verify=self._validate_certs)
             if resp.status_code == 200:
@@ -359,8 +442,7 @@ class BigIpRest(BigIpCommon):
         if forwarders:
             payload['value'] = ' '.join(forwarders)
             uri = 'https://%s/mgmt/tm/sys/db/dns.proxy.__iter__' % (self._hostname)
-            resp = requests.put(uri,
-                                auth=(self._username, self._password),
+            resp = self.api.put(uri,
                                 data=json.dumps(payload),
                                 verify=self._validate_certs)
             if resp.status_code == 200:
@@ -380,8 +462,7 @@ class BigIpRest(BigIpCommon):
 
         if payload:
             uri = 'https://%s/mgmt/tm/sys/db/dns.cache' % (self._hostname)
-            resp = requests.patch(uri,
-                                  auth=(self._username, self._password),
+            resp = self.api.patch(uri,
                                   data=json.dumps(payload),
                                   verify=self._validate_certs)
             if resp.status_code == 200:
@@ -407,8 +488,7 @@ class BigIpRest(BigIpCommon):
 
         if payload:
             uri = 'https://%s/mgmt/tm/sys/db/dns.proxy.__iter__' % (self._hostname)
-            resp = requests.patch(uri,
-                                  auth=(self._username, self._password),
+            resp = self.api.patch(uri,
                                   data=json.dumps(payload),
                                   verify=self._validate_certs)
             if resp.status_code == 200:
@@ -440,8 +520,7 @@ class BigIpRest(BigIpCommon):
 
         if payload:
             uri = 'https://%s/mgmt/tm/sys/dns' % (self._hostname)
-            resp = requests.patch(uri,
-                                  auth=(self._username, self._password),
+            resp = self.api.patch(uri,
                                   data=json.dumps(payload),
                                   verify=self._validate_certs)
             if resp.status_code == 200:
@@ -495,8 +574,7 @@ class BigIpRest(BigIpCommon):
     def save(self):
         payload = dict(command='save')
         uri = 'https://%s/mgmt/tm/sys/config' % (self._hostname)
-        resp = requests.post(uri,
-                             auth=(self._username, self._password),
+        resp = self.api.post(uri,
                              data=json.dumps(payload),
                              verify=self._validate_certs)
         if resp.status_code == 200:
@@ -586,7 +664,7 @@ def main():
     except socket.timeout, e:
         module.fail_json(msg=str(e))
 
-    module.exit_json(changed=changed)
+    module.exit_json(changed=changed, **icr_stats(obj))
 
 from ansible.module_utils.basic import *
 
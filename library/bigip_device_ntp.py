@@ -97,6 +97,7 @@ EXAMPLES = """
   delegate_to: localhost
 """
 
+import atexit
 import json
 import socket
 
@@ -108,6 +109,90 @@ else:
     requests_found = True
 
 
+# Largest number of connections that a REST session keeps open to the BIG-IP
+REST_POOL_SIZE = 4
+
+# Upper bounds, in milliseconds, of the buckets of the REST latency histogram
+LATENCY_BUCKETS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# Seconds to wait for the device to release a login token
+LOGOUT_TIMEOUT = 10
+
+
+def icr_session(hostname, username, password, validate_certs=True):
+    """Returns a pooled iControl REST session
+
+    Connections are kept alive and reused by every request made with the
+    session, so that the TLS handshake happens once per connection rather
+    than once per request. The session logs in once and sends the token it
+    is given with each request, falling back to basic auth on BIG-IPs that
+    do not hand out tokens. The token is released when the module exits,
+    rather than being left to expire.
+
+    Responses may be compressed, and the time taken by each request is
+    counted in the session.latency histogram.
+    """
+    session = requests.session()
+    session.verify = validate_certs
+    session.headers.update({
+        'Content-Type': 'application/json',
+        'Accept-Encoding': 'gzip, deflate'
+    })
+
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1,
+                                            pool_maxsize=REST_POOL_SIZE)
+    session.mount('https://', adapter)
+
+    session.latency = dict((str(x), 0) for x in LATENCY_BUCKETS)
+    session.latency['inf'] = 0
+
+    def record_latency(resp, *args, **kwargs):
+        elapsed = resp.elapsed.total_seconds() * 1000
+        for bound in LATENCY_BUCKETS:
+            if elapsed <= bound:
+                session.latency[str(bound)] += 1
+                break
+        else:
+            session.latency['inf'] += 1
+
+    session.hooks['response'].append(record_latency)
+
+    payload = dict(
+        username=username,
+        password=password,
+        loginProviderName='tmos'
+    )
+    resp = session.post('https://%s/mgmt/shared/authn/login' % hostname,
+                        data=json.dumps(payload))
+    try:
+        token = resp.json()['token']['token']
+    except (ValueError, KeyError, TypeError):
+        session.auth = (username, password)
+    else:
+        session.headers['X-F5-Auth-Token'] = token
+        atexit.register(icr_logout, session, hostname, token)
+
+    return session
+
+
+def icr_logout(session, hostname, token):
+    """Releases the login token of a session"""
+    try:
+        session.delete('https://%s/mgmt/shared/authz/tokens/%s' % (hostname, token),
+                       timeout=LOGOUT_TIMEOUT)
+    except requests.exceptions.RequestException:
+        # The token expires on its own
+        pass
+
+
+def icr_stats(obj):
+    """Returns the REST latency histogram of obj for the module result"""
+    session = getattr(obj, 'api', None)
+    if requests_found and isinstance(session, requests.Session):
+        return dict(rest_latency=session.latency)
+    return dict()
+
+
 class BigIpCommon(object):
     def __init__(self, user, password, server, ntp_servers=[], timezone=None,
                  append=False, validate_certs=True):
@@ -152,14 +237,16 @@ class BigIpRest(BigIpCommon):
         super(BigIpRest, self).__init__(user, password, server, ntp_servers,
                                         timezone, append, validate_certs)
 
+        self.api = icr_session(self._hostname, self._username,
+                               self._password, self._validate_certs)
+
         self._uri = 'https://%s/mgmt/tm/sys/ntp' % (self._hostname)
         self._headers = {
             'Content-Type': 'application/json'
         }
 
     def read(self):
-        resp = requests.get(self._uri,
-                            auth=(self._username, self._password),
+        resp = self.api.get(self._uri,
                             verify=self._validate_certs)
 
         if resp.status_code != 200:
@@ -203,8 +290,7 @@ class BigIpRest(BigIpCommon):
         if not changed:
             return changed
 
-        resp = requests.patch(self._uri,
-                              auth=(self._username, self._password),
+        resp = self.api.patch(self._uri,
                               data=json.dumps(payload),
                               verify=self._validate_certs)
         if resp.status_code == 200:
@@ -229,8 +315,7 @@ class BigIpRest(BigIpCommon):
         if not changed:
             return changed
 
-        resp = requests.patch(self._uri,
-                              auth=(self._username, self._password),
+        resp = self.api.patch(self._uri,
                               data=json.dumps(payload),
                               verify=self._validate_certs)
         if resp.status_code == 200:
@@ -242,8 +327,7 @@ class BigIpRest(BigIpCommon):
     def save(self):
         payload = dict(command='save')
         uri = 'https://%s/mgmt/tm/sys/config' % (self._hostname)
-        resp = requests.post(uri,
-                             auth=(self._username, self._password),
+        resp = self.api.post(uri,
                              data=json.dumps(payload),
                              verify=self._validate_certs)
         if resp.status_code == 200:
@@ -313,7 +397,7 @@ def main():
     except Exception, e:
         module.fail_json(msg=str(e))
 
-    module.exit_json(changed=changed)
+    module.exit_json(changed=changed, **icr_stats(obj))
 
 from ansible.module_utils.basic import *
 
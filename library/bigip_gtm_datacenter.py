@@ -105,8 +105,13 @@ EXAMPLES = """
   delegate_to: localhost
 """
 
+import atexit
 import json
 import socket
+import os
+import shutil
+import tempfile
+import time
 
 try:
     import bigsuds
@@ -115,6 +120,97 @@ except ImportError:
 else:
     bigsuds_found = True
 
+
+# WSDLs downloaded by iControl clients are cached here, per BIG-IP version
+WSDL_CACHE_DIR = '~/.ansible/bigip_wsdl'
+
+# Seconds that the recorded version of a BIG-IP is trusted
+WSDL_CACHE_TTL = 86400
+
+
+def wsdl_cache_dir(hostname):
+    """Returns the WSDL cache of hostname, or None when it is not known
+
+    The cache is not known until the version of the BIG-IP has been
+    recorded, and again once the recorded version is older than
+    WSDL_CACHE_TTL, since the BIG-IP may have been upgraded.
+    """
+    base = os.path.expanduser(WSDL_CACHE_DIR)
+    try:
+        with open(os.path.join(base, 'versions.json')) as fh:
+            entry = json.load(fh)[hostname]
+    except (IOError, ValueError, KeyError):
+        return None
+
+    if time.time() - entry['checked'] > WSDL_CACHE_TTL:
+        return None
+    return os.path.join(base, '%s-%s' % (hostname, entry['version']))
+
+
+def remember_version(hostname, version):
+    base = os.path.expanduser(WSDL_CACHE_DIR)
+    path = os.path.join(base, 'versions.json')
+
+    try:
+        with open(path) as fh:
+            versions = json.load(fh)
+    except (IOError, ValueError):
+        versions = {}
+
+    versions[hostname] = dict(version=version, checked=time.time())
+
+    if not os.path.isdir(base):
+        os.makedirs(base, 0700)
+
+    fd, tmp = tempfile.mkstemp(dir=base)
+    with os.fdopen(fd, 'w') as fh:
+        json.dump(versions, fh)
+    os.rename(tmp, path)
+
+
+def icontrol_client(hostname, username, password):
+    """Returns a bigsuds client that keeps the WSDLs it parses on disk
+
+    Each iControl interface otherwise downloads and parses its WSDL every
+    time a module runs. The cache is kept per BIG-IP and version, so the
+    version is looked up first when it is not yet known. The WSDL parsed
+    to look it up is cached in a directory of its own, which is moved into
+    place once the version is known.
+    """
+    cachedir = wsdl_cache_dir(hostname)
+    if cachedir is None:
+        base = os.path.expanduser(WSDL_CACHE_DIR)
+        if not os.path.isdir(base):
+            os.makedirs(base, 0700)
+
+        tmpdir = tempfile.mkdtemp(dir=base)
+        try:
+            api = bigsuds.BIGIP(
+                hostname=hostname,
+                username=username,
+                password=password,
+                debug=True,
+                cachedir=tmpdir
+            )
+            remember_version(hostname, api.System.SystemInfo.get_version())
+            cachedir = wsdl_cache_dir(hostname)
+            try:
+                os.rename(tmpdir, cachedir)
+            except OSError:
+                # The cache of this version already exists
+                pass
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+    return bigsuds.BIGIP(
+        hostname=hostname,
+        username=username,
+        password=password,
+        debug=True,
+        cachedir=cachedir
+    )
+
+
 try:
     import requests
 except ImportError:
@@ -123,15 +219,98 @@ else:
     requests_found = True
 
 
-def test_icontrol(username, password, hostname):
-    api = bigsuds.BIGIP(
-        hostname=hostname,
+# Largest number of connections that a REST session keeps open to the BIG-IP
+REST_POOL_SIZE = 4
+
+# Upper bounds, in milliseconds, of the buckets of the REST latency histogram
+LATENCY_BUCKETS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# Seconds to wait for the device to release a login token
+LOGOUT_TIMEOUT = 10
+
+
+def icr_session(hostname, username, password, validate_certs=True):
+    """Returns a pooled iControl REST session
+
+    Connections are kept alive and reused by every request made with the
+    session, so that the TLS handshake happens once per connection rather
+    than once per request. The session logs in once and sends the token it
+    is given with each request, falling back to basic auth on BIG-IPs that
+    do not hand out tokens. The token is released when the module exits,
+    rather than being left to expire.
+
+    Responses may be compressed, and the time taken by each request is
+    counted in the session.latency histogram.
+    """
+    session = requests.session()
+    session.verify = validate_certs
+    session.headers.update({
+        'Content-Type': 'application/json',
+        'Accept-Encoding': 'gzip, deflate'
+    })
+
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1,
+                                            pool_maxsize=REST_POOL_SIZE)
+    session.mount('https://', adapter)
+
+    session.latency = dict((str(x), 0) for x in LATENCY_BUCKETS)
+    session.latency['inf'] = 0
+
+    def record_latency(resp, *args, **kwargs):
+        elapsed = resp.elapsed.total_seconds() * 1000
+        for bound in LATENCY_BUCKETS:
+            if elapsed <= bound:
+                session.latency[str(bound)] += 1
+                break
+        else:
+            session.latency['inf'] += 1
+
+    session.hooks['response'].append(record_latency)
+
+    payload = dict(
         username=username,
         password=password,
-        debug=True
+        loginProviderName='tmos'
     )
+    resp = session.post('https://%s/mgmt/shared/authn/login' % hostname,
+                        data=json.dumps(payload))
+    try:
+        token = resp.json()['token']['token']
+    except (ValueError, KeyError, TypeError):
+        session.auth = (username, password)
+    else:
+        session.headers['X-F5-Auth-Token'] = token
+        atexit.register(icr_logout, session, hostname, token)
+
+    return session
 
+
+def icr_logout(session, hostname, token):
+    """Releases the login token of a session"""
     try:
+        session.delete('https://%s/mgmt/shared/authz/tokens/%s' % (hostname, token),
+                       timeout=LOGOUT_TIMEOUT)
+    except requests.exceptions.RequestException:
+        # The token expires on its own
+        pass
+
+
+def icr_stats(obj):
+    """Returns the REST latency histogram of obj for the module result"""
+    session = getattr(obj, 'api', None)
+    if requests_found and isinstance(session, requests.Session):
+        return dict(rest_latency=session.latency)
+    return dict()
+
+
+def test_icontrol(username, password, hostname):
+    # A warm WSDL cache means that the BIG-IP was reached recently, so it
+    # is not probed again
+    if wsdl_cache_dir(hostname):
+        return True
+
+    try:
+        api = icontrol_client(hostname, username, password)
         response = api.Management.LicenseAdministration.get_license_activation_status()
         if 'STATE' in response:
             return True
@@ -141,6 +320,45 @@ def test_icontrol(username, password, hostname):
         return False
 
 
+def icontrol_auth_failed(error):
+    """Checks whether an iControl connection error was caused by a bad login
+
+    The credentials are not probed up front when the WSDL cache is warm,
+    so a bad login only shows up on the first real call.
+    """
+    text = str(error)
+    return 'credentials' in text or '401' in text
+
+
+class SoapBatch(object):
+    """Collects the iControl calls that change one object
+
+    The calls are submitted together in a single iControl transaction, so
+    that they are applied all at once or, if any of them fails, not at all.
+    Reads are not collected and should be made before the calls are
+    submitted.
+    """
+
+    def __init__(self, api):
+        self.api = api
+        self.calls = []
+
+    def add(self, method, *args, **kwargs):
+        self.calls.append((method, args, kwargs))
+
+    def submit(self):
+        """Submits the collected calls and returns whether there were any"""
+        if not self.calls:
+            return False
+
+        with bigsuds.Transaction(self.api):
+            for method, args, kwargs in self.calls:
+                method(*args, **kwargs)
+
+        self.calls = []
+        return True
+
+
 class BigIpCommon(object):
     def __init__(self, module):
         self._username = module.params.get('user')
@@ -158,12 +376,7 @@ class BigIpIControl(BigIpCommon):
     def __init__(self, module):
         super(BigIpIControl, self).__init__(module)
 
-        self.api = bigsuds.BIGIP(
-            hostname=self._hostname,
-            username=self._username,
-            password=self._password,
-            debug=True
-        )
+        self.api = icontrol_client(self._hostname, self._username, self._password)
 
     def create(self):
         params = {
@@ -172,9 +385,14 @@ class BigIpIControl(BigIpCommon):
             'contact': self._contact
         }
 
-        self.api.GlobalLB.DataCenter.create(params)
-        self.set_description()
-        return True
+        # The description is set in the same transaction that creates the
+        # data center, so it never exists without one
+        batch = SoapBatch(self.api)
+        batch.add(self.api.GlobalLB.DataCenter.create, [params])
+        if self._description is not None:
+            batch.add(self.api.GlobalLB.DataCenter.set_description,
+                      [self._name], [self._description])
+        return batch.submit()
 
     def delete(self):
         self.api.GlobalLB.DataCenter.delete_data_center([self._name])
@@ -208,29 +426,32 @@ class BigIpIControl(BigIpCommon):
             self.api.GlobalLB.DataCenter.set_enabled_state([self._name], ['STATE_DISABLED'])
             return True
 
-    def set_contact(self):
+    def set_contact(self, batch):
         current = self.get_contact()
 
         if current != self._contact:
-            self.api.GlobalLB.DataCenter.set_contact_information([self._name], [self._contact])
+            batch.add(self.api.GlobalLB.DataCenter.set_contact_information,
+                      [self._name], [self._contact])
             return True
         else:
             return False
 
-    def set_location(self):
+    def set_location(self, batch):
         current = self.get_location()
 
         if current != self._location:
-            self.api.GlobalLB.DataCenter.set_location_information([self._name], [self._location])
+            batch.add(self.api.GlobalLB.DataCenter.set_location_information,
+                      [self._name], [self._location])
             return True
         else:
             return False
 
-    def set_description(self):
+    def set_description(self, batch):
         current = self.get_description()
 
         if current != self._description:
-            self.api.GlobalLB.DataCenter.set_description([self._name], [self._description])
+            batch.add(self.api.GlobalLB.DataCenter.set_description,
+                      [self._name], [self._description])
             return True
         else:
             return False
@@ -257,21 +478,23 @@ class BigIpIControl(BigIpCommon):
         return changed
 
     def present(self):
-        changed = False
+        if not self.exists():
+            return self.create()
 
-        if self.exists():
-            if self._contact is not None:
-                changed = self.set_contact()
+        # All of the current values are read before any is changed, and the
+        # changes are then submitted together
+        batch = SoapBatch(self.api)
 
-            if self._location is not None:
-                changed = self.set_location()
+        if self._contact is not None:
+            self.set_contact(batch)
 
-            if self._description is not None:
-                changed = self.set_description()
-        else:
-            changed = self.create()
+        if self._location is not None:
+            self.set_location(batch)
 
-        return changed
+        if self._description is not None:
+            self.set_description(batch)
+
+        return batch.submit()
 
     def enable(self):
         changed = False
@@ -298,6 +521,9 @@ class BigIpRest(BigIpCommon):
     def __init__(self, module):
         super(BigIpRest, self).__init__(module)
 
+        self.api = icr_session(self._hostname, self._username,
+                               self._password, self._validate_certs)
+
         self._uri = 'https://%s/mgmt/tm/gtm/datacenter' % (self._hostname)
         self._headers = {
             'Content-Type': 'application/json'
@@ -312,8 +538,7 @@ class BigIpRest(BigIpCommon):
             description=self._description
         )
 
-        resp = requests.post(self._uri,
-                             auth=(self._username, self._password),
+        resp = self.api.post(self._uri,
                              data=json.dumps(params),
                              verify=self._validate_certs,
                              headers=self._headers)
@@ -325,8 +550,7 @@ class BigIpRest(BigIpCommon):
 
     def read(self):
         uri = '%s/%s' % (self._uri, self._full_name)
-        resp = requests.get(uri,
-                            auth=(self._username, self._password),
+        resp = self.api.get(uri,
                             verify=self._validate_certs)
         if resp.status_code == 200:
             return resp.json()
@@ -336,8 +560,7 @@ class BigIpRest(BigIpCommon):
 
     def update(self):
         uri = '%s/%s' % (self._uri, self._full_name)
-        resp = requests.put(uri,
-                            auth=(self._username, self._password),
+        resp = self.api.put(uri,
                             data=json.dumps(self._payload),
                             verify=self._validate_certs,
                             headers=self._headers)
@@ -349,8 +572,7 @@ class BigIpRest(BigIpCommon):
 
     def delete(self):
         uri = '%s/%s' % (self._uri, self._full_name)
-        resp = requests.delete(uri,
-                               auth=(self._username, self._password),
+        resp = self.api.delete(uri,
                                verify=self._validate_certs)
         if resp.status_code == 200:
             return True
@@ -487,8 +709,7 @@ class BigIpRest(BigIpCommon):
 
     def exists(self):
         uri = '%s/%s' % (self._uri, self._full_name)
-        resp = requests.get(uri,
-                            auth=(self._username, self._password),
+        resp = self.api.get(uri,
                             verify=self._validate_certs)
         if resp.status_code == 200:
             return True
@@ -545,7 +766,7 @@ def main():
                 changed = obj.set_disabled()
 
         if state is None:
-            module.exit_json(changed=changed)
+            module.exit_json(changed=changed, **icr_stats(obj))
 
         if state == "present":
             if obj.present():
@@ -553,12 +774,15 @@ def main():
         elif state == "absent":
             if obj.absent():
                 changed = True
-    except bigsuds.ConnectionError:
-        module.fail_json(msg="Could not connect to BIG-IP host %s" % hostname)
+    except bigsuds.ConnectionError, e:
+        if icontrol_auth_failed(e):
+            module.fail_json(msg="Could not log in with provided credentials")
+        else:
+            module.fail_json(msg="Could not connect to BIG-IP host %s" % hostname)
     except socket.timeout:
         module.fail_json(msg="Timed out connecting to the BIG-IP")
 
-    module.exit_json(changed=changed)
+    module.exit_json(changed=changed, **icr_stats(obj))
 
 from ansible.module_utils.basic import *
 
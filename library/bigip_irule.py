@@ -61,8 +61,8 @@ options:
     default: Common
   name:
     description:
-      - The name of the iRule
-    required: true
+      - The name of the iRule. Required unless C(src_dir) is given
+    required: false
   user:
     description:
       - BIG-IP username
@@ -72,6 +72,16 @@ options:
       - The iRule file to interpret and upload to the BIG-IP. Either one
         of C(src) or C(content) must be provided.
     required: true
+  src_dir:
+    description:
+      - Directory of iRule files, named after their iRules with a C(.tcl)
+        extension, to synchronize with the BIG-IP. All of the iRules of the
+        partition are read at once, compared with the files by their content
+        hash, and only those that differ are created or modified, together.
+        With C(state=absent), the iRules named by the files are removed.
+        Only the ltm and gtm modules are supported
+    required: false
+    version_added: "2.1"
   state:
     description:
       - Whether the iRule should exist or not
@@ -92,6 +102,10 @@ notes:
      interface. This is as easy as pip install bigsuds
    - Requires the requests Python package on the host. This is as easy as
      pip install requests
+   - With the C(rest) connection, the content hash and generation of each
+     iRule are recorded in ~/.ansible/bigip_irule/manifest.json. When the
+     generation on the BIG-IP has not changed and the hash matches, the
+     iRule definition is not fetched from the BIG-IP
 
 requirements: [ "bigsuds", "requests" ]
 author:
@@ -120,6 +134,17 @@ EXAMPLES = """
       state: "present"
       user: "admin"
   delegate_to: localhost
+
+- name: Synchronize the LTM iRules with the files in the irules directory
+  bigip_irule:
+      module: "ltm"
+      partition: "Common"
+      password: "secret"
+      server: "lb.mydomain.com"
+      src_dir: "irules/"
+      state: "present"
+      user: "admin"
+  delegate_to: localhost
 """
 
 RETURN = '''
@@ -128,10 +153,30 @@ full_name:
     returned: changed and success
     type: string
     sample: "John Doe"
+created:
+    description: The iRules created from C(src_dir)
+    returned: changed and src_dir is given
+    type: list
+    sample: ["/Common/redirect"]
+modified:
+    description: The iRules modified from C(src_dir)
+    returned: changed and src_dir is given
+    type: list
+    sample: ["/Common/maintenance"]
+removed:
+    description: The iRules removed for C(src_dir)
+    returned: changed, src_dir is given and state is absent
+    type: list
+    sample: ["/Common/maintenance"]
 '''
 
+import atexit
+import glob
+import hashlib
+import os
 import sys
 import json
+import tempfile
 
 try:
     import bigsuds
@@ -145,8 +190,96 @@ try:
 except ImportError:
     REQUESTS_AVAILABLE = False
 
+
+# Largest number of connections that a REST session keeps open to the BIG-IP
+REST_POOL_SIZE = 4
+
+# Upper bounds, in milliseconds, of the buckets of the REST latency histogram
+LATENCY_BUCKETS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# Seconds to wait for the device to release a login token
+LOGOUT_TIMEOUT = 10
+
+
+def icr_session(hostname, username, password, validate_certs=True):
+    """Returns a pooled iControl REST session
+
+    Connections are kept alive and reused by every request made with the
+    session, so that the TLS handshake happens once per connection rather
+    than once per request. The session logs in once and sends the token it
+    is given with each request, falling back to basic auth on BIG-IPs that
+    do not hand out tokens. The token is released when the module exits,
+    rather than being left to expire.
+
+    Responses may be compressed, and the time taken by each request is
+    counted in the session.latency histogram.
+    """
+    session = requests.session()
+    session.verify = validate_certs
+    session.headers.update({
+        'Content-Type': 'application/json',
+        'Accept-Encoding': 'gzip, deflate'
+    })
+
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1,
+                                            pool_maxsize=REST_POOL_SIZE)
+    session.mount('https://', adapter)
+
+    session.latency = dict((str(x), 0) for x in LATENCY_BUCKETS)
+    session.latency['inf'] = 0
+
+    def record_latency(resp, *args, **kwargs):
+        elapsed = resp.elapsed.total_seconds() * 1000
+        for bound in LATENCY_BUCKETS:
+            if elapsed <= bound:
+                session.latency[str(bound)] += 1
+                break
+        else:
+            session.latency['inf'] += 1
+
+    session.hooks['response'].append(record_latency)
+
+    payload = dict(
+        username=username,
+        password=password,
+        loginProviderName='tmos'
+    )
+    resp = session.post('https://%s/mgmt/shared/authn/login' % hostname,
+                        data=json.dumps(payload))
+    try:
+        token = resp.json()['token']['token']
+    except (ValueError, KeyError, TypeError):
+        session.auth = (username, password)
+    else:
+        session.headers['X-F5-Auth-Token'] = token
+        atexit.register(icr_logout, session, hostname, token)
+
+    return session
+
+
+def icr_logout(session, hostname, token):
+    """Releases the login token of a session"""
+    try:
+        session.delete('https://%s/mgmt/shared/authz/tokens/%s' % (hostname, token),
+                       timeout=LOGOUT_TIMEOUT)
+    except requests.exceptions.RequestException:
+        # The token expires on its own
+        pass
+
+
+def icr_stats(obj):
+    """Returns the REST latency histogram of obj for the module result"""
+    session = getattr(obj, 'api', None)
+    if REQUESTS_AVAILABLE and isinstance(session, requests.Session):
+        return dict(rest_latency=session.latency)
+    return dict()
+
+
 TRANSPORTS = ['rest', 'soap']
 
+# Local record of the iRules last sent to, or read from, each BIG-IP
+MANIFEST_FILE = '~/.ansible/bigip_irule/manifest.json'
+
 STATES = ['absent', 'present']
 MODULES = ['gtm', 'ltm', 'pem']
 
@@ -163,6 +296,79 @@ class ContentOrSrcRequiredError(Exception):
     pass
 
 
+class SyncNotSupportedError(Exception):
+    pass
+
+
+def content_hash(content):
+    return hashlib.sha1(content.strip()).hexdigest()
+
+
+def read_rule_files(directory):
+    """Returns the contents of the .tcl files in directory by iRule name"""
+    rules = {}
+    for path in sorted(glob.glob(os.path.join(directory, '*.tcl'))):
+        name = os.path.splitext(os.path.basename(path))[0]
+        with open(path) as fh:
+            rules[name] = fh.read().strip()
+    return rules
+
+
+class RuleManifest(object):
+    """Content hashes of iRules as last seen on each BIG-IP
+
+    Each entry holds the hash of the definition of an iRule together with
+    the generation that the BIG-IP reported for the iRule at that time. As
+    long as the generation on the BIG-IP is unchanged, so is the iRule, and
+    its definition does not need to be fetched to be compared.
+    """
+
+    def __init__(self, path=MANIFEST_FILE):
+        self.path = os.path.expanduser(path)
+        self.entries = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path) as fh:
+                return json.load(fh)
+        except (IOError, ValueError):
+            return {}
+
+    def _save(self, key, entry):
+        # Other tasks may have recorded iRules since the manifest was read,
+        # so their entries are merged in before it is written back
+        entries = self._load()
+        if entry is None:
+            entries.pop(key, None)
+        else:
+            entries[key] = entry
+        self.entries = entries
+
+        directory = os.path.dirname(self.path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory, 0700)
+
+        fd, tmp = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, 'w') as fh:
+            json.dump(entries, fh)
+        os.rename(tmp, self.path)
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def record(self, key, content, generation):
+        if generation is None:
+            self.forget(key)
+        else:
+            entry = dict(hash=content_hash(content), generation=generation)
+            if self.entries.get(key) != entry:
+                self._save(key, entry)
+
+    def forget(self, key):
+        if key in self.entries:
+            self._save(key, None)
+
+
 class BigIpApiFactory(object):
     def factory(module):
         type = module.params.get('connection')
@@ -185,7 +391,10 @@ class BigIpCommon(object):
 
         self.params = kwargs
 
-        if self.params['state'] != 'absent':
+        if self.params['src_dir']:
+            if self.params['module'] == 'pem':
+                raise SyncNotSupportedError()
+        elif self.params['state'] != 'absent':
             if not self.params['content'] and not self.params['src']:
                 raise ContentOrSrcRequiredError()
 
@@ -195,10 +404,49 @@ class BigIpCommon(object):
             self.params['content'] = fh.read()
             fh.close()
 
+    def sync(self):
+        """Synchronizes the iRules of the partition with src_dir
+
+        The iRules of the partition are read in a single request and are
+        compared with the files by content hash, so that only the iRules
+        that differ are sent back to the BIG-IP.
+        """
+        result = dict(created=[], modified=[])
+        partition = self.params['partition']
+
+        local = read_rule_files(self.params['src_dir'])
+        remote = self.read_all()
+
+        create = {}
+        modify = {}
+        for name, content in local.iteritems():
+            if name not in remote:
+                create[name] = content
+            elif content_hash(remote[name]) != content_hash(content):
+                modify[name] = content
+
+        if self.params['state'] == 'absent':
+            remove = sorted(x for x in local if x in remote)
+            if remove and not self.params['check_mode']:
+                self.delete_all(remove)
+            return dict(removed=['/%s/%s' % (partition, x) for x in remove],
+                        changed=bool(remove))
+
+        if (create or modify) and not self.params['check_mode']:
+            self.write_all(create, modify)
+
+        result['created'] = ['/%s/%s' % (partition, x) for x in sorted(create)]
+        result['modified'] = ['/%s/%s' % (partition, x) for x in sorted(modify)]
+        result['changed'] = bool(create or modify)
+        return result
+
     def flush(self):
         result = dict()
         state = self.params['state']
 
+        if self.params['src_dir']:
+            return self.sync()
+
         if state == "present":
             changed = self.present()
 
@@ -212,6 +460,64 @@ class BigIpCommon(object):
         return result
 
 
+class SessionContext(object):
+    """Tracks the active folder and recursive query state of iControl
+
+    The state is tracked on the client so that it is only sent to the BIG-IP
+    when it needs to change, instead of being read, set and restored around
+    every operation.
+
+    When the BIG-IP supports session identifiers, the state belongs to a
+    session of its own and nothing needs to be restored. Otherwise the state
+    is shared by every connection of the user, so the original state is
+    read before it is first changed and is put back by restore()
+    """
+
+    def __init__(self, api):
+        try:
+            self.api = api.with_session_id()
+            self.private = True
+        except (AttributeError, bigsuds.OperationFailed):
+            self.api = api
+            self.private = False
+
+        self._folder = None
+        self._query_state = None
+        self._original = None
+
+    def enter(self, folder):
+        """Makes folder active, with recursive queries enabled"""
+        session = self.api.System.Session
+
+        if not self.private and self._original is None:
+            self._folder = session.get_active_folder()
+            self._query_state = session.get_recursive_query_state()
+            self._original = (self._folder, self._query_state)
+
+        if self._folder != folder:
+            session.set_active_folder(folder=folder)
+            self._folder = folder
+
+        if self._query_state != 'STATE_ENABLED':
+            session.set_recursive_query_state('STATE_ENABLED')
+            self._query_state = 'STATE_ENABLED'
+
+    def restore(self):
+        if self._original is None:
+            return
+
+        folder, query_state = self._original
+        session = self.api.System.Session
+
+        if self._query_state != query_state:
+            session.set_recursive_query_state(query_state)
+        if self._folder != folder:
+            session.set_active_folder(folder=folder)
+
+        self._folder, self._query_state = self._original
+        self._original = None
+
+
 class BigIpSoapApi(BigIpCommon):
     """Manipulate user accounts via SOAP
     """
@@ -219,46 +525,92 @@ class BigIpSoapApi(BigIpCommon):
     def __init__(self, *args, **kwargs):
         super(BigIpSoapApi, self).__init__(*args, **kwargs)
 
-        self.api = bigip_api(kwargs['server'],
-                             kwargs['user'],
-                             kwargs['password'],
-                             kwargs['validate_certs'])
+        api = bigip_api(kwargs['server'],
+                        kwargs['user'],
+                        kwargs['password'],
+                        kwargs['validate_certs'])
+        self.session = SessionContext(api)
+        self.api = self.session.api
         self.irule = "/%s/%s" % (kwargs['partition'], kwargs['name'])
 
+    def flush(self):
+        try:
+            return super(BigIpSoapApi, self).flush()
+        finally:
+            self.session.restore()
+
     def exists(self):
-        result = False
         module = self.params['module']
         partition = self.params['partition']
 
-        with bigsuds.Transaction(self.api):
-            # need to switch to root, set recursive query state
-            current_folder = self.api.System.Session.get_active_folder()
-            if current_folder != '/' + partition:
-                self.api.System.Session.set_active_folder(folder='/' + partition)
-
-            current_query_state = self.api.System.Session.get_recursive_query_state()
-            if current_query_state == 'STATE_DISABLED':
-                self.api.System.Session.set_recursive_query_state('STATE_ENABLED')
-
-            if module == 'ltm':
-                rules = self.api.LocalLB.Rule.get_list()
-            elif module == 'gtm':
-                rules = self.api.GlobalLB.Rule.get_list()
-            else:
-                rules = self.api.PEM.Policy.get_list()
+        self.session.enter('/' + partition)
 
-            # set everything back
-            if current_query_state == 'STATE_DISABLED':
-                self.api.System.Session.set_recursive_query_state('STATE_DISABLED')
-
-            if current_folder != '/' + partition:
-                self.api.System.Session.set_active_folder(folder=current_folder)
+        if module == 'ltm':
+            rules = self.api.LocalLB.Rule.get_list()
+        elif module == 'gtm':
+            rules = self.api.GlobalLB.Rule.get_list()
+        else:
+            rules = self.api.PEM.Policy.get_list()
 
         if self.irule in rules:
             return True
         else:
             return False
 
+    def _rule_api(self):
+        if self.params['module'] == 'ltm':
+            return self.api.LocalLB.Rule
+        else:
+            return self.api.GlobalLB.Rule
+
+    def read_all(self):
+        """Returns the definitions of the iRules of the partition by name
+
+        The definitions are fetched with one query_rule call for all of the
+        iRules listed in the partition, rather than one call per iRule.
+        """
+        prefix = '/%s/' % self.params['partition']
+        rule_api = self._rule_api()
+
+        self.session.enter(prefix.rstrip('/'))
+
+        # The recursive query also lists the iRules of sub-folders, which are
+        # not named by the files of src_dir
+        names = [x for x in rule_api.get_list()
+                 if x.startswith(prefix) and '/' not in x[len(prefix):]]
+        if not names:
+            return {}
+
+        result = {}
+        for rule in rule_api.query_rule(rule_names=names):
+            name = rule['rule_name'][len(prefix):]
+            result[name] = rule.get('rule_definition', '').strip()
+        return result
+
+    def write_all(self, create, modify):
+        prefix = '/%s/' % self.params['partition']
+        rule_api = self._rule_api()
+
+        self.session.enter(prefix.rstrip('/'))
+
+        with bigsuds.Transaction(self.api):
+            if modify:
+                rules = [dict(rule_name=prefix + k, rule_definition=v)
+                         for k, v in modify.iteritems()]
+                rule_api.modify_rule(rules=rules)
+            if create:
+                rules = [dict(rule_name=prefix + k, rule_definition=v)
+                         for k, v in create.iteritems()]
+                rule_api.create(rules=rules)
+
+    def delete_all(self, names):
+        prefix = '/%s/' % self.params['partition']
+
+        self.session.enter(prefix.rstrip('/'))
+
+        with bigsuds.Transaction(self.api):
+            self._rule_api().delete_rule(rule_names=[prefix + x for x in names])
+
     def read(self):
         result = {}
 
@@ -290,16 +642,9 @@ class BigIpSoapApi(BigIpCommon):
         if self.params['check_mode']:
             return True
 
-        with bigsuds.Transaction(self.api):
-            # need to switch to root, set recursive query state
-            current_folder = self.api.System.Session.get_active_folder()
-            if current_folder != '/' + partition:
-                self.api.System.Session.set_active_folder(folder='/' + partition)
-
-            current_query_state = self.api.System.Session.get_recursive_query_state()
-            if current_query_state == 'STATE_DISABLED':
-                self.api.System.Session.set_recursive_query_state('STATE_ENABLED')
+        self.session.enter('/' + partition)
 
+        with bigsuds.Transaction(self.api):
             if module == 'ltm':
                 self.api.LocalLB.Rule.delete_rule(rule_names=[self.irule])
             elif module == 'gtm':
@@ -307,13 +652,6 @@ class BigIpSoapApi(BigIpCommon):
             else:
                 self.api.PEM.Policy.delete_policy(policies=[self.irule])
 
-            # set everything back
-            if current_query_state == 'STATE_DISABLED':
-                self.api.System.Session.set_recursive_query_state('STATE_DISABLED')
-
-            if current_folder != '/' + partition:
-                self.api.System.Session.set_active_folder(folder=current_folder)
-
         if self.exists():
             raise DeleteRuleError()
         else:
@@ -339,16 +677,9 @@ class BigIpSoapApi(BigIpCommon):
         if self.params['check_mode']:
             changed = True
         else:
-            with bigsuds.Transaction(self.api):
-                # need to switch to root, set recursive query state
-                current_folder = self.api.System.Session.get_active_folder()
-                if current_folder != '/' + partition:
-                    self.api.System.Session.set_active_folder(folder='/' + partition)
-
-                current_query_state = self.api.System.Session.get_recursive_query_state()
-                if current_query_state == 'STATE_DISABLED':
-                    self.api.System.Session.set_recursive_query_state('STATE_ENABLED')
+            self.session.enter('/' + partition)
 
+            with bigsuds.Transaction(self.api):
                 if module == 'ltm':
                     self.api.LocalLB.Rule.modify_rule(rules=[rules])
                 elif module == 'gtm':
@@ -357,13 +688,6 @@ class BigIpSoapApi(BigIpCommon):
                     # The PEM SOAP API provides no way to modify a policy.
                     # So to "modify" it we need to delete it and re-create it.
                     self.api.PEM.Policy.delete_policy(policies=[rules])
-
-                # set everything back
-                if current_query_state == 'STATE_DISABLED':
-                    self.api.System.Session.set_recursive_query_state('STATE_DISABLED')
-
-                if current_folder != '/' + partition:
-                    self.api.System.Session.set_active_folder(folder=current_folder)
             changed = True
 
         return changed
@@ -379,11 +703,9 @@ class BigIpSoapApi(BigIpCommon):
             rule_definition=content
         )
 
-        with bigsuds.Transaction(self.api):
-            current_folder = self.api.System.Session.get_active_folder()
-            if current_folder != '/' + partition:
-                self.api.System.Session.set_active_folder(folder='/' + partition)
+        self.session.enter('/' + partition)
 
+        with bigsuds.Transaction(self.api):
             if module == 'ltm':
                 self.api.LocalLB.Rule.create(rules=[rules])
             elif module == 'gtm':
@@ -391,9 +713,6 @@ class BigIpSoapApi(BigIpCommon):
             else:
                 self.api.PEM.Policy.create(rules=[rules])
 
-            if current_folder != '/' + partition:
-                self.api.System.Session.set_active_folder(folder=current_folder)
-
         if self.exists():
             return True
         else:
@@ -428,6 +747,10 @@ class BigIpRestApi(BigIpCommon):
     def __init__(self, *args, **kwargs):
         super(BigIpRestApi, self).__init__(*args, **kwargs)
 
+        self.api = icr_session(self.params['server'], self.params['user'],
+                               self.params['password'],
+                               self.params['validate_certs'])
+
         server = self.params['server']
         module = self.params['module']
 
@@ -446,43 +769,109 @@ class BigIpRestApi(BigIpCommon):
             'Content-Type': 'application/json'
         }
 
+        self.manifest = RuleManifest()
+
+        # The iRule as known to be on the BIG-IP, so that it does not need
+        # to be fetched again for the result
+        self._current = None
+
+    def _key(self):
+        return '%s/%s/%s/%s' % (self.params['server'], self.params['module'],
+                                self.params['partition'], self.params['name'])
+
+    def _record(self, res):
+        content = res.get('apiAnonymous', '').strip()
+        self.manifest.record(self._key(), content, res.get('generation'))
+        self._current = dict(name=res['name'], definition=content)
+
+    def generation(self):
+        """Returns the generation of the iRule, or None if it does not exist
+
+        Only the name and generation of the iRule are requested, so the
+        definition is not transferred.
+        """
+        validate_certs = self.params['validate_certs']
+        partition = self.params['partition']
+        name = self.params['name']
+
+        url = "%s/~%s~%s" % (self._uri, partition, name)
+        resp = self.api.get(url,
+                            params={'$select': 'name,generation'},
+                            verify=validate_certs)
+
+        if resp.status_code != 200:
+            return None
+        return resp.json().get('generation')
+
+    def read_all(self):
+        """Returns the definitions of the iRules of the partition by name
+
+        The whole collection of the partition is fetched in one request.
+        """
+        validate_certs = self.params['validate_certs']
+        partition = self.params['partition']
+
+        params = {'$filter': 'partition eq %s' % partition}
+        resp = self.api.get(self._uri,
+                            params=params,
+                            verify=validate_certs)
+        if resp.status_code != 200:
+            res = resp.json()
+            raise Exception(res['message'])
+
+        result = {}
+        for item in resp.json().get('items', []):
+            if item.get('partition') != partition or 'subPath' in item:
+                continue
+            result[item['name']] = item.get('apiAnonymous', '').strip()
+        return result
+
+    def write_all(self, create, modify):
+        # iControl REST has no batched form of these calls, so the iRules
+        # that differ are sent one at a time
+        for name, content in modify.iteritems():
+            self._send(name, content, self._modify)
+        for name, content in create.iteritems():
+            self._send(name, content, self.create)
+
+    def delete_all(self, names):
+        for name in names:
+            self.params['name'] = name
+            self._delete()
+
+    def _send(self, name, content, method):
+        self.params['name'] = name
+        self.params['content'] = content
+        method()
+
     def read(self):
+        if self._current is not None:
+            return dict(self._current)
+
         result = {}
-        tmp = []
 
-        user = self.params['user']
-        password = self.params['password']
         validate_certs = self.params['validate_certs']
         partition = self.params['partition']
         name = self.params['name']
 
         url = "%s/~%s~%s" % (self._uri, partition, name)
-        resp = requests.get(url,
-                            auth=(user, password),
+        resp = self.api.get(url,
                             verify=validate_certs)
 
         if resp.status_code == 200:
             res = resp.json()
-
-            result['name'] = res['name']
-
-            if 'apiAnonymous' in res:
-                result['definition'] = res['apiAnonymous'].strip()
-            else:
-                result['definition'] = ''
+            self._record(res)
+            result.update(self._current)
 
         return result
 
     def exists(self):
-        user = self.params['user']
-        password = self.params['password']
         validate_certs = self.params['validate_certs']
         partition = self.params['partition']
         name = self.params['name']
 
         url = "%s/~%s~%s" % (self._uri, partition, name)
-        resp = requests.get(url,
-                            auth=(user, password),
+        resp = self.api.get(url,
                             verify=validate_certs)
 
         if resp.status_code != 200:
@@ -491,47 +880,61 @@ class BigIpRestApi(BigIpCommon):
             return True
 
     def present(self):
-        if self.exists():
-            return self.update()
-        else:
+        generation = self.generation()
+        if generation is None:
             if self.params['check_mode']:
                 return True
             return self.create()
 
+        # The definition is only fetched and compared when the iRule may
+        # have changed since it was last seen
+        content = self.params['content'].strip()
+        entry = self.manifest.get(self._key())
+        if entry and entry['generation'] == generation:
+            if entry['hash'] == content_hash(content):
+                self._current = dict(name=self.params['name'],
+                                     definition=content)
+                return False
+
+        return self.update()
+
     def update(self):
-        user = self.params['user']
-        password = self.params['password']
-        validate_certs = self.params['validate_certs']
-        partition = self.params['partition']
-        name = self.params['name']
         content = self.params['content'].strip()
 
         current = self.read()
         if current['definition'] == content:
             return False
-        else:
-            payload = dict(
-                apiAnonymous=content
-            )
+
+        self._current = None
 
         if self.params['check_mode']:
             return True
 
+        return self._modify()
+
+    def _modify(self):
+        validate_certs = self.params['validate_certs']
+        partition = self.params['partition']
+        name = self.params['name']
+        content = self.params['content'].strip()
+
+        payload = dict(
+            apiAnonymous=content
+        )
+
         url = "%s/~%s~%s" % (self._uri, partition, name)
-        resp = requests.patch(url,
-                              auth=(user, password),
+        resp = self.api.patch(url,
                               data=json.dumps(payload),
                               verify=validate_certs,
                               headers=self._headers)
         if resp.status_code == 200:
+            self._record(resp.json())
             return True
         else:
             res = resp.json()
             raise Exception(res['message'])
 
     def create(self):
-        user = self.params['user']
-        password = self.params['password']
         validate_certs = self.params['validate_certs']
         partition = self.params['partition']
         name = self.params['name']
@@ -543,35 +946,36 @@ class BigIpRestApi(BigIpCommon):
             partition=partition
         )
 
-        resp = requests.post(self._uri,
-                             auth=(user, password),
+        resp = self.api.post(self._uri,
                              data=json.dumps(payload),
                              verify=validate_certs,
                              headers=self._headers)
         if resp.status_code == 200:
+            self._record(resp.json())
             return True
         else:
             res = resp.json()
             raise Exception(res['message'])
 
     def absent(self):
-        user = self.params['user']
-        password = self.params['password']
-        validate_certs = self.params['validate_certs']
-        partition = self.params['partition']
-        name = self.params['name']
-
         if not self.exists():
             return False
 
         if self.params['check_mode']:
             return True
 
+        return self._delete()
+
+    def _delete(self):
+        validate_certs = self.params['validate_certs']
+        partition = self.params['partition']
+        name = self.params['name']
+
         url = "%s/~%s~%s" % (self._uri, partition, name)
-        resp = requests.delete(uri,
-                               auth=(user, password),
+        resp = self.api.delete(url,
                                verify=validate_certs)
         if resp.status_code == 200:
+            self.manifest.forget(self._key())
             return True
         else:
             res = resp.json()
@@ -582,32 +986,40 @@ def main():
     argument_spec = f5_argument_spec()
 
     meta_args = dict(
-        connection = dict(default='soap', choices=TRANSPORTS),
-        content = dict(required=False),
-        src = dict(required=False),
-        name = dict(required=True),
-        module = dict(required=True, choices=MODULES),
-        state = dict(default='present', choices=STATES),
+        connection=dict(default='soap', choices=TRANSPORTS),
+        content=dict(required=False),
+        src=dict(required=False),
+        src_dir=dict(required=False),
+        name=dict(required=False),
+        module=dict(required=True, choices=MODULES),
+        state=dict(default='present', choices=STATES),
     )
-    argument_spec.update(meta_args)    
+    argument_spec.update(meta_args)
 
     module = AnsibleModule(
         argument_spec=argument_spec,
         supports_check_mode=True,
-        mutually_exclusive = [
-            ['content', 'src']
+        mutually_exclusive=[
+            ['content', 'src', 'src_dir'],
+            ['name', 'src_dir']
+        ],
+        required_one_of=[
+            ['name', 'src_dir']
         ]
     )
 
     try:
         obj = BigIpApiFactory.factory(module)
         result = obj.flush()
+        result.update(icr_stats(obj))
 
         module.exit_json(**result)
     except bigsuds.ConnectionError, e:
         module.fail_json(msg="Could not connect to BIG-IP host")
     except requests.exceptions.SSLError:
         module.fail_json(msg='Certificate verification failed. Consider using validate_certs=no')
+    except SyncNotSupportedError:
+        module.fail_json(msg='The src_dir option is not supported for the pem module')
 
 from ansible.module_utils.basic import *
 from ansible.module_utils.f5 import *
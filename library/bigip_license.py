@@ -84,6 +84,8 @@ options:
 notes:
   - Requires the suds Python package on the host. This is as easy as
     pip install suds
+  - The shell and roles of the account, and the version and provisioned
+    modules of the device, are cached for an hour in ~/.ansible/bigip_facts
   - Requires the bigsuds Python package on the host. This is as easy as
     pip install bigsuds
   - Requires the paramiko Python package on the host if using the C(state)
@@ -146,10 +148,13 @@ EXAMPLES = """
 """
 
 import base64
+import json
+import os
 import socket
 import suds
 import ssl
 import re
+import tempfile
 import time
 import urllib2
 import sys
@@ -181,6 +186,11 @@ else:
 LIC_EXTERNAL = 'activate.f5.com'
 LIC_INTERNAL = 'authem.f5net.com'
 
+# Local cache of device and account facts, and the number of seconds
+# they are trusted before being read from the device again
+FACTS_CACHE_DIR = '~/.ansible/bigip_facts'
+FACTS_TTL = 3600
+
 
 def is_production_key(key):
     m = re.search("\d", key[1:-1])
@@ -206,6 +216,105 @@ class SSLCertVerifyError(Exception):
     pass
 
 
+class DeviceFacts(object):
+    """Capabilities of a BIG-IP and of the connecting account
+
+    The facts are cached on the local host in one file per BIG-IP under
+    FACTS_CACHE_DIR, and are read from the device again once they are older
+    than FACTS_TTL seconds. The account facts (shell and roles) are kept per
+    user, while the device facts (version and provisioned modules) are
+    shared by every user of the device.
+    """
+
+    def __init__(self, server, user, password, validate_certs, ttl=FACTS_TTL):
+        self.server = server
+        self.user = user
+        self.password = password
+        self.validate_certs = validate_certs
+        self.ttl = ttl
+
+        directory = os.path.expanduser(FACTS_CACHE_DIR)
+        self.path = os.path.join(directory, '%s.json' % server)
+        self._cache = None
+
+    def _load(self):
+        if self._cache is None:
+            try:
+                with open(self.path) as fh:
+                    self._cache = json.load(fh)
+            except (IOError, ValueError):
+                self._cache = {}
+        return self._cache
+
+    def _save(self):
+        directory = os.path.dirname(self.path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory, 0700)
+
+        # Written to a temporary file first so that concurrent tasks for the
+        # same device never read a partially written cache
+        fd, tmp = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, 'w') as fh:
+            json.dump(self._cache, fh)
+        os.rename(tmp, self.path)
+
+    def _get(self, uri):
+        resp = requests.get('https://%s/mgmt/tm/%s' % (self.server, uri),
+                            auth=(self.user, self.password),
+                            verify=self.validate_certs)
+        if resp.status_code != 200:
+            raise Exception('Failed to query the REST API')
+        return resp.json()
+
+    def _cached(self, key, fetch, refresh):
+        cache = self._load()
+        entry = cache.get(key)
+        if refresh or not entry or time.time() - entry['fetched'] > self.ttl:
+            entry = fetch()
+            entry['fetched'] = time.time()
+            cache[key] = entry
+            self._save()
+        return entry
+
+    def _read_account(self):
+        result = self._get('auth/user/%s' % self.user)
+        roles = set([p['role'] for p in result.get('partitionAccess', [])])
+
+        # The REST API does not list a shell if the console has been
+        # deactivated for the account
+        return dict(shell=result.get('shell'), roles=sorted(roles))
+
+    def _read_device(self):
+        version = None
+        for entry in self._get('sys/version').get('entries', {}).values():
+            stats = entry.get('nestedStats', {}).get('entries', {})
+            if 'Version' in stats:
+                version = stats['Version']['description']
+
+        modules = []
+        for item in self._get('sys/provision').get('items', []):
+            if item.get('level', 'none') != 'none':
+                modules.append(item['name'])
+
+        return dict(version=version, modules=sorted(modules))
+
+    def account(self, refresh=False):
+        return self._cached('account:%s' % self.user, self._read_account, refresh)
+
+    def device(self, refresh=False):
+        return self._cached('device', self._read_device, refresh)
+
+    def invalidate(self):
+        self._cache = {}
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+    def appliance_mode(self):
+        return self.account()['shell'] == 'tmsh'
+
+
 class BigIpLicenseCommon(object):
     def __init__(self, module):
         self.password = module.params.get('password')
@@ -217,6 +326,9 @@ class BigIpLicenseCommon(object):
 
         self._validate_certs = module.params.get('validate_certs')
 
+        self.facts = DeviceFacts(self.hostname, self.username, self.password,
+                                 self._validate_certs)
+
         self.client = bigsuds.BIGIP(
             hostname=self.hostname,
             username=self.username,
@@ -271,24 +383,12 @@ class BigIpLicenseCommon(object):
         """
         return self.client.Management.LicenseAdministration.get_license_activation_status()
 
-    def read_account(self):
-        self._uri = 'https://%s/mgmt/tm/auth/user/%s' % (self.hostname, self.username)
-        self._headers = {
-            'Content-Type': 'application/json'
-        }
-
+    def read_account(self, refresh=False):
         try:
-            resp = requests.get(self._uri,
-                                auth=(self.username, self.password),
-                                verify=self._validate_certs)
+            return self.facts.account(refresh)
         except requests.exceptions.SSLError:
             raise SSLCertVerifyError
 
-        if resp.status_code != 200:
-            raise Exception('Failed to query the REST API')
-        else:
-            return resp.json()
-
     def appliance_mode(self):
         """Checks for appliance mode
 
@@ -303,7 +403,7 @@ class BigIpLicenseCommon(object):
         """
         result = self.read_account()
 
-        if 'shell' in result and result['shell'] == 'tmsh':
+        if result['shell'] == 'tmsh':
             return True
         else:
             return False
@@ -316,12 +416,9 @@ class BigIpLicenseCommon(object):
         on the system, we need to check to see if the user is assigned a
         role that is allowed to have an advanced shell
         """
-        roles = []
         can_have_advanced = ['resource-admin', 'admin']
 
-        user_data = self.read_account()
-        pa = user_data['partitionAccess']
-        roles = set([p['role'] for p in pa])
+        roles = self.read_account()['roles']
 
         found = [x for x in roles if x in can_have_advanced]
         if len(found) > 0:
@@ -352,6 +449,9 @@ class BigIpLicenseCommon(object):
                      data=json.dumps(payload),
                      verify=self._validate_certs)
 
+        # The cached shell of the account is no longer accurate
+        self.facts.invalidate()
+
     def absent(self):
         """Removes a license from a device
 
@@ -409,16 +509,14 @@ class BigIpLicenseCommon(object):
         #
         # This is being done so that if we need to set the shell to the
         # advanced shell, we will know what shell to set the account back
-        # to after we are done.
-        user_data = self.read_account()
+        # to after we are done. The cached shell is not trusted here because
+        # the account is about to be changed.
+        original = self.read_account(refresh=True)['shell']
 
         # There is the possibility that there will be no shell specified
         # in the account details. The REST API does not list a shell if
         # the console has been deactivated for the account
-        if 'shell' in user_data:
-            if user_data['shell'] != 'bash':
-                self.set_shell('bash')
-        else:
+        if original != 'bash':
             self.set_shell('bash')
 
         self.cli = paramiko.SSHClient()
@@ -462,8 +560,8 @@ class BigIpLicenseCommon(object):
                 break
             time.sleep(1)
 
-        if 'shell' in user_data:
-            shell = user_data['shell']
+        if original is not None:
+            shell = original
             if shell == 'bash':
                 shell = '/bin/bash'
             elif shell == 'none':
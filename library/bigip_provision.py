@@ -115,8 +115,13 @@ EXAMPLES = """
   delegate_to: localhost
 """
 
+import atexit
 import json
 import socket
+import os
+import shutil
+import tempfile
+import time
 
 try:
     import bigsuds
@@ -125,6 +130,97 @@ except ImportError:
 else:
     bigsuds_found = True
 
+
+# WSDLs downloaded by iControl clients are cached here, per BIG-IP version
+WSDL_CACHE_DIR = '~/.ansible/bigip_wsdl'
+
+# Seconds that the recorded version of a BIG-IP is trusted
+WSDL_CACHE_TTL = 86400
+
+
+def wsdl_cache_dir(hostname):
+    """Returns the WSDL cache of hostname, or None when it is not known
+
+    The cache is not known until the version of the BIG-IP has been
+    recorded, and again once the recorded version is older than
+    WSDL_CACHE_TTL, since the BIG-IP may have been upgraded.
+    """
+    base = os.path.expanduser(WSDL_CACHE_DIR)
+    try:
+        with open(os.path.join(base, 'versions.json')) as fh:
+            entry = json.load(fh)[hostname]
+    except (IOError, ValueError, KeyError):
+        return None
+
+    if time.time() - entry['checked'] > WSDL_CACHE_TTL:
+        return None
+    return os.path.join(base, '%s-%s' % (hostname, entry['version']))
+
+
+def remember_version(hostname, version):
+    base = os.path.expanduser(WSDL_CACHE_DIR)
+    path = os.path.join(base, 'versions.json')
+
+    try:
+        with open(path) as fh:
+            versions = json.load(fh)
+    except (IOError, ValueError):
+        versions = {}
+
+    versions[hostname] = dict(version=version, checked=time.time())
+
+    if not os.path.isdir(base):
+        os.makedirs(base, 0700)
+
+    fd, tmp = tempfile.mkstemp(dir=base)
+    with os.fdopen(fd, 'w') as fh:
+        json.dump(versions, fh)
+    os.rename(tmp, path)
+
+
+def icontrol_client(hostname, username, password):
+    """Returns a bigsuds client that keeps the WSDLs it parses on disk
+
+    Each iControl interface otherwise downloads and parses its WSDL every
+    time a module runs. The cache is kept per BIG-IP and version, so the
+    version is looked up first when it is not yet known. The WSDL parsed
+    to look it up is cached in a directory of its own, which is moved into
+    place once the version is known.
+    """
+    cachedir = wsdl_cache_dir(hostname)
+    if cachedir is None:
+        base = os.path.expanduser(WSDL_CACHE_DIR)
+        if not os.path.isdir(base):
+            os.makedirs(base, 0700)
+
+        tmpdir = tempfile.mkdtemp(dir=base)
+        try:
+            api = bigsuds.BIGIP(
+                hostname=hostname,
+                username=username,
+                password=password,
+                debug=True,
+                cachedir=tmpdir
+            )
+            remember_version(hostname, api.System.SystemInfo.get_version())
+            cachedir = wsdl_cache_dir(hostname)
+            try:
+                os.rename(tmpdir, cachedir)
+            except OSError:
+                # The cache of this version already exists
+                pass
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+    return bigsuds.BIGIP(
+        hostname=hostname,
+        username=username,
+        password=password,
+        debug=True,
+        cachedir=cachedir
+    )
+
+
 try:
     import requests
 except ImportError:
@@ -132,15 +228,98 @@ except ImportError:
 else:
     requests_found = True
 
-def test_icontrol(username, password, hostname):
-    client = bigsuds.BIGIP(
-        hostname=hostname,
+
+# Largest number of connections that a REST session keeps open to the BIG-IP
+REST_POOL_SIZE = 4
+
+# Upper bounds, in milliseconds, of the buckets of the REST latency histogram
+LATENCY_BUCKETS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# Seconds to wait for the device to release a login token
+LOGOUT_TIMEOUT = 10
+
+
+def icr_session(hostname, username, password, validate_certs=True):
+    """Returns a pooled iControl REST session
+
+    Connections are kept alive and reused by every request made with the
+    session, so that the TLS handshake happens once per connection rather
+    than once per request. The session logs in once and sends the token it
+    is given with each request, falling back to basic auth on BIG-IPs that
+    do not hand out tokens. The token is released when the module exits,
+    rather than being left to expire.
+
+    Responses may be compressed, and the time taken by each request is
+    counted in the session.latency histogram.
+    """
+    session = requests.session()
+    session.verify = validate_certs
+    session.headers.update({
+        'Content-Type': 'application/json',
+        'Accept-Encoding': 'gzip, deflate'
+    })
+
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1,
+                                            pool_maxsize=REST_POOL_SIZE)
+    session.mount('https://', adapter)
+
+    session.latency = dict((str(x), 0) for x in LATENCY_BUCKETS)
+    session.latency['inf'] = 0
+
+    def record_latency(resp, *args, **kwargs):
+        elapsed = resp.elapsed.total_seconds() * 1000
+        for bound in LATENCY_BUCKETS:
+            if elapsed <= bound:
+                session.latency[str(bound)] += 1
+                break
+        else:
+            session.latency['inf'] += 1
+
+    session.hooks['response'].append(record_latency)
+
+    payload = dict(
         username=username,
         password=password,
-        debug=True
+        loginProviderName='tmos'
     )
+    resp = session.post('https://%s/mgmt/shared/authn/login' % hostname,
+                        data=json.dumps(payload))
+    try:
+        token = resp.json()['token']['token']
+    except (ValueError, KeyError, TypeError):
+        session.auth = (username, password)
+    else:
+        session.headers['X-F5-Auth-Token'] = token
+        atexit.register(icr_logout, session, hostname, token)
+
+    return session
 
+
+def icr_logout(session, hostname, token):
+    """Releases the login token of a session"""
     try:
+        session.delete('https://%s/mgmt/shared/authz/tokens/%s' % (hostname, token),
+                       timeout=LOGOUT_TIMEOUT)
+    except requests.exceptions.RequestException:
+        # The token expires on its own
+        pass
+
+
+def icr_stats(obj):
+    """Returns the REST latency histogram of obj for the module result"""
+    session = getattr(obj, 'api', None)
+    if requests_found and isinstance(session, requests.Session):
+        return dict(rest_latency=session.latency)
+    return dict()
+
+def test_icontrol(username, password, hostname):
+    # A warm WSDL cache means that the BIG-IP was reached recently, so it
+    # is not probed again
+    if wsdl_cache_dir(hostname):
+        return True
+
+    try:
+        client = icontrol_client(hostname, username, password)
         response = client.Management.LicenseAdministration.get_license_activation_status()
         if 'STATE' in response:
             return True
@@ -149,6 +328,17 @@ def test_icontrol(username, password, hostname):
     except:
         return False
 
+
+def icontrol_auth_failed(error):
+    """Checks whether an iControl connection error was caused by a bad login
+
+    The credentials are not probed up front when the WSDL cache is warm,
+    so a bad login only shows up on the first real call.
+    """
+    text = str(error)
+    return 'credentials' in text or '401' in text
+
+
 class BigIpCommon(object):
     def __init__(self, module):
         self._username = module.params.get('user')
@@ -167,12 +357,7 @@ class BigIpIControl(BigIpCommon):
     def __init__(self, module):
         super(BigIpIControl, self).__init__(module)
 
-        self._client = bigsuds.BIGIP(
-            hostname=self._hostname,
-            username=self._username,
-            password=self._password,
-            debug=True
-        )
+        self._client = icontrol_client(self._hostname, self._username, self._password)
         module_map = {
             'afm': 'TMOS_MODULE_AFM',
             'am': 'TMOS_MODULE_AM',
@@ -236,14 +421,16 @@ class BigIpRest(BigIpCommon):
     def __init__(self, module):
         super(BigIpRest, self).__init__(module)
 
+        self.api = icr_session(self._hostname, self._username,
+                               self._password, self._validate_certs)
+
         self._uri = 'https://%s/mgmt/tm/sys/db/%s' % (self._hostname, self._key)
         self._headers = {
             'Content-Type': 'application/json'
         }
 
     def read(self):
-        resp = requests.get(self._uri,
-                            auth=(self._username, self._password),
+        resp = self.api.get(self._uri,
                             verify=self._validate_certs)
 
         if resp.status_code != 200:
@@ -257,8 +444,7 @@ class BigIpRest(BigIpCommon):
 
         if current and current['name'] == self._key:
             if current['value'] != self._value:
-                resp = requests.put(self._uri,
-                                    auth=(self._username, self._password),
+                resp = self.api.put(self._uri,
                                     data=json.dumps(self._payload),
                                     verify=self._validate_certs)
                 if resp.status_code == 200:
@@ -317,14 +503,17 @@ def main():
         elif state == "absent":
             if obj.absent():
                 changed = True
-    except bigsuds.ConnectionError:
-        module.fail_json(msg="Could not connect to BIG-IP host %s" % hostname)
+    except bigsuds.ConnectionError, e:
+        if icontrol_auth_failed(e):
+            module.fail_json(msg="Could not log in with provided credentials")
+        else:
+            module.fail_json(msg="Could not connect to BIG-IP host %s" % hostname)
     except socket.timeout:
         module.fail_json(msg="Timed out connecting to the BIG-IP")
     except bigsuds.ConnectionError, e:
         module.fail_json(msg=str(e))
 
-    module.exit_json(changed=changed)
+    module.exit_json(changed=changed, **icr_stats(obj))
 
 from ansible.module_utils.basic import *
 
@@ -28,8 +28,17 @@ version_added: "2.0"
 options:
   address:
     description:
-      - The IP addresses for the new self IP
-    required: true
+      - The IP addresses for the new self IP. Required unless C(self_ips) is
+        given
+    required: false
+  concurrency:
+    description:
+      - Number of self IPs in C(self_ips) that are created, updated or
+        deleted at the same time. This also limits the number of self IPs
+        of a VLAN that are deleted at the same time with C(state=absent)
+    required: false
+    default: 4
+    version_added: "2.1"
   connection:
     description:
       - The connection used to interface with the BIG-IP
@@ -51,12 +60,31 @@ options:
     default: Value of C(address)
   netmask:
     description:
-      - The netmasks for the self IP
-    required: true
+      - The netmasks for the self IP. Required unless C(self_ips) is given
+    required: false
   password:
     description:
       - BIG-IP password
     required: true
+  purge:
+    description:
+      - When C(yes), self IPs on the VLANs used by C(self_ips) that are not
+        listed in C(self_ips) are deleted
+    required: false
+    default: no
+    version_added: "2.1"
+  self_ips:
+    description:
+      - List of self IPs to reconcile in one task, each a dictionary with
+        the C(name), C(address), C(netmask), C(vlan), C(traffic_group) and
+        C(floating_state) keys of the options of the same names. The self
+        IPs of the partition are read in a single request, and only the ones
+        that differ are then created, updated or deleted, C(concurrency) at
+        a time. With C(state=absent), the listed self IPs are deleted and
+        only C(name) or C(address) is needed. Only the C(rest) connection
+        is supported
+    required: false
+    version_added: "2.1"
   server:
     description:
       - BIG-IP host
@@ -74,7 +102,8 @@ options:
   traffic_group:
     description:
       - The traffic group for the self IP addresses in an active-active,
-        redundant load balancer configuration
+        redundant load balancer configuration. Required unless C(self_ips)
+        is given
     required: false
   user:
     description:
@@ -88,8 +117,9 @@ options:
     default: true
   vlan:
     description:
-      - The VLAN that the new self IPs will be on
-    required: true
+      - The VLAN that the new self IPs will be on. Required unless
+        C(self_ips) is given
+    required: false
 
 notes:
    - Requires the bigsuds Python package on the host if using the iControl
@@ -101,12 +131,57 @@ author: Tim Rupp <caphrim007@gmail.com> (@caphrim007)
 '''
 
 EXAMPLES = """
+- name: Reconcile the tenant self IPs of the internal VLAN
+  bigip_selfip:
+      server: "lb.mydomain.com"
+      user: "admin"
+      password: "secret"
+      self_ips:
+          - name: "tenant-1"
+            address: "10.10.10.10"
+            netmask: "255.255.255.0"
+            vlan: "internal"
+            traffic_group: "traffic-group-local-only"
+          - name: "tenant-1-float"
+            address: "10.10.10.11"
+            netmask: "255.255.255.0"
+            vlan: "internal"
+            traffic_group: "traffic-group-1"
+            floating_state: "enabled"
+      purge: yes
+      concurrency: 8
+  delegate_to: localhost
+"""
+
+RETURN = """
+created:
+    description: The self IPs created from C(self_ips)
+    returned: changed and self_ips is given
+    type: list
+    sample: ["tenant-1"]
+updated:
+    description: The self IPs updated from C(self_ips)
+    returned: changed and self_ips is given
+    type: list
+    sample: ["tenant-1-float"]
+deleted:
+    description: The self IPs deleted for C(self_ips)
+    returned: changed and self_ips is given
+    type: list
+    sample: ["tenant-2"]
 """
 
+import atexit
 import json
 import socket
 import netaddr
 import os
+import shutil
+import tempfile
+import threading
+import time
+
+from Queue import Queue
 
 try:
     import bigsuds
@@ -115,6 +190,97 @@ except ImportError:
 else:
     bigsuds_found = True
 
+
+# WSDLs downloaded by iControl clients are cached here, per BIG-IP version
+WSDL_CACHE_DIR = '~/.ansible/bigip_wsdl'
+
+# Seconds that the recorded version of a BIG-IP is trusted
+WSDL_CACHE_TTL = 86400
+
+
+def wsdl_cache_dir(hostname):
+    """Returns the WSDL cache of hostname, or None when it is not known
+
+    The cache is not known until the version of the BIG-IP has been
+    recorded, and again once the recorded version is older than
+    WSDL_CACHE_TTL, since the BIG-IP may have been upgraded.
+    """
+    base = os.path.expanduser(WSDL_CACHE_DIR)
+    try:
+        with open(os.path.join(base, 'versions.json')) as fh:
+            entry = json.load(fh)[hostname]
+    except (IOError, ValueError, KeyError):
+        return None
+
+    if time.time() - entry['checked'] > WSDL_CACHE_TTL:
+        return None
+    return os.path.join(base, '%s-%s' % (hostname, entry['version']))
+
+
+def remember_version(hostname, version):
+    base = os.path.expanduser(WSDL_CACHE_DIR)
+    path = os.path.join(base, 'versions.json')
+
+    try:
+        with open(path) as fh:
+            versions = json.load(fh)
+    except (IOError, ValueError):
+        versions = {}
+
+    versions[hostname] = dict(version=version, checked=time.time())
+
+    if not os.path.isdir(base):
+        os.makedirs(base, 0700)
+
+    fd, tmp = tempfile.mkstemp(dir=base)
+    with os.fdopen(fd, 'w') as fh:
+        json.dump(versions, fh)
+    os.rename(tmp, path)
+
+
+def icontrol_client(hostname, username, password):
+    """Returns a bigsuds client that keeps the WSDLs it parses on disk
+
+    Each iControl interface otherwise downloads and parses its WSDL every
+    time a module runs. The cache is kept per BIG-IP and version, so the
+    version is looked up first when it is not yet known. The WSDL parsed
+    to look it up is cached in a directory of its own, which is moved into
+    place once the version is known.
+    """
+    cachedir = wsdl_cache_dir(hostname)
+    if cachedir is None:
+        base = os.path.expanduser(WSDL_CACHE_DIR)
+        if not os.path.isdir(base):
+            os.makedirs(base, 0700)
+
+        tmpdir = tempfile.mkdtemp(dir=base)
+        try:
+            api = bigsuds.BIGIP(
+                hostname=hostname,
+                username=username,
+                password=password,
+                debug=True,
+                cachedir=tmpdir
+            )
+            remember_version(hostname, api.System.SystemInfo.get_version())
+            cachedir = wsdl_cache_dir(hostname)
+            try:
+                os.rename(tmpdir, cachedir)
+            except OSError:
+                # The cache of this version already exists
+                pass
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+    return bigsuds.BIGIP(
+        hostname=hostname,
+        username=username,
+        password=password,
+        debug=True,
+        cachedir=cachedir
+    )
+
+
 try:
     import requests
 except ImportError:
@@ -122,6 +288,92 @@ except ImportError:
 else:
     requests_found = True
 
+
+# Largest number of connections that a REST session keeps open to the BIG-IP
+REST_POOL_SIZE = 4
+
+# Upper bounds, in milliseconds, of the buckets of the REST latency histogram
+LATENCY_BUCKETS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# Seconds to wait for the device to release a login token
+LOGOUT_TIMEOUT = 10
+
+
+def icr_session(hostname, username, password, validate_certs=True,
+                pool_size=REST_POOL_SIZE):
+    """Returns a pooled iControl REST session
+
+    Connections are kept alive and reused by every request made with the
+    session, so that the TLS handshake happens once per connection rather
+    than once per request. The session logs in once and sends the token it
+    is given with each request, falling back to basic auth on BIG-IPs that
+    do not hand out tokens. The token is released when the module exits,
+    rather than being left to expire.
+
+    Responses may be compressed, and the time taken by each request is
+    counted in the session.latency histogram.
+    """
+    session = requests.session()
+    session.verify = validate_certs
+    session.headers.update({
+        'Content-Type': 'application/json',
+        'Accept-Encoding': 'gzip, deflate'
+    })
+
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1,
+                                            pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+
+    session.latency = dict((str(x), 0) for x in LATENCY_BUCKETS)
+    session.latency['inf'] = 0
+
+    def record_latency(resp, *args, **kwargs):
+        elapsed = resp.elapsed.total_seconds() * 1000
+        for bound in LATENCY_BUCKETS:
+            if elapsed <= bound:
+                session.latency[str(bound)] += 1
+                break
+        else:
+            session.latency['inf'] += 1
+
+    session.hooks['response'].append(record_latency)
+
+    payload = dict(
+        username=username,
+        password=password,
+        loginProviderName='tmos'
+    )
+    resp = session.post('https://%s/mgmt/shared/authn/login' % hostname,
+                        data=json.dumps(payload))
+    try:
+        token = resp.json()['token']['token']
+    except (ValueError, KeyError, TypeError):
+        session.auth = (username, password)
+    else:
+        session.headers['X-F5-Auth-Token'] = token
+        atexit.register(icr_logout, session, hostname, token)
+
+    return session
+
+
+def icr_logout(session, hostname, token):
+    """Releases the login token of a session"""
+    try:
+        session.delete('https://%s/mgmt/shared/authz/tokens/%s' % (hostname, token),
+                       timeout=LOGOUT_TIMEOUT)
+    except requests.exceptions.RequestException:
+        # The token expires on its own
+        pass
+
+
+def icr_stats(obj):
+    """Returns the REST latency histogram of obj for the module result"""
+    session = getattr(obj, 'api', None)
+    if requests_found and isinstance(session, requests.Session):
+        return dict(rest_latency=session.latency)
+    return dict()
+
+
 SHARED_CONFIG_DEFAULT_TRAFFIC_GROUP = 'traffic-group-local-only'
 CONNECTION_TIMEOUT = 30
 OBJ_PREFIX = 'uuid_'
@@ -158,14 +410,13 @@ def strip_folder_and_prefix(path):
 
 
 def test_icontrol(username, password, hostname):
-    api = bigsuds.BIGIP(
-        hostname=hostname,
-        username=username,
-        password=password,
-        debug=True
-    )
+    # A warm WSDL cache means that the BIG-IP was reached recently, so it
+    # is not probed again
+    if wsdl_cache_dir(hostname):
+        return True
 
     try:
+        api = icontrol_client(hostname, username, password)
         response = api.Management.LicenseAdministration.get_license_activation_status()
         if 'STATE' in response:
             return True
@@ -175,6 +426,16 @@ def test_icontrol(username, password, hostname):
         return False
 
 
+def icontrol_auth_failed(error):
+    """Checks whether an iControl connection error was caused by a bad login
+
+    The credentials are not probed up front when the WSDL cache is warm,
+    so a bad login only shows up on the first real call.
+    """
+    text = str(error)
+    return 'credentials' in text or '401' in text
+
+
 class SelfIPCreationException(Exception):
     """SelfIPCreationException"""
     pass
@@ -205,6 +466,159 @@ class RouteQueryException(Exception):
     pass
 
 
+class SelfIPBulkException(Exception):
+    """SelfIPBulkException"""
+    pass
+
+
+def selfip_snapshot(selfip):
+    """ Get the selfip attributes managed by the module """
+    address = selfip['address']
+    result = dict(
+        name=strip_folder_and_prefix(selfip.get('name', '')),
+        address=address.split('/')[0],
+        netmask=None,
+        vlan=None,
+        traffic_group=selfip.get('trafficGroup'),
+        floating=selfip.get('floating') == 'enabled'
+    )
+    try:
+        net = netaddr.IPNetwork(strip_domain_address(address))
+        result['netmask'] = str(net.netmask)
+    except Exception:
+        pass
+    if 'vlan' in selfip:
+        result['vlan'] = strip_folder_and_prefix(selfip['vlan'])
+    return result
+
+
+class SelfIPIndex(object):
+    """ Selfips of a partition by name, vlan and address
+
+    The index is built from a single listing of the partition, so that the
+    selfips of a bulk run are looked up instead of being searched for or
+    fetched again one by one.
+    """
+
+    def __init__(self, selfips):
+        self.by_name = dict()
+        self.by_vlan = dict()
+        self.by_address = dict()
+
+        for selfip in selfips:
+            current = selfip_snapshot(selfip)
+            vlan = os.path.basename(current['vlan'] or '')
+
+            self.by_name[current['name']] = current
+            self.by_vlan.setdefault(vlan, []).append(current)
+            self.by_address[current['address']] = current
+
+
+class SoapBatch(object):
+    """Collects the iControl calls that change one object
+
+    The calls are submitted together in a single iControl transaction, so
+    that they are applied all at once or, if any of them fails, not at all.
+    Reads are not collected and should be made before the calls are
+    submitted.
+    """
+
+    def __init__(self, api):
+        self.api = api
+        self.calls = []
+
+    def add(self, method, *args, **kwargs):
+        self.calls.append((method, args, kwargs))
+
+    def submit(self):
+        """Submits the collected calls and returns whether there were any"""
+        if not self.calls:
+            return False
+
+        with bigsuds.Transaction(self.api):
+            for method, args, kwargs in self.calls:
+                method(*args, **kwargs)
+
+        self.calls = []
+        return True
+
+
+class RouteDomainIndex(object):
+    """ Route domains of a partition by id and by name
+
+    The route domains of a partition are listed with a single query the
+    first time one of them is looked up. The vlans of each route domain are
+    kept as a set, which writes made through the index update in place
+    instead of the route domains being listed again.
+    """
+
+    def __init__(self, api, uri):
+        self.api = api
+        self._uri = uri
+        self._partitions = dict()
+        self._lock = threading.RLock()
+
+    def _load(self, folder):
+        folder = str(folder).replace('/', '')
+        with self._lock:
+            if folder in self._partitions:
+                return self._partitions[folder]
+
+            request_url = self._uri + \
+                '/net/route-domain?$select=id,name,partition,vlans'
+            if folder:
+                request_filter = 'partition eq ' + folder
+                request_url += '&$filter=' + request_filter
+            response = self.api.get(request_url, timeout=CONNECTION_TIMEOUT)
+
+            by_id = dict()
+            by_name = dict()
+            if response.status_code < 400:
+                response_obj = json.loads(response.text)
+                for item in response_obj.get('items', []):
+                    route_domain = dict(
+                        id=int(item['id']),
+                        name=item['name'],
+                        partition=folder,
+                        vlans=set(item.get('vlans', []))
+                    )
+                    by_id[route_domain['id']] = route_domain
+                    by_name[route_domain['name']] = route_domain
+            elif response.status_code != 404:
+                raise RouteQueryException(response.text)
+
+            self._partitions[folder] = (by_id, by_name)
+            return self._partitions[folder]
+
+    def by_id(self, folder='Common', route_domain_id=0):
+        """ Get route domain by id """
+        return self._load(folder)[0].get(int(route_domain_id))
+
+    def by_name(self, folder='Common', name=None):
+        """ Get route domain by name """
+        return self._load(folder)[1].get(name)
+
+    def add_vlan(self, route_domain, name):
+        """ Add VLAN to route domain """
+        with self._lock:
+            if name in route_domain['vlans']:
+                return False
+
+            vlans = dict()
+            vlans['vlans'] = sorted(route_domain['vlans'] | set([name]))
+            request_url = self._uri + '/net/route-domain/'
+            request_url += '~' + route_domain['partition']
+            request_url += '~' + route_domain['name']
+            response = self.api.put(
+                request_url, data=json.dumps(vlans),
+                timeout=CONNECTION_TIMEOUT)
+            if response.status_code < 400:
+                route_domain['vlans'].add(name)
+                return True
+            else:
+                raise RouteUpdateException(response.text)
+
+
 class BigIpCommon(object):
     def __init__(self, module):
         self._username = module.params.get('user')
@@ -228,19 +642,27 @@ class BigIpCommon(object):
         if not self._self_ip:
             self._self_ip = self._address
 
-        self._formatted_name = "/Common/%s" % (self._self_ip.replace('/', '_'))
+        # Bulk runs with self_ips name no single selfip
+        if self._self_ip:
+            self._formatted_name = "/Common/%s" % (self._self_ip.replace('/', '_'))
+        else:
+            self._formatted_name = None
 
 
 class BigIpIControl(BigIpCommon):
     def __init__(self, module):
         super(BigIpIControl, self).__init__(module)
 
-        self.api = bigsuds.BIGIP(
-            hostname=self._hostname,
-            username=self._username,
-            password=self._password,
-            debug=True
-        )
+        self.api = icontrol_client(self._hostname, self._username, self._password)
+        self._batch = None
+
+    def _call(self, method, **kwargs):
+        # Changes are collected while a batch is open and are otherwise
+        # sent straight away
+        if self._batch is None:
+            method(**kwargs)
+        else:
+            self._batch.add(method, **kwargs)
 
     def read(self):
         try:
@@ -267,7 +689,8 @@ class BigIpIControl(BigIpCommon):
 
     @floating_state.setter
     def floating_state(self, val):
-        self.api.Networking.SelfIPV2.set_floating_state(
+        self._call(
+            self.api.Networking.SelfIPV2.set_floating_state,
             self_ips=[self._self_ip],
             states=[val]
         )
@@ -278,7 +701,8 @@ class BigIpIControl(BigIpCommon):
 
     @netmask.setter
     def netmask(self, val):
-        self.api.Networking.SelfIPV2.set_netmask(
+        self._call(
+            self.api.Networking.SelfIPV2.set_netmask,
             self_ips=[self._self_ip],
             netmasks=[val]
         )
@@ -289,7 +713,8 @@ class BigIpIControl(BigIpCommon):
 
     @traffic_group.setter
     def traffic_group(self, val):
-        self.api.Networking.SelfIPV2.set_traffic_group(
+        self._call(
+            self.api.Networking.SelfIPV2.set_traffic_group,
             self_ips=[self._self_ip],
             traffic_groups=[val]
         )
@@ -300,13 +725,15 @@ class BigIpIControl(BigIpCommon):
 
     @vlan.setter
     def vlan(self, val):
-        self.api.Networking.SelfIPV2.set_vlan(
+        self._call(
+            self.api.Networking.SelfIPV2.set_vlan,
             self_ips=[self._self_ip],
             vlan_names=[val]
         )
 
     def _create(self):
-        self.api.Networking.SelfIPV2.create(
+        self._call(
+            self.api.Networking.SelfIPV2.create,
             self_ips=[self._self_ip],
             vlan_names=[self._vlan],
             addresses=[self._address],
@@ -315,6 +742,12 @@ class BigIpIControl(BigIpCommon):
             floating_states=[self._floating_state]
         )
 
+    def _delete(self):
+        self._call(
+            self.api.Networking.SelfIPV2.delete_self_ip,
+            self_ips=[self._self_ip]
+        )
+
     def absent(self):
         current = self.read()
 
@@ -327,6 +760,18 @@ class BigIpIControl(BigIpCommon):
         return True
 
     def present(self):
+        # The changes to the self IP are submitted together, so that it is
+        # never left with only some of its settings applied
+        self._batch = SoapBatch(self.api)
+        try:
+            changed = self._present()
+            self._batch.submit()
+        finally:
+            self._batch = None
+
+        return changed
+
+    def _present(self):
         changed = False
         current = self.read()
 
@@ -335,7 +780,11 @@ class BigIpIControl(BigIpCommon):
 
         if self._address:
             if not self.address:
+                # The create is only queued in the batch, so there is no
+                # self IP yet whose other attributes could be compared. It
+                # is created with all of them anyway.
                 self._create()
+                return True
             elif self.address != self._address:
                 # There is no set address, so we need to delete the address
                 # and then create a new one
@@ -374,11 +823,13 @@ class BigIpRest(BigIpCommon):
         super(BigIpRest, self).__init__(module)
 
         self._uri = 'https://%s/mgmt/tm' % self._hostname
+        self._concurrency = module.params.get('concurrency') or 1
 
         self.api = self._get_icr_session(
             self._hostname, self._username, self._password,
             validate_certs=self._validate_certs
         )
+        self.domains = RouteDomainIndex(self.api, self._uri)
 
     def icr_link(self, selfLink):
         """ Create iControl REST link """
@@ -386,16 +837,15 @@ class BigIpRest(BigIpCommon):
 
     def _get_icr_session(self, hostname, username, password, validate_certs=False, timeout=None):
         """ Get iControl REST Session """
-        icr_session = requests.session()
-        icr_session.auth = (username, password)
-        icr_session.verify = validate_certs
-        icr_session.headers.update({'Content-Type': 'application/json'})
         if timeout:
             socket.setdefaulttimeout(timeout)
         else:
             socket.setdefaulttimeout(CONNECTION_TIMEOUT)
 
-        return icr_session
+        # Every worker of a bulk run keeps its own connection open
+        pool_size = max(REST_POOL_SIZE, self._concurrency)
+        return icr_session(hostname, username, password, validate_certs,
+                           pool_size=pool_size)
 
     def absent(self):
         if self._vlan:
@@ -415,41 +865,218 @@ class BigIpRest(BigIpCommon):
         return changed
 
     def present(self):
-        changed = False
+        # The selfip is read once and everything that differs is then
+        # changed with a single request
+        current = self.snapshot(self._self_ip)
 
         if self._address:
-            if not self.get_addr(self._self_ip):
-                self.create(self._self_ip, self._address, self._netmask,
-                            self._vlan, self._floating_state, self._traffic_group
-                            )
-            elif self.address != self._address:
+            if current is None:
+                return self.create(self._self_ip, self._address, self._netmask,
+                                   self._vlan, self._floating_state == 'STATE_ENABLED',
+                                   self._traffic_group
+                                   )
+            elif current['address'] != self._address:
                 # There is no set address, so we need to delete the address
                 # and then create a new one
-                self._delete(self._self_ip)
+                self.delete(name=self._self_ip)
                 self.create(self._self_ip, self._address, self._netmask,
-                            self._vlan, self._floating_state, self._traffic_group
+                            self._vlan, self._floating_state == 'STATE_ENABLED',
+                            self._traffic_group
                             )
 
                 # Creating the new address means we can skip the remaining
                 # steps because they would be redundant
                 return True
 
-        if self._vlan:
-            if self.get_vlan(self._self_ip) != self._vlan:
-                self.set_vlan(self._self_ip, self._vlan)
-                changed = True
+        if current is None:
+            return False
 
-        if self._netmask:
-            if self.get_mask(self._self_ip) != self._netmask:
-                self.set_mask(self._self_ip, self._netmask)
-                changed = True
+        payload = self.changes(current, self._vlan, self._netmask,
+                               self._traffic_group)
+        if not payload:
+            return False
 
-        if self._traffic_group:
-            if self.get_traffic_group(self._self_ip) != self._traffic_group:
-                self.set_traffic_group(self._self_ip, self._traffic_group)
-                changed = True
+        return self.update(self._self_ip, payload)
 
-        return changed
+    def changes(self, current, vlan=None, netmask=None, traffic_group=None,
+                floating=None):
+        """ Get the selfip attributes that differ from a snapshot """
+        payload = dict()
+
+        # BIG-IP reports the vlan and traffic group with their folder, which
+        # is not given in the module parameters
+        if vlan and \
+           os.path.basename(current['vlan'] or '') != os.path.basename(vlan):
+            payload['vlan'] = vlan
+
+        if netmask and current['netmask'] != netmask:
+            net = netaddr.IPNetwork(
+                strip_domain_address(current['address']) + '/' + netmask)
+            payload['address'] = current['address'] + '/' + str(net.prefixlen)
+
+        if traffic_group and \
+           os.path.basename(current['traffic_group'] or '') != \
+           os.path.basename(traffic_group):
+            payload['trafficGroup'] = traffic_group
+
+        if floating is not None and current['floating'] != floating:
+            if floating:
+                payload['floating'] = 'enabled'
+            else:
+                payload['floating'] = 'disabled'
+
+        return payload
+
+    def reconcile(self, self_ips, purge=False):
+        """ Converge the selfips of the partition on the self_ips list
+
+        The partition is listed once and indexed, the creates, updates and
+        deletes are worked out from the index, and are then applied a few
+        at a time.
+        """
+        index = SelfIPIndex(self.get_selfips())
+        wanted = [self._desired(x) for x in self_ips]
+        names = set(x['name'] for x in wanted)
+
+        delete = dict()
+        create = []
+        update = []
+
+        if purge:
+            vlans = set(os.path.basename(x['vlan']) for x in wanted)
+            for vlan in vlans:
+                for current in index.by_vlan.get(vlan, []):
+                    if current['name'] not in names:
+                        delete[current['name']] = current
+
+        for want in wanted:
+            current = index.by_name.get(want['name'])
+
+            if current is None:
+                create.append(want)
+            elif current['address'] != want['address']:
+                # There is no set address, so the selfip is deleted and
+                # created again
+                delete[current['name']] = current
+                create.append(want)
+            else:
+                payload = self.changes(current, want['vlan'], want['netmask'],
+                                       want['traffic_group'], want['floating'])
+                if payload:
+                    update.append((want['name'], payload))
+
+        # The deletes are all known by now, so an address is only in use if
+        # it is held by a self IP that is neither listed nor deleted, or is
+        # asked for by two entries of the list
+        wanted_by = dict()
+        for want in wanted:
+            other = wanted_by.setdefault(want['address'], want['name'])
+            if other != want['name']:
+                raise SelfIPBulkException(
+                    "Address %s is given to both self IP %s and self IP %s" % (
+                        want['address'], other, want['name']))
+
+            owner = index.by_address.get(want['address'])
+            if owner and owner['name'] != want['name'] and \
+               owner['name'] not in names and owner['name'] not in delete:
+                raise SelfIPBulkException(
+                    "Address %s of self IP %s is in use by self IP %s" % (
+                        want['address'], want['name'], owner['name']))
+
+        self._apply_deletes(delete.values())
+
+        # A floating address needs a non-floating address on its network,
+        # so those are created first
+        self._run_phase(self._create_desired,
+                        [x for x in create if not x['floating']])
+        self._run_phase(self._create_desired,
+                        [x for x in create if x['floating']])
+        self._run_phase(lambda x: self.update(x[0], x[1]), update)
+
+        return dict(
+            created=sorted(x['name'] for x in create),
+            updated=sorted(x[0] for x in update),
+            deleted=sorted(delete)
+        )
+
+    def remove(self, self_ips):
+        """ Delete the selfips of the self_ips list """
+        index = SelfIPIndex(self.get_selfips())
+
+        delete = dict()
+        for item in self_ips:
+            name = item.get('name') or item.get('address')
+            if name in index.by_name:
+                delete[name] = index.by_name[name]
+
+        self._apply_deletes(delete.values())
+        return dict(deleted=sorted(delete))
+
+    def _desired(self, item):
+        """ Fill in the defaults of an entry of self_ips """
+        for key in ('address', 'netmask', 'vlan', 'traffic_group'):
+            if not item.get(key):
+                raise SelfIPBulkException(
+                    "The %s of every entry in self_ips is required" % key)
+
+        return dict(
+            name=item.get('name') or item['address'],
+            address=item['address'],
+            netmask=str(item['netmask']),
+            vlan=item['vlan'],
+            traffic_group=item['traffic_group'],
+            floating=item.get('floating_state', 'disabled') == 'enabled'
+        )
+
+    def _create_desired(self, want):
+        self.create(want['name'], want['address'], want['netmask'],
+                    want['vlan'], want['floating'], want['traffic_group'])
+
+    def _apply_deletes(self, selfips):
+        # Floating addresses are removed before the non-floating addresses
+        # that they depend on
+        self._run_phase(lambda x: self.delete(name=x['name']),
+                        [x for x in selfips if x['floating']])
+        self._run_phase(lambda x: self.delete(name=x['name']),
+                        [x for x in selfips if not x['floating']])
+
+    def _run_phase(self, func, items, error=SelfIPBulkException):
+        """ Call func for every item, a few at a time
+
+        The phase ends once every item has been handled, and the errors of
+        all of the items that failed are then raised together, so that no
+        later phase is started.
+        """
+        errors = []
+        queue = Queue()
+
+        for item in items:
+            queue.put(item)
+
+        def worker():
+            while True:
+                item = queue.get()
+                if item is None:
+                    break
+
+                try:
+                    func(item)
+                except Exception, e:
+                    errors.append(str(e))
+
+        workers = []
+        for x in range(max(1, min(self._concurrency, len(items)))):
+            queue.put(None)
+            thread = threading.Thread(target=worker)
+            thread.daemon = True
+            thread.start()
+            workers.append(thread)
+
+        for thread in workers:
+            thread.join()
+
+        if errors:
+            raise error('; '.join(errors))
 
     def create(self, name=None, ip_address=None, netmask=None,
                vlan_name=None, floating=False, traffic_group=None,
@@ -518,48 +1145,21 @@ class BigIpRest(BigIpCommon):
     def add_vlan_to_domain(self, name=None, folder='Common'):
         """ Add VLANs to Domain """
         folder = str(folder).replace('/', '')
-        existing_vlans = self.get_vlans_in_domain(folder=folder)
-        if name not in existing_vlans:
-            existing_vlans.append(name)
-            vlans = dict()
-            vlans['vlans'] = existing_vlans
-            request_url = self._uri + '/net/route-domain/'
-            request_url += '~' + folder + '~' + folder
-            response = self.api.put(
-                request_url, data=json.dumps(vlans),
-                timeout=CONNECTION_TIMEOUT)
-            if response.status_code < 400:
-                return True
-            else:
-                raise RouteUpdateException(response.text)
-        return False
+        route_domain = self.domains.by_name(folder=folder, name=folder)
+        if not route_domain:
+            raise RouteUpdateException("Cannot get route domain %s" % folder)
+
+        # The index serializes the update, as the vlans of the route domain
+        # are replaced as a whole
+        return self.domains.add_vlan(route_domain, name)
 
     def get_vlans_in_domain(self, folder='Common'):
         """ Get VLANs in Domain """
         folder = str(folder).replace('/', '')
-        request_url = self._uri + \
-            '/net/route-domain?$select=name,partition,vlans'
-        if folder:
-            request_filter = 'partition eq ' + folder
-            request_url += '&$filter=' + request_filter
-        response = self.api.get(request_url, timeout=CONNECTION_TIMEOUT)
-
-        if response.status_code < 400:
-            response_obj = json.loads(response.text)
-            if 'items' in response_obj:
-                vlans = []
-                folder = str(folder).replace('/', '')
-                for route_domain in response_obj['items']:
-                    if route_domain['name'] == folder:
-                        if 'vlans' in route_domain:
-                            for vlan in route_domain['vlans']:
-                                vlans.append(vlan)
-                return vlans
+        route_domain = self.domains.by_name(folder=folder, name=folder)
+        if not route_domain:
             return []
-        else:
-            if response.status_code != 404:
-                raise RouteQueryException(response.text)
-        return []
+        return sorted(route_domain['vlans'])
 
     def delete(self, name=None, folder='Common'):
         """ Delete selfip """
@@ -605,23 +1205,24 @@ class BigIpRest(BigIpCommon):
                             else:
                                 nonfloat_to_delete.append(
                                     self.icr_link(selfip['selfLink']))
-                    for selfip in float_to_delete:
-                        del_res = self.api.delete(
-                            selfip, timeout=CONNECTION_TIMEOUT)
-                        if del_res.status_code > 399 and\
-                           del_res.status_code != 404:
-                            raise SelfIPDeleteException(del_res.text)
-                    for selfip in nonfloat_to_delete:
-                        del_res = self.api.delete(
-                            selfip, timeout=CONNECTION_TIMEOUT)
-                        if del_res.status_code > 399 and\
-                           del_res.status_code != 404:
-                            raise SelfIPDeleteException(del_res.text)
+                    # The floating addresses are all gone before the
+                    # non-floating addresses are deleted
+                    self._run_phase(self._delete_link, float_to_delete,
+                                    SelfIPDeleteException)
+                    self._run_phase(self._delete_link, nonfloat_to_delete,
+                                    SelfIPDeleteException)
                 return True
             else:
                 raise SelfIPQueryException(response.text)
         return False
 
+    def _delete_link(self, link):
+        """ Delete selfip by link """
+        del_res = self.api.delete(link, timeout=CONNECTION_TIMEOUT)
+        if del_res.status_code > 399 and\
+           del_res.status_code != 404:
+            raise SelfIPDeleteException(del_res.text)
+
     def get_selfips(self, folder='Common', vlan=None):
         """ Get selfips """
         folder = str(folder).replace('/', '')
@@ -664,6 +1265,36 @@ class BigIpRest(BigIpCommon):
             raise SelfIPQueryException(response.text)
         return return_list
 
+    def snapshot(self, name=None, folder='Common'):
+        """ Get selfip address, netmask, vlan and traffic group """
+        if name:
+            folder = str(folder).replace('/', '')
+            request_url = self._uri + '/net/self/'
+            request_url += '~' + folder + '~' + name
+            request_url += '?$select=name,address,vlan,trafficGroup,floating'
+            response = self.api.get(
+                request_url, timeout=CONNECTION_TIMEOUT)
+            if response.status_code < 400:
+                return selfip_snapshot(json.loads(response.text))
+            elif response.status_code != 404:
+                raise SelfIPQueryException(response.text)
+        return None
+
+    def update(self, name=None, payload=None, folder='Common'):
+        """ Update selfip attributes """
+        if name and payload:
+            folder = str(folder).replace('/', '')
+            request_url = self._uri + '/net/self/'
+            request_url += '~' + folder + '~' + name
+            response = self.api.patch(
+                request_url, data=json.dumps(payload),
+                timeout=CONNECTION_TIMEOUT)
+            if response.status_code < 400:
+                return True
+            else:
+                raise SelfIPUpdateException(response.text)
+        return False
+
     def get_addr(self, name=None, folder='Common'):
         """ Get selfip addr """
         folder = str(folder).replace('/', '')
@@ -869,22 +1500,33 @@ class BigIpRest(BigIpCommon):
 def main():
     changed = False
     icontrol = False
+    result = dict()
 
     module = AnsibleModule(
         argument_spec=dict(
-            address=dict(required=True, default=None),
+            address=dict(required=False, default=None),
+            concurrency=dict(default=4, type='int'),
             connection=dict(default='rest', choices=['icontrol', 'rest']),
             floating_state=dict(required=False, default='disabled'),
             name=dict(required=False, default=None),
-            netmask=dict(required=True),
+            netmask=dict(required=False),
             password=dict(required=True),
+            purge=dict(default='no', type='bool'),
+            self_ips=dict(required=False, type='list'),
             server=dict(required=True),
             state=dict(default='present', choices=['absent', 'present']),
-            traffic_group=dict(required=True),
+            traffic_group=dict(required=False),
             user=dict(required=True),
             validate_certs=dict(default='yes', type='bool'),
-            vlan=dict(required=True)
-        )
+            vlan=dict(required=False)
+        ),
+        mutually_exclusive=[
+            ['address', 'self_ips'],
+            ['name', 'self_ips']
+        ],
+        required_one_of=[
+            ['address', 'self_ips']
+        ]
     )
 
     connection = module.params.get('connection')
@@ -893,6 +1535,15 @@ def main():
     username = module.params.get('user')
     state = module.params.get('state')
     vlan = module.params.get('vlan')
+    self_ips = module.params.get('self_ips')
+
+    if self_ips:
+        if connection != 'rest':
+            module.fail_json(msg="self_ips is only supported with the rest connection")
+    else:
+        for param in ['netmask', 'traffic_group', 'vlan']:
+            if module.params.get(param) is None:
+                module.fail_json(msg="missing required arguments: %s" % param)
 
     try:
         if connection == 'icontrol':
@@ -908,14 +1559,23 @@ def main():
 
             obj = BigIpRest(module)
 
-        if state == "present":
+        if self_ips:
+            if state == "present":
+                result = obj.reconcile(self_ips, module.params.get('purge'))
+            else:
+                result = obj.remove(self_ips)
+            changed = any(result.values())
+        elif state == "present":
             if obj.present():
                 changed = True
         elif state == "absent":
             if obj.absent():
                 changed = True
     except bigsuds.ConnectionError, e:
-        module.fail_json(msg="Could not connect to BIG-IP host %s" % hostname)
+        if icontrol_auth_failed(e):
+            module.fail_json(msg="Could not log in with provided credentials")
+        else:
+            module.fail_json(msg="Could not connect to BIG-IP host %s" % hostname)
     except bigsuds.ServerError, e:
         error = str(e)
 
@@ -935,7 +1595,8 @@ def main():
     except Exception, e:
         module.fail_json(msg=str(e))
 
-    module.exit_json(changed=changed)
+    result.update(icr_stats(obj))
+    module.exit_json(changed=changed, **result)
 
 from ansible.module_utils.basic import *
 
@@ -92,6 +92,10 @@ EXAMPLES = """
 
 import socket
 import time
+import json
+import os
+import shutil
+import tempfile
 
 try:
     import bigsuds
@@ -101,15 +105,104 @@ else:
     bigsuds_found = True
 
 
-def test_icontrol(username, password, hostname):
-    client = bigsuds.BIGIP(
+# WSDLs downloaded by iControl clients are cached here, per BIG-IP version
+WSDL_CACHE_DIR = '~/.ansible/bigip_wsdl'
+
+# Seconds that the recorded version of a BIG-IP is trusted
+WSDL_CACHE_TTL = 86400
+
+
+def wsdl_cache_dir(hostname):
+    """Returns the WSDL cache of hostname, or None when it is not known
+
+    The cache is not known until the version of the BIG-IP has been
+    recorded, and again once the recorded version is older than
+    WSDL_CACHE_TTL, since the BIG-IP may have been upgraded.
+    """
+    base = os.path.expanduser(WSDL_CACHE_DIR)
+    try:
+        with open(os.path.join(base, 'versions.json')) as fh:
+            entry = json.load(fh)[hostname]
+    except (IOError, ValueError, KeyError):
+        return None
+
+    if time.time() - entry['checked'] > WSDL_CACHE_TTL:
+        return None
+    return os.path.join(base, '%s-%s' % (hostname, entry['version']))
+
+
+def remember_version(hostname, version):
+    base = os.path.expanduser(WSDL_CACHE_DIR)
+    path = os.path.join(base, 'versions.json')
+
+    try:
+        with open(path) as fh:
+            versions = json.load(fh)
+    except (IOError, ValueError):
+        versions = {}
+
+    versions[hostname] = dict(version=version, checked=time.time())
+
+    if not os.path.isdir(base):
+        os.makedirs(base, 0700)
+
+    fd, tmp = tempfile.mkstemp(dir=base)
+    with os.fdopen(fd, 'w') as fh:
+        json.dump(versions, fh)
+    os.rename(tmp, path)
+
+
+def icontrol_client(hostname, username, password):
+    """Returns a bigsuds client that keeps the WSDLs it parses on disk
+
+    Each iControl interface otherwise downloads and parses its WSDL every
+    time a module runs. The cache is kept per BIG-IP and version, so the
+    version is looked up first when it is not yet known. The WSDL parsed
+    to look it up is cached in a directory of its own, which is moved into
+    place once the version is known.
+    """
+    cachedir = wsdl_cache_dir(hostname)
+    if cachedir is None:
+        base = os.path.expanduser(WSDL_CACHE_DIR)
+        if not os.path.isdir(base):
+            os.makedirs(base, 0700)
+
+        tmpdir = tempfile.mkdtemp(dir=base)
+        try:
+            api = bigsuds.BIGIP(
+                hostname=hostname,
+                username=username,
+                password=password,
+                debug=True,
+                cachedir=tmpdir
+            )
+            remember_version(hostname, api.System.SystemInfo.get_version())
+            cachedir = wsdl_cache_dir(hostname)
+            try:
+                os.rename(tmpdir, cachedir)
+            except OSError:
+                # The cache of this version already exists
+                pass
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+    return bigsuds.BIGIP(
         hostname=hostname,
         username=username,
         password=password,
-        debug=True
+        debug=True,
+        cachedir=cachedir
     )
 
+
+def test_icontrol(username, password, hostname):
+    # A warm WSDL cache means that the BIG-IP was reached recently, so it
+    # is not probed again
+    if wsdl_cache_dir(hostname):
+        return True
+
     try:
+        client = icontrol_client(hostname, username, password)
         response = client.Management.LicenseAdministration.get_license_activation_status()
         if 'STATE' in response:
             return True
@@ -119,6 +212,16 @@ def test_icontrol(username, password, hostname):
         return False
 
 
+def icontrol_auth_failed(error):
+    """Checks whether an iControl connection error was caused by a bad login
+
+    The credentials are not probed up front when the WSDL cache is warm,
+    so a bad login only shows up on the first real call.
+    """
+    text = str(error)
+    return 'credentials' in text or '401' in text
+
+
 class BigIpCommon(object):
     def __init__(self, module):
         self._username = module.params.get('user')
@@ -134,12 +237,7 @@ class BigIpIControl(BigIpCommon):
     def __init__(self, module):
         super(BigIpIControl, self).__init__(module)
 
-        self.api = bigsuds.BIGIP(
-            hostname=self._hostname,
-            username=self._username,
-            password=self._password,
-            debug=True
-        )
+        self.api = icontrol_client(self._hostname, self._username, self._password)
 
         # We do not support all services because disabling/stopping some of
         # them would break the system
@@ -284,7 +382,10 @@ def main():
             if obj.restarted():
                 changed = True
     except bigsuds.ConnectionError, e:
-        module.fail_json(msg="Could not connect to BIG-IP host %s" % hostname)
+        if icontrol_auth_failed(e):
+            module.fail_json(msg="Could not log in with provided credentials")
+        else:
+            module.fail_json(msg="Could not connect to BIG-IP host %s" % hostname)
     except socket.timeout, e:
         module.fail_json(msg="Timed out connecting to the BIG-IP")
     except Exception, e:
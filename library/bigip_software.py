@@ -24,18 +24,36 @@ description:
    - Manage BIG-IP software versions and hotfixes
 version_added: "2.0"
 options:
+  checkpoint:
+    description:
+      - Local file that records the stage reached by each device when
+        C(devices) is given. An interrupted rollout that is run again resumes
+        each device from its last completed stage. The file is removed once
+        the rollout succeeds on every device.
+    required: false
+    default: ~/.ansible/tmp/bigip_software_rollout.json
   connection:
     description:
-      - The connection used to interface with the BIG-IP
+      - The connection used to interface with the BIG-IP. When C(rest), the
+        images are uploaded over iControl REST in raw chunks; all other
+        operations continue to use iControl SOAP.
     required: false
     default: icontrol
     choices: [ "rest", "icontrol" ]
+  devices:
+    description:
+      - List of BIG-IP hosts to roll the software out to in one task. Uploads,
+        installs and reboots are pipelined across the devices. When given,
+        C(server) is not used.
+    required: false
+    default: None
   force:
     description:
       - If C(yes) will upload the file every time and replace the file on the
         device. If C(no), the file will only be uploaded if it does not already
-        exist. Generally should be C(yes) only in cases where you have reason
-        to believe that the image was corrupted during upload.
+        exist, or if the checksum the device reports for it does not match
+        the one it reported after this module last uploaded the local file. Generally should be C(yes) only in cases where you have
+        reason to believe that the image was corrupted during upload.
     required: false
     default: no
     choices:
@@ -49,14 +67,39 @@ options:
     default: None
     aliases:
       - hotfix_image
+  install_timeout:
+    description:
+      - The number of seconds to wait for an install to complete before
+        failing.
+    required: false
+    default: 3600
   password:
     description:
       - BIG-IP password
     required: true
+  reboot_timeout:
+    description:
+      - The number of seconds to wait for the device to come back on the
+        new volume after a reboot before failing.
+    required: false
+    default: 1800
+  reboot_wave_size:
+    description:
+      - When C(devices) is given, the number of devices rebooted together.
+        A wave does not reboot until every device in the previous wave has
+        finished.
+    required: false
+    default: 1
+  rollout_concurrency:
+    description:
+      - When C(devices) is given, the maximum number of devices that images
+        are uploaded to at the same time.
+    required: false
+    default: 4
   server:
     description:
-      - BIG-IP host
-    required: true
+      - BIG-IP host. Required unless C(devices) is given.
+    required: false
   state:
     description:
       - When C(installed), ensures that the software is uploaded and installed,
@@ -79,6 +122,12 @@ options:
     required: false
     aliases:
       - base_image
+  upload_concurrency:
+    description:
+      - The number of chunks of an image that may be in flight at once when
+        uploading over the C(rest) connection.
+    required: false
+    default: 4
   user:
     description:
       - BIG-IP username
@@ -101,9 +150,20 @@ notes:
      interface. This is as easy as pip install bigsuds
    - Requires the lxml Python package on the host. This can be installed
      with pip install lxml
+   - Requires the requests Python package on the host if using the REST
+     interface. This is as easy as pip install requests
    - https://devcentral.f5.com/articles/icontrol-101-06-file-transfer-apis
-
-requirements: [ "bigsuds", "lxml" ]
+   - The product, version and build read from each ISO are cached in
+     ~/.ansible/tmp/bigip_software_iso_info.json on the Ansible host. The
+     cache is keyed by the path, size and modification time of the image
+   - The MD5 of each local image, and the checksums devices report for it
+     after it is uploaded, are cached in
+     ~/.ansible/tmp/bigip_software_digest.json in the same way
+   - An image that is already on the device, but whose checksum matches
+     neither the MD5 of the local file nor a checksum learned from an
+     earlier upload of it, is left in place and reported in C(unverified)
+
+requirements: [ "bigsuds", "lxml", "requests" ]
 author: Tim Rupp <caphrim007@gmail.com> (@caphrim007)
 '''
 
@@ -203,17 +263,40 @@ EXAMPLES = """
       hotfix: "/root/Hotfix-BIGIP-11.6.0.3.0.412-HF3.iso"
       volume: "HD1.1"
       state: "activated"
+
+- name: Activate base image on a fleet, two reboots at a time
+  bigip_software:
+      devices:
+          - "bigip01.localhost.localdomain"
+          - "bigip02.localhost.localdomain"
+          - "bigip03.localhost.localdomain"
+          - "bigip04.localhost.localdomain"
+      user: "admin"
+      password: "admin"
+      software: "/root/BIGIP-11.6.0.0.0.401.iso"
+      volume: "HD1.1"
+      rollout_concurrency: 2
+      reboot_wave_size: 2
+      state: "activated"
+  delegate_to: localhost
 """
 
 import base64
+import hashlib
 import socket
 import os
+import random
+import re
 import time
 import subprocess
 import io
+import json
+import mmap
+import tempfile
 import urllib
 import struct
 import datetime
+import threading
 
 from lxml import etree
 
@@ -224,9 +307,15 @@ except ImportError:
     BIGSUDS_AVAILABLE = False
 
 try:
-    from cStringIO import StringIO
+    import requests
+    REQUESTS_AVAILABLE = True
+except ImportError:
+    REQUESTS_AVAILABLE = False
+
+try:
+    from Queue import Queue, Empty
 except ImportError:
-    from StringIO import StringIO
+    from queue import Queue, Empty
 
 SECTOR_SIZE = 2048
 TRANSPORTS = ['rest', 'soap']
@@ -235,6 +324,61 @@ STATES = ['absent', 'activated', 'installed', 'present']
 # Size of chunks of data to read and send via the iControl API
 CHUNK_SIZE = 512 * 1024
 
+# Defaults for uploads done over iControl REST
+UPLOAD_CONCURRENCY = 4
+UPLOAD_RETRIES = 5
+UPLOAD_TIMEOUT = 60
+
+# Number of times an interrupted upload is run again from the last
+# acknowledged offset before the task fails
+UPLOAD_ATTEMPTS = 3
+
+# Deadlines, in seconds, for each phase of waiting on the device
+INSTALL_TIMEOUT = 3600
+REBOOT_TIMEOUT = 1800
+IMAGES_TIMEOUT = 600
+
+# Defaults for rolling software out to many devices at once
+ROLLOUT_CONCURRENCY = 4
+REBOOT_WAVE_SIZE = 1
+ROLLOUT_CHECKPOINT = '~/.ansible/tmp/bigip_software_rollout.json'
+
+# Order of the stages a device passes through during a rollout
+ROLLOUT_STAGES = ['pending', 'uploaded', 'installed', 'activated']
+
+# Port that must accept connections before the SOAP API is polled
+ICONTROL_PORT = 443
+
+# Location of the local cache of ISO metadata. Entries are keyed by the
+# path, size and mtime of the image so that a changed file is re-read.
+ISO_CACHE_FILE = '~/.ansible/tmp/bigip_software_iso_info.json'
+
+# Location of the local cache of image digests, keyed the same way as the
+# ISO metadata cache
+DIGEST_CACHE_FILE = '~/.ansible/tmp/bigip_software_digest.json'
+
+# Size of the blocks read when computing the digest of an image
+DIGEST_BLOCK_SIZE = 1024 * 1024
+
+# Precompiled struct formats used when parsing the ISO9660 image
+STRUCTS = dict()
+
+
+def _compiled_struct(fmt):
+    try:
+        return STRUCTS[fmt]
+    except KeyError:
+        STRUCTS[fmt] = struct.Struct(fmt)
+        return STRUCTS[fmt]
+
+
+def _buffer_view(obj, offset, size):
+    try:
+        # Python 2 mmap objects only support the old buffer interface
+        return buffer(obj, offset, size)
+    except NameError:
+        return memoryview(obj)[offset:offset + size]
+
 
 class ActiveVolumeError(Exception):
     pass
@@ -252,6 +396,73 @@ class SoftwareInstallError(Exception):
     pass
 
 
+class SoftwareUploadError(Exception):
+    def __init__(self, msg, permanent=False):
+        super(SoftwareUploadError, self).__init__(msg)
+
+        # Permanent errors, such as a rejected request, fail the same way
+        # if the upload is tried again
+        self.permanent = permanent
+
+
+class WaitTimeoutError(Exception):
+    pass
+
+
+class RolloutError(Exception):
+    def __init__(self, devices):
+        self.devices = devices
+
+    def __str__(self):
+        failed = sorted(k for k, v in self.devices.items() if v['error'])
+        return "The rollout failed on %s" % ', '.join(failed)
+
+
+def read_json_file(path):
+    path = os.path.expanduser(path)
+    try:
+        with open(path, 'r') as fh:
+            return json.load(fh)
+    except (IOError, OSError, ValueError):
+        return dict()
+
+
+def update_json_cache(path, key, value):
+    """Stores a value in a cache of local files keyed by path:size:mtime
+
+    Entries for older versions of the same file are dropped.
+    """
+    prefix = key.rsplit(':', 2)[0] + ':'
+
+    cache = read_json_file(path)
+    for k in list(cache.keys()):
+        if k.startswith(prefix):
+            del cache[k]
+    cache[key] = value
+
+    try:
+        write_json_file(path, cache)
+    except (IOError, OSError):
+        # The cache is only an optimization
+        pass
+
+
+def write_json_file(path, data):
+    """Writes data to a local JSON file
+
+    The data is written to a temporary file and renamed into place so that
+    concurrent readers never see a partially written file.
+    """
+    path = os.path.expanduser(path)
+    dirname = os.path.dirname(path)
+    if not os.path.isdir(dirname):
+        os.makedirs(dirname)
+    fd, tmp = tempfile.mkstemp(dir=dirname)
+    with os.fdopen(fd, 'w') as fh:
+        json.dump(data, fh)
+    os.rename(tmp, path)
+
+
 class ISO9660IOError(IOError):
     def __init__(self, path):
         self.path = path
@@ -262,14 +473,14 @@ class ISO9660IOError(IOError):
 
 class ISO9660(object):
     def __init__(self, url):
-        self._buff  = None #input buffer
+        self._pos   = 0    #read cursor into the image
         self._root  = None #root node
         self._pvd   = {}   #primary volume descriptor
         self._paths = []   #path table
 
         self._url   = url
-        if not hasattr(self, '_get_sector'): #it might have been set by a subclass
-            self._get_sector = self._get_sector_file
+        self._map   = None
+        self._open_map()
 
         ### Volume Descriptors
         sector = 0x10
@@ -308,6 +519,17 @@ class ISO9660(object):
 
         assert l0 == 0
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
     ##
     ## Retrieve file contents as a string
     ##
@@ -326,12 +548,21 @@ class ISO9660(object):
         f = self._search_dir_children(parent_dir, filename)
 
         self._get_sector(f['ex_loc'], f['ex_len'])
-        return self._unpack_raw(f['ex_len'])
+        return bytes(self._unpack_raw(f['ex_len']))
 
-    def _get_sector_file(self, sector, length):
+    def _open_map(self):
+        # The image is mapped once and every sector is read straight out of
+        # the page cache, rather than re-opening the (multi-GB) file and
+        # copying each sector into a new buffer.
         with open(self._url, 'rb') as f:
-            f.seek(sector*SECTOR_SIZE)
-            self._buff = StringIO(f.read(length))
+            try:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty files cannot be mapped
+                raise ISO9660IOError(self._url)
+
+    def _get_sector(self, sector, length):
+        self._pos = sector*SECTOR_SIZE
 
     ##
     ## Return the record for final directory in a path
@@ -462,7 +693,9 @@ class ISO9660(object):
     ## Datatypes
     ##
     def _unpack_raw(self, l):
-        return self._buff.read(l)
+        view = _buffer_view(self._map, self._pos, l)
+        self._pos += l
+        return view
 
     #both-endian
     def _unpack_both(self, st):
@@ -472,25 +705,25 @@ class ISO9660(object):
         return a
 
     def _unpack_string(self, l):
-        return self._buff.read(l).rstrip(' ')
+        return bytes(self._unpack_raw(l)).rstrip(' ')
 
     def _unpack(self, st):
         if st[0] not in ('<','>'):
             st = '<' + st
-        d = struct.unpack(st, self._buff.read(struct.calcsize(st)))
+        s = _compiled_struct(st)
+        d = s.unpack_from(self._map, self._pos)
+        self._pos += s.size
         if len(st) == 2:
             return d[0]
         else:
             return d
 
     def _unpack_vd_datetime(self):
-        return self._unpack_raw(17) #TODO
+        return bytes(self._unpack_raw(17)) #TODO
 
     def _unpack_dir_datetime(self):
         epoch = datetime.datetime(1970, 1, 1)
-        date = self._unpack_raw(7)
-        t = [struct.unpack('<B', i)[0] for i in date[:-1]]
-        t.append(struct.unpack('<b', date[-1])[0])
+        t = list(self._unpack('<6Bb'))
         t[0] += 1900
         t_offset = t.pop(-1) * 15 * 60.    # Offset from GMT in 15min intervals, converted to secs
         t_timestamp = (datetime.datetime(*t) - epoch).total_seconds() - t_offset
@@ -499,16 +732,213 @@ class ISO9660(object):
         return t_readable
 
 
+class RestUploader(object):
+    """Uploads a file to the BIG-IP as raw Content-Range chunks
+
+    The first chunk is sent on its own so that the remote file exists before
+    any other writes land in it. The remaining chunks are handed to a pool
+    of threads sharing one keep-alive session, so that up to ``concurrency``
+    chunks are in flight at once.
+
+    Every acknowledged chunk is recorded. A chunk whose connection is dropped
+    is retried from its own offset with an increasing delay, and calling
+    ``run`` again on the same uploader after a failure only sends the chunks
+    that were not acknowledged, instead of the whole file. Acknowledged
+    chunks are not remembered across tasks.
+    """
+
+    def __init__(self, session, uri, filename, chunk_size=CHUNK_SIZE,
+                 concurrency=UPLOAD_CONCURRENCY, retries=UPLOAD_RETRIES,
+                 timeout=UPLOAD_TIMEOUT):
+        self.session = session
+        self.uri = uri
+        self.filename = filename
+        self.chunk_size = chunk_size
+        self.concurrency = max(1, concurrency)
+        self.retries = retries
+        self.timeout = timeout
+        self.size = os.path.getsize(filename)
+        self.acknowledged = set()
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._errors = []
+
+    @property
+    def offset(self):
+        """Offset below which every chunk has been acknowledged"""
+        offset = 0
+        while offset in self.acknowledged:
+            offset += self.chunk_size
+        return min(offset, self.size)
+
+    def pending(self):
+        offsets = range(0, self.size, self.chunk_size)
+        return [x for x in offsets if x not in self.acknowledged]
+
+    def run(self):
+        self._stop.clear()
+        self._errors = []
+
+        # The upload endpoint has no Content-Range for an empty file
+        if self.size == 0:
+            raise SoftwareUploadError("%s is empty" % self.filename,
+                                      permanent=True)
+
+        pending = self.pending()
+        if not pending:
+            return
+
+        with open(self.filename, 'rb') as fh:
+            if 0 in pending:
+                self.send(fh, pending.pop(0))
+
+        queue = Queue()
+        for start in pending:
+            queue.put(start)
+
+        threads = []
+        for x in range(min(self.concurrency, len(pending))):
+            thread = threading.Thread(target=self._worker, args=(queue,))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+
+        for thread in threads:
+            thread.join()
+
+        if self._errors:
+            raise SoftwareUploadError(
+                "Upload of %s failed after byte %s of %s: %s" % (
+                    self.filename, self.offset, self.size, self._errors[0]
+                ),
+                permanent=any(x.permanent for x in self._errors)
+            )
+
+    def send(self, fh, start):
+        fh.seek(start)
+        data = fh.read(self.chunk_size)
+        end = start + len(data) - 1
+
+        headers = {
+            'Content-Type': 'application/octet-stream',
+            'Content-Range': '%s-%s/%s' % (start, end, self.size)
+        }
+
+        for attempt in range(self.retries + 1):
+            if self._stop.is_set():
+                return
+
+            try:
+                resp = self.session.post(self.uri, data=data, headers=headers,
+                                         timeout=self.timeout)
+            except (requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout), e:
+                if attempt == self.retries:
+                    raise SoftwareUploadError(str(e))
+                time.sleep(2 ** attempt)
+                continue
+
+            if resp.status_code >= 500 and attempt < self.retries:
+                time.sleep(2 ** attempt)
+                continue
+            elif resp.status_code >= 500:
+                raise SoftwareUploadError(resp.text)
+            elif resp.status_code >= 400:
+                raise SoftwareUploadError(resp.text, permanent=True)
+
+            with self._lock:
+                self.acknowledged.add(start)
+            return
+
+    def _worker(self, queue):
+        with open(self.filename, 'rb') as fh:
+            while not self._stop.is_set():
+                try:
+                    start = queue.get_nowait()
+                except Empty:
+                    return
+
+                try:
+                    self.send(fh, start)
+                except SoftwareUploadError, e:
+                    with self._lock:
+                        self._errors.append(e)
+                    self._stop.set()
+
+
+def port_open(host, port=ICONTROL_PORT, timeout=2):
+    """Cheap check that the device is accepting TCP connections"""
+    try:
+        sock = socket.create_connection((host, port), timeout)
+    except (socket.error, socket.timeout):
+        return False
+    sock.close()
+    return True
+
+
+class Waiter(object):
+    """Polls a check until it succeeds or the deadline for a phase passes
+
+    The delay between checks starts at ``interval`` and doubles after each
+    unsuccessful check, up to ``max_interval``. A random jitter is applied
+    to every delay so that many devices rebooted at the same time are not
+    polled in lock step.
+
+    If a ``probe`` is given, the check is only run once the probe returns
+    True. This avoids full SOAP requests against a device that is not even
+    accepting connections yet.
+    """
+
+    def __init__(self, phase, timeout, interval=1, max_interval=30,
+                 jitter=0.25, probe=None):
+        self.phase = phase
+        self.timeout = timeout
+        self.interval = interval
+        self.max_interval = max_interval
+        self.jitter = jitter
+        self.probe = probe
+
+    def wait(self, check):
+        deadline = time.time() + self.timeout
+        delay = self.interval
+
+        while True:
+            if self.probe is None or self.probe():
+                if check():
+                    return
+
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise WaitTimeoutError(
+                    "Timed out after %s seconds waiting for %s" % (
+                        self.timeout, self.phase
+                    )
+                )
+
+            sleep = delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+            time.sleep(min(sleep, remaining))
+            delay = min(delay * 2, self.max_interval)
+
+
 class BigIpApiFactory(object):
     def factory(module):
         type = module.params.get('connection')
 
         if type == "rest":
-            module.fail_json(msg='The REST connection is currently not supported')
+            if not BIGSUDS_AVAILABLE:
+                raise Exception("The python bigsuds module is required")
+            if not REQUESTS_AVAILABLE:
+                raise Exception("The python requests module is required")
+            cls = BigIpRestApi
         elif type == "soap":
             if not BIGSUDS_AVAILABLE:
                 raise Exception("The python bigsuds module is required")
-            return BigIpSoapApi(check_mode=module.check_mode, **module.params)
+            cls = BigIpSoapApi
+
+        if module.params.get('devices'):
+            return Rollout(cls, check_mode=module.check_mode, **module.params)
+        return cls(check_mode=module.check_mode, **module.params)
 
     factory = staticmethod(factory)
 
@@ -519,6 +949,15 @@ class BigIpCommon(object):
 
         self.current = dict()
 
+        # Install percentages reported while waiting for installs, and an
+        # optional function that is called with each new percentage
+        self.progress = []
+        self.progress_callback = None
+
+        # Images found on the device whose checksum could not be compared
+        # with the local file
+        self.unverified = set()
+
         if kwargs['hotfix']:
             kwargs['photfix'] = self.iso_info(kwargs['hotfix'])
 
@@ -528,14 +967,19 @@ class BigIpCommon(object):
         self.params = kwargs
 
     def iso_info(self, iso):
+        key = self._iso_cache_key(iso)
+        cache = self._read_iso_cache()
+        if key in cache:
+            return cache[key]
+
         result = dict(
             product=None,
             version=None,
             build=None
         )
 
-        cd = ISO9660(iso)
-        content = cd.get_file('/METADATA.XML')
+        with ISO9660(iso) as cd:
+            content = cd.get_file('/METADATA.XML')
         content = io.BytesIO(content)
 
         context = etree.iterparse(content)
@@ -549,8 +993,49 @@ class BigIpCommon(object):
                 result['version'] = text
             elif elem.tag == 'buildNumber':
                 result['build'] = text
+
+        self._write_iso_cache(key, result)
         return result
 
+    def _iso_cache_key(self, iso):
+        path = os.path.abspath(iso)
+        st = os.stat(path)
+        return "%s:%d:%r" % (path, st.st_size, st.st_mtime)
+
+    def _read_iso_cache(self):
+        return read_json_file(ISO_CACHE_FILE)
+
+    def _write_iso_cache(self, key, info):
+        update_json_cache(ISO_CACHE_FILE, key, info)
+
+    def local_digest(self, iso):
+        """Returns the cached digest entry of a local image
+
+        The MD5 of the image is computed in a single streaming pass the first
+        time an image is seen. The entry also holds the checksums that
+        devices reported for the image after this module uploaded it.
+        """
+        key = self._iso_cache_key(iso)
+        cache = read_json_file(DIGEST_CACHE_FILE)
+        if key in cache:
+            return cache[key]
+
+        md5 = hashlib.md5()
+        with open(iso, 'rb') as fh:
+            for block in iter(lambda: fh.read(DIGEST_BLOCK_SIZE), b''):
+                md5.update(block)
+
+        entry = dict(md5=md5.hexdigest(), device_checksums=[])
+        update_json_cache(DIGEST_CACHE_FILE, key, entry)
+        return entry
+
+    def remember_checksum(self, iso, checksum):
+        entry = self.local_digest(iso)
+        learned = entry.setdefault('device_checksums', [])
+        if checksum != entry['md5'] and checksum not in learned:
+            learned.append(checksum)
+            update_json_cache(DIGEST_CACHE_FILE, self._iso_cache_key(iso), entry)
+
     def flush(self):
         result = dict()
         state = self.params['state']
@@ -563,7 +1048,9 @@ class BigIpCommon(object):
             elif not software:
                 raise NoBaseImageError
 
-        if state == "activated":
+        if self.params['check_mode']:
+            changed = not self.is_current()
+        elif state == "activated":
             changed = self.activated()
         elif state == "installed":
             changed = self.installed()
@@ -577,9 +1064,43 @@ class BigIpCommon(object):
                 current = self.read()
                 result.update(current)
 
+        if self.progress:
+            result['progress'] = self.progress
+
+        if self.unverified:
+            result['unverified'] = sorted(self.unverified)
+
         result.update(dict(changed=changed))
         return result
 
+    def is_current(self):
+        """Checks, without changing the device, that it is already in state
+        """
+        state = self.params['state']
+        force = self.params['force']
+        hotfix = self.params['hotfix']
+        software = self.params['software']
+        volume = self.params['volume']
+
+        if state == 'activated':
+            return self.is_activated() and volume == self.get_active_volume()
+        elif state == 'installed':
+            return self.is_installed()
+        elif state == 'absent':
+            if hotfix and self.image_exists(hotfix, 'hotfix'):
+                return False
+            if software and self.image_exists(software, 'software'):
+                return False
+            return True
+
+        if force:
+            return False
+        if hotfix and not self.is_hotfix_available(hotfix):
+            return False
+        if software and not self.is_software_available(software):
+            return False
+        return True
+
 
 class BigIpSoapApi(BigIpCommon):
     def __init__(self, *args, **kwargs):
@@ -590,33 +1111,65 @@ class BigIpSoapApi(BigIpCommon):
                              kwargs['password'],
                              kwargs['validate_certs'])
 
-    def read(self):
+        # Software inventory shared by all checks until invalidated
+        self._snapshot = None
+
+        # Images uploaded during this run, whose device checksums are
+        # remembered once the device has listed them
+        self._uploaded = []
+
+    def snapshot(self):
+        """Returns the software inventory of the device
+
+        The image list, hotfix list and software status are fetched with
+        bulk calls the first time they are needed and then shared by every
+        check made while evaluating the state. Call invalidate() once the
+        inventory on the device has been changed.
+        """
+        if self._snapshot is None:
+            self._snapshot = self._read_snapshot()
+        return self._snapshot
+
+    def invalidate(self):
+        self._snapshot = None
+
+    def _read_snapshot(self):
+        sm = self.api.System.SoftwareManagement
         result = dict(
+            images=[],
+            hotfixes=[],
             software=[],
-            hotfix=[]
+            hotfix=[],
+            status=[]
         )
 
         try:
-            images = self.api.System.SoftwareManagement.get_software_image_list()
-            for image in images:
-                info = self.api.System.SoftwareManagement.get_software_image(
-                    imageIDs=[image]
+            result['images'] = sm.get_software_image_list()
+            if result['images']:
+                result['software'] = sm.get_software_image(
+                    imageIDs=result['images']
                 )
-                result['software'].append(info[0])
 
-            hotfixes = self.api.System.SoftwareManagement.get_software_hotfix_list()
-            for hotfix in hotfixes:
-                info = self.api.System.SoftwareManagement.get_software_hotfix(
-                    imageIDs=[hotfix]
+            result['hotfixes'] = sm.get_software_hotfix_list()
+            if result['hotfixes']:
+                result['hotfix'] = sm.get_software_hotfix(
+                    imageIDs=result['hotfixes']
                 )
-                result['hotfix'].append(info[0])
         except bigsuds.ServerError:
             pass
 
+        result['status'] = sm.get_all_software_status()
         return result
 
+    def read(self):
+        snapshot = self.snapshot()
+        return dict(
+            software=list(snapshot['software']),
+            hotfix=list(snapshot['hotfix'])
+        )
+
     def get_active_volume(self):
-        softwares = self.api.System.SoftwareManagement.get_all_software_status()
+        softwares = self.snapshot()['status']
         for software in softwares:
             if software['active']:
                 return software['installation_id']['install_volume']
@@ -653,27 +1206,94 @@ class BigIpSoapApi(BigIpCommon):
                     )
                 )
 
+        self.invalidate()
+
+    def find_image(self, filename, kind='software'):
+        """Returns the details the device reports for an uploaded image"""
+        filename = os.path.basename(filename)
+        snapshot = self.snapshot()
+
+        for image in snapshot[kind]:
+            if image['filename'] == filename:
+                return image
+
+        # The details may be missing if the device failed to report them
+        ids = snapshot['images'] if kind == 'software' else snapshot['hotfixes']
+        for image in ids:
+            if image['filename'] == filename:
+                return image
+        return None
+
+    def image_exists(self, filename, kind='software'):
+        return self.find_image(filename, kind) is not None
+
+    def image_current(self, filename, kind='software'):
+        """Checks that the image on the device matches the local image
+
+        The checksum the device reports is compared with the MD5 of the local
+        image, and with the checksums devices reported after earlier uploads
+        of the same local image. Once such a checksum has been learned, an
+        image that matches neither is replaced. Until then, and for devices
+        that report no checksum, the image is matched by name, left in place
+        and reported as unverified.
+        """
+        image = self.find_image(filename, kind)
+        if image is None:
+            return False
+
+        checksum = image.get('checksum')
+        digest = self.local_digest(filename)
+        learned = digest.get('device_checksums', [])
+        if checksum and (checksum == digest['md5'] or checksum in learned):
+            return True
+        elif checksum and learned:
+            return False
+
+        self.unverified.add(os.path.basename(filename))
+        return True
+
+    def upload_image(self, filename, kind='software'):
+        """Uploads an image, replacing a copy on the device that differs
+
+        Returns True if the number of images on the device increased.
+        """
+        replaced = self.image_exists(filename, kind)
+        if replaced:
+            images = self.read()
+            total = sum(len(v) for v in images.itervalues())
+            self.delete(filename)
+            self.wait_for_images(total - 1)
+
+        self.upload(filename)
+        self._uploaded.append((filename, kind))
+        return not replaced
+
+    def remember_checksums(self):
+        """Records the checksums devices report for the uploaded images
+
+        The checksum may be taken over the files inside the image rather
+        than the image itself, so it is not compared with the local MD5.
+        Only images whose upload completed get here.
+        """
+        for filename, kind in self._uploaded:
+            self.unverified.discard(os.path.basename(filename))
+            image = self.find_image(filename, kind)
+            if image and image.get('checksum'):
+                self.remember_checksum(filename, image['checksum'])
+        self._uploaded = []
+
     def is_hotfix_available(self, hotfix):
-        hotfix = os.path.basename(hotfix)
-        images = self.api.System.SoftwareManagement.get_software_hotfix_list()
-        for image in images:
-            if image['filename'] == hotfix:
-                return True
-        return False
+        return self.image_current(hotfix, 'hotfix')
 
     def is_software_available(self, software):
-        software = os.path.basename(software)
-        images = self.api.System.SoftwareManagement.get_software_image_list()
-        for image in images:
-            if image['filename'] == software:
-                return True
-        return False
+        return self.image_current(software, 'software')
 
     def delete(self, software):
         software = os.path.basename(software)
         self.api.System.SoftwareManagement.delete_software_image(
             image_filenames=[software]
         )
+        self.invalidate()
 
     def is_activated(self):
         return self.software_active(True)
@@ -682,7 +1302,7 @@ class BigIpSoapApi(BigIpCommon):
         volume = self.params['volume']
         result = self.software_active(False)
         if result:
-            softwares = self.api.System.SoftwareManagement.get_all_software_status()
+            softwares = self.snapshot()['status']
             for software in softwares:
                 if software['installation_id']['install_volume'] == volume:
                     return True
@@ -690,7 +1310,7 @@ class BigIpSoapApi(BigIpCommon):
 
     def software_active(self, activity):
         result = False
-        images = self.api.System.SoftwareManagement.get_all_software_status()
+        images = self.snapshot()['status']
 
         hotfix = self.params['hotfix']
         software = self.params['software']
@@ -725,40 +1345,92 @@ class BigIpSoapApi(BigIpCommon):
 
         return result
 
+    def _probe(self):
+        return port_open(self.params['server'])
+
+    def _report_progress(self, status):
+        """Records the install percentage reported by the device
+
+        BIG-IP reports the progress of an install in the status of the
+        volume, for example "installing 42.000 pct".
+        """
+        match = re.search(r'([\d.]+) pct', status)
+        if match:
+            percent = int(float(match.group(1)))
+        elif status == 'complete':
+            percent = 100
+        else:
+            return
+
+        if not self.progress or self.progress[-1] != percent:
+            self.progress.append(percent)
+            if self.progress_callback:
+                self.progress_callback(percent)
+
     def wait_for_software_install(self):
-        while True:
-            time.sleep(5)
+        volume = self.params['volume']
+
+        def check():
             status = self.api.System.SoftwareManagement.get_all_software_status()
-            progress = [x['status'] for x in status if not x['active']]
+
+            # Only the volume being installed to is watched. Another volume
+            # may hold an install that finished earlier.
+            progress = [x['status'] for x in status
+                        if not x['active'] and
+                        x['installation_id']['install_volume'] == volume]
+            for x in progress:
+                self._report_progress(x)
+
             if 'complete' in progress:
-                break
+                return True
             elif 'failed' in progress:
                 raise SoftwareInstallError(progress)
+            return False
+
+        # Give the install time to start before polling, otherwise the
+        # status of an earlier install to the volume may still be reported
+        time.sleep(5)
+
+        waiter = Waiter('the software install', self.params['install_timeout'],
+                        interval=5, probe=self._probe)
+        waiter.wait(check)
+        self.invalidate()
 
     def wait_for_reboot(self):
         volume = self.params['volume']
 
-        while True:
-            time.sleep(5)
-
+        def check():
             try:
                 status = self.api.System.SoftwareManagement.get_all_software_status()
-                volumes = [x['installation_id']['install_volume'] for x in status if x['active']]
-                if volume in volumes:
-                    break
-            except:
-                # Handle all exceptions because if the system is offline (for a
-                # reboot) the SOAP client will raise exceptions about connections
-                pass
+            except (bigsuds.ConnectionError, bigsuds.ServerError,
+                    bigsuds.ParseError, socket.error):
+                # While the system is rebooting the API may accept connections
+                # before it is able to answer them
+                return False
+
+            volumes = [x['installation_id']['install_volume'] for x in status if x['active']]
+            return volume in volumes
+
+        # Wait for the system to begin its reboot before polling for the new
+        # volume, otherwise the old volume may still be reported as active
+        time.sleep(5)
+
+        waiter = Waiter('the reboot into %s' % volume,
+                        self.params['reboot_timeout'], interval=5,
+                        probe=self._probe)
+        waiter.wait(check)
+        self.invalidate()
 
     def wait_for_images(self, count):
-        while True:
+        def check():
             # Waits for the system to settle
+            self.invalidate()
             images = self.read()
             ntotal = sum(len(v) for v in images.itervalues())
-            if ntotal == count:
-                break
-            time.sleep(1)
+            return ntotal == count
+
+        waiter = Waiter('the image list to settle', IMAGES_TIMEOUT)
+        waiter.wait(check)
 
     def install_software(self, pvb, reboot=False, create=False):
         volume = self.params['volume']
@@ -772,6 +1444,7 @@ class BigIpSoapApi(BigIpCommon):
             reboot=reboot,
             retry=False
         )
+        self.invalidate()
 
     def activated(self):
         """Ensures a base image and optionally a hotfix are activated
@@ -801,6 +1474,7 @@ class BigIpSoapApi(BigIpCommon):
         elif self.is_installed() and volume != self.get_active_volume():
             self.api.System.SoftwareManagement.set_cluster_boot_location(volume)
             self.api.System.Services.reboot_system(seconds_to_reboot=1)
+            self.invalidate()
             self.wait_for_reboot()
             return True
         elif volume == self.get_active_volume():
@@ -826,19 +1500,20 @@ class BigIpSoapApi(BigIpCommon):
 
         if hotfix:
             if not self.is_hotfix_available(hotfix):
-                self.upload(hotfix)
-                total += 1
+                if self.upload_image(hotfix, 'hotfix'):
+                    total += 1
                 changed = True
 
         if not self.is_software_available(software):
-            self.upload(software)
-            total += 1
+            if self.upload_image(software, 'software'):
+                total += 1
             changed = True
 
         if changed:
             self.wait_for_images(total)
+            self.remember_checksums()
 
-        status = self.api.System.SoftwareManagement.get_all_software_status()
+        status = self.snapshot()['status']
         volumes = [x['installation_id']['install_volume'] for x in status]
 
         if volume in volumes:
@@ -906,19 +1581,20 @@ class BigIpSoapApi(BigIpCommon):
 
         if hotfix:
             if not self.is_hotfix_available(hotfix):
-                self.upload(hotfix)
-                total += 1
+                if self.upload_image(hotfix, 'hotfix'):
+                    total += 1
                 changed = True
 
         if not self.is_software_available(software):
-            self.upload(software)
-            total += 1
+            if self.upload_image(software, 'software'):
+                total += 1
             changed = True
 
         if changed:
             self.wait_for_images(total)
+            self.remember_checksums()
 
-        status = self.api.System.SoftwareManagement.get_all_software_status()
+        status = self.snapshot()['status']
         volumes = [x['installation_id']['install_volume'] for x in status]
 
         if volume in volumes:
@@ -968,9 +1644,10 @@ class BigIpSoapApi(BigIpCommon):
         # fail (for some reason) and this module would still report success if
         # it found the "broken" image.
         #
-        # A better approach would be to compare checksums, however the checksum
-        # stored by the BIG-IP is not the actual checksum of the ISO, but
-        # instead is the checksum of the files _inside_ the ISO.
+        # The checksum stored by the BIG-IP is not the actual checksum of the
+        # ISO, but instead is the checksum of the files _inside_ the ISO. So
+        # besides the MD5 of the ISO, the checksums reported after earlier
+        # uploads of the same ISO are also accepted as a match.
         if hotfix and software:
             if self.is_software_available(software) and self.is_hotfix_available(hotfix):
                 return False
@@ -981,15 +1658,16 @@ class BigIpSoapApi(BigIpCommon):
             if self.is_software_available(software):
                 return False
 
-        if hotfix:
-            self.upload(hotfix)
-            total += 1
+        if hotfix and not self.is_hotfix_available(hotfix):
+            if self.upload_image(hotfix, 'hotfix'):
+                total += 1
 
-        if software:
-            self.upload(software)
-            total += 1
+        if software and not self.is_software_available(software):
+            if self.upload_image(software, 'software'):
+                total += 1
 
         self.wait_for_images(total)
+        self.remember_checksums()
 
         return True
 
@@ -1001,13 +1679,13 @@ class BigIpSoapApi(BigIpCommon):
         total = sum(len(v) for v in images.itervalues())
 
         if hotfix and software:
-            if not self.is_software_available(software) and not self.is_hotfix_available(hotfix):
+            if not self.image_exists(software, 'software') and not self.image_exists(hotfix, 'hotfix'):
                 return False
         elif hotfix:
-            if not self.is_hotfix_available(hotfix):
+            if not self.image_exists(hotfix, 'hotfix'):
                 return False
         elif software:
-            if not self.is_software_available(software):
+            if not self.image_exists(software, 'software'):
                 return False
 
         if hotfix:
@@ -1023,22 +1701,290 @@ class BigIpSoapApi(BigIpCommon):
         return True
 
 
+class BigIpRestApi(BigIpSoapApi):
+    """Transfers images to the BIG-IP over iControl REST
+
+    Only the upload of images uses REST. Listing, installing and activating
+    software is still done over iControl SOAP.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(BigIpRestApi, self).__init__(*args, **kwargs)
+
+        self._uri = 'https://%s/mgmt' % kwargs['server']
+        self.session = self._get_icr_session(
+            kwargs['user'], kwargs['password'], kwargs['validate_certs'],
+            kwargs['upload_concurrency']
+        )
+
+    def _get_icr_session(self, username, password, validate_certs,
+                         pool_size):
+        """ Get iControl REST Session """
+        icr_session = requests.session()
+        icr_session.auth = (username, password)
+        icr_session.verify = validate_certs
+
+        # One pooled connection per chunk in flight so that every chunk
+        # reuses an already established TLS connection
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=max(1, pool_size)
+        )
+        icr_session.mount('https://', adapter)
+        return icr_session
+
+    def upload(self, filename):
+        uri = '%s/cm/autodeploy/software-image-uploads/%s' % (
+            self._uri, os.path.basename(filename)
+        )
+        uploader = RestUploader(
+            self.session, uri, filename,
+            concurrency=self.params['upload_concurrency']
+        )
+
+        # Each attempt picks up from the chunks acknowledged by the ones
+        # before it. Only connection errors and server errors are tried
+        # again; a request the device rejected would be rejected again.
+        for attempt in range(UPLOAD_ATTEMPTS):
+            try:
+                uploader.run()
+                break
+            except SoftwareUploadError, e:
+                if attempt == UPLOAD_ATTEMPTS - 1 or e.permanent:
+                    raise
+                time.sleep(2 ** attempt)
+        self.invalidate()
+
+
+class Rollout(object):
+    """Rolls software out to many devices at once
+
+    Each device moves through the upload, install and reboot stages on its
+    own thread, reusing the methods of the API class for a single device.
+    The stages are pipelined across devices so that some devices install
+    while others are still uploading.
+
+    At most ``rollout_concurrency`` uploads run at the same time. Reboots
+    happen in waves of ``reboot_wave_size`` devices, in the order that the
+    devices were given; a wave does not reboot until every device in the
+    previous wave has finished.
+
+    The stage reached by every device is checkpointed to a local file. If
+    the rollout is interrupted, running it again resumes each device from
+    its last completed stage. The checkpoint is removed once the rollout
+    completes on every device.
+    """
+
+    def __init__(self, api_class, *args, **kwargs):
+        self.api_class = api_class
+        self.params = kwargs
+        self.devices = kwargs['devices']
+        self.checkpoint_file = kwargs['checkpoint']
+
+        self.upload_lock = threading.Semaphore(max(1, kwargs['rollout_concurrency']))
+        self.wave_size = max(1, kwargs['reboot_wave_size'])
+
+        nwaves = (len(self.devices) + self.wave_size - 1) // self.wave_size
+        self._wave_pending = [0] * nwaves
+        self._wave_done = [threading.Event() for x in range(nwaves)]
+        for index in range(len(self.devices)):
+            self._wave_pending[index // self.wave_size] += 1
+
+        self._lock = threading.Lock()
+        self._checkpoint = read_json_file(self.checkpoint_file)
+
+    def _target(self):
+        return dict(
+            software=self.params['software'],
+            hotfix=self.params['hotfix'],
+            volume=self.params['volume']
+        )
+
+    def stage(self, device):
+        """Returns the last stage completed by a device
+
+        A checkpoint that was recorded for different software or a different
+        volume is ignored.
+        """
+        entry = self._checkpoint.get(device)
+        if not entry or entry.get('target') != self._target():
+            return 'pending'
+        return entry['stage']
+
+    def _done(self, device, stage):
+        current = ROLLOUT_STAGES.index(self.stage(device))
+        return current >= ROLLOUT_STAGES.index(stage)
+
+    def _record(self, device, **kwargs):
+        with self._lock:
+            entry = self._checkpoint.get(device)
+            if not entry or entry.get('target') != self._target():
+                entry = dict(
+                    target=self._target(),
+                    stage='pending',
+                    changed=False,
+                    error=None,
+                    progress=None
+                )
+            entry.update(kwargs)
+            self._checkpoint[device] = entry
+            write_json_file(self.checkpoint_file, self._checkpoint)
+
+    def _finish_wave(self, wave):
+        with self._lock:
+            self._wave_pending[wave] -= 1
+            if self._wave_pending[wave] == 0:
+                self._wave_done[wave].set()
+
+    def _rollout(self, index, device):
+        state = self.params['state']
+        volume = self.params['volume']
+        wave = index // self.wave_size
+        changed = False
+
+        try:
+            params = dict(self.params)
+            params['server'] = device
+            params['check_mode'] = False
+            api = self.api_class(**params)
+            api.progress_callback = lambda x: self._record(device, progress=x)
+
+            self._record(device, error=None)
+
+            if not self._done(device, 'uploaded'):
+                with self.upload_lock:
+                    changed = api.present() or changed
+                self._record(device, stage='uploaded', changed=changed)
+
+            if state == 'present':
+                return
+
+            if api.is_activated() and volume == api.get_active_volume():
+                self._record(device, stage='activated', changed=changed)
+                return
+
+            if not self._done(device, 'installed'):
+                changed = api.installed() or changed
+                self._record(device, stage='installed', changed=changed)
+
+            if state == 'installed':
+                return
+
+            if wave > 0:
+                self._wave_done[wave - 1].wait()
+
+            if not self._done(device, 'activated'):
+                changed = api.activated() or changed
+                self._record(device, stage='activated', changed=changed)
+        except Exception, e:
+            self._record(device, error=str(e) or e.__class__.__name__)
+        finally:
+            self._finish_wave(wave)
+
+    def _check(self, device, results):
+        try:
+            params = dict(self.params)
+            params['server'] = device
+            params['check_mode'] = True
+            api = self.api_class(**params)
+            results[device] = dict(pending=not api.is_current(), error=None)
+        except Exception, e:
+            results[device] = dict(pending=None,
+                                   error=str(e) or e.__class__.__name__)
+
+    def check(self):
+        """Asks every device whether the rollout would change it
+
+        The checkpoint is not used, because it is removed once a rollout
+        completes and so says nothing about devices that are already done.
+        """
+        results = dict()
+
+        threads = []
+        for device in self.devices:
+            thread = threading.Thread(target=self._check,
+                                      args=(device, results))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+
+        for thread in threads:
+            thread.join()
+
+        if any(v['error'] for v in results.values()):
+            raise RolloutError(results)
+
+        pending = [x for x in self.devices if results[x]['pending']]
+        return dict(changed=bool(pending), pending=pending)
+
+    def flush(self):
+        state = self.params['state']
+
+        if state == 'absent':
+            raise RolloutError(dict(
+                (x, dict(error='Rollouts do not support state=absent'))
+                for x in self.devices
+            ))
+        elif state in ['activated', 'installed']:
+            if not self.params['volume']:
+                raise NoVolumeError
+            elif not self.params['software']:
+                raise NoBaseImageError
+
+        if self.params['check_mode']:
+            return self.check()
+
+        threads = []
+        for index, device in enumerate(self.devices):
+            thread = threading.Thread(target=self._rollout,
+                                      args=(index, device))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+
+        for thread in threads:
+            thread.join()
+
+        devices = dict((x, self._checkpoint[x]) for x in self.devices)
+        if any(v['error'] for v in devices.values()):
+            raise RolloutError(devices)
+
+        try:
+            os.remove(os.path.expanduser(self.checkpoint_file))
+        except OSError:
+            pass
+
+        changed = any(v['changed'] for v in devices.values())
+        return dict(changed=changed, devices=devices)
+
+
 def main():
     argument_spec = f5_argument_spec()
 
+    # When rolling out to many devices, the devices replace the server
+    argument_spec['server']['required'] = False
+
     meta_args = dict(
         connection=dict(default='soap', choices=TRANSPORTS),
         state=dict(default='activated', choices=STATES),
         force=dict(required=False, type='bool', default='no'),
         hotfix=dict(required=False, aliases=['hotfix_image'], default=None),
         software=dict(required=False, aliases=['base_image']),
-        volume=dict(required=False)
+        volume=dict(required=False),
+        upload_concurrency=dict(required=False, type='int', default=UPLOAD_CONCURRENCY),
+        install_timeout=dict(required=False, type='int', default=INSTALL_TIMEOUT),
+        reboot_timeout=dict(required=False, type='int', default=REBOOT_TIMEOUT),
+        devices=dict(required=False, type='list', default=None),
+        rollout_concurrency=dict(required=False, type='int', default=ROLLOUT_CONCURRENCY),
+        reboot_wave_size=dict(required=False, type='int', default=REBOOT_WAVE_SIZE),
+        checkpoint=dict(required=False, default=ROLLOUT_CHECKPOINT)
     )
     argument_spec.update(meta_args)
 
     module = AnsibleModule(
         argument_spec=argument_spec,
-        supports_check_mode=True
+        supports_check_mode=True,
+        required_one_of=[['server', 'devices']]
     )
 
     try:
@@ -1056,6 +2002,12 @@ def main():
         module.fail_json(msg='You must specify a base image')
     except SoftwareInstallError, e:
         module.fail_json(msg=str(e))
+    except SoftwareUploadError, e:
+        module.fail_json(msg=str(e))
+    except WaitTimeoutError, e:
+        module.fail_json(msg=str(e))
+    except RolloutError, e:
+        module.fail_json(msg=str(e), devices=e.devices)
     except ISO9660IOError:
         module.fail_json(msg='Failed checking the version metadata in the ISO')
     except socket.timeout:
@@ -114,8 +114,14 @@ options:
 notes:
    - Requires the bigsuds Python package on the host if using the iControl
      interface. This is as easy as pip install bigsuds
+   - The shell and roles of the account, and the version and provisioned
+     modules of the device, are cached for an hour in ~/.ansible/bigip_facts
    - Requires the paramiko Python package on the host for UCS load commands
      that are not available through the REST or SOAP APIs
+   - The C(rest) connection streams the UCS to the device in chunks and only
+     resends the chunks that fail. An existing UCS with the same name is kept
+     when its SHA1 matches the local file. The checksum is taken with the
+     bash utility, so in Appliance Mode only the name is compared
    - Only the most basic checks are performed by this module. Other checks and
      considerations need to be taken into account. See the following URL.
      https://support.f5.com/kb/en-us/solutions/public/11000/300/sol11318.html
@@ -211,8 +217,14 @@ EXAMPLES = """
 """
 
 import base64
+import hashlib
+import json
 import socket
 import os
+import re
+import shutil
+import tempfile
+import time
 
 try:
     import bigsuds
@@ -221,6 +233,97 @@ except ImportError:
 else:
     bigsuds_found = True
 
+
+# WSDLs downloaded by iControl clients are cached here, per BIG-IP version
+WSDL_CACHE_DIR = '~/.ansible/bigip_wsdl'
+
+# Seconds that the recorded version of a BIG-IP is trusted
+WSDL_CACHE_TTL = 86400
+
+
+def wsdl_cache_dir(hostname):
+    """Returns the WSDL cache of hostname, or None when it is not known
+
+    The cache is not known until the version of the BIG-IP has been
+    recorded, and again once the recorded version is older than
+    WSDL_CACHE_TTL, since the BIG-IP may have been upgraded.
+    """
+    base = os.path.expanduser(WSDL_CACHE_DIR)
+    try:
+        with open(os.path.join(base, 'versions.json')) as fh:
+            entry = json.load(fh)[hostname]
+    except (IOError, ValueError, KeyError):
+        return None
+
+    if time.time() - entry['checked'] > WSDL_CACHE_TTL:
+        return None
+    return os.path.join(base, '%s-%s' % (hostname, entry['version']))
+
+
+def remember_version(hostname, version):
+    base = os.path.expanduser(WSDL_CACHE_DIR)
+    path = os.path.join(base, 'versions.json')
+
+    try:
+        with open(path) as fh:
+            versions = json.load(fh)
+    except (IOError, ValueError):
+        versions = {}
+
+    versions[hostname] = dict(version=version, checked=time.time())
+
+    if not os.path.isdir(base):
+        os.makedirs(base, 0700)
+
+    fd, tmp = tempfile.mkstemp(dir=base)
+    with os.fdopen(fd, 'w') as fh:
+        json.dump(versions, fh)
+    os.rename(tmp, path)
+
+
+def icontrol_client(hostname, username, password):
+    """Returns a bigsuds client that keeps the WSDLs it parses on disk
+
+    Each iControl interface otherwise downloads and parses its WSDL every
+    time a module runs. The cache is kept per BIG-IP and version, so the
+    version is looked up first when it is not yet known. The WSDL parsed
+    to look it up is cached in a directory of its own, which is moved into
+    place once the version is known.
+    """
+    cachedir = wsdl_cache_dir(hostname)
+    if cachedir is None:
+        base = os.path.expanduser(WSDL_CACHE_DIR)
+        if not os.path.isdir(base):
+            os.makedirs(base, 0700)
+
+        tmpdir = tempfile.mkdtemp(dir=base)
+        try:
+            api = bigsuds.BIGIP(
+                hostname=hostname,
+                username=username,
+                password=password,
+                debug=True,
+                cachedir=tmpdir
+            )
+            remember_version(hostname, api.System.SystemInfo.get_version())
+            cachedir = wsdl_cache_dir(hostname)
+            try:
+                os.rename(tmpdir, cachedir)
+            except OSError:
+                # The cache of this version already exists
+                pass
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+    return bigsuds.BIGIP(
+        hostname=hostname,
+        username=username,
+        password=password,
+        debug=True,
+        cachedir=cachedir
+    )
+
+
 try:
     import requests
 except ImportError:
@@ -236,15 +339,28 @@ else:
     paramiko_found = True
 
 
+# Number of times a chunk is resent before a REST upload fails
+UPLOAD_RETRIES = 3
+CONNECTION_TIMEOUT = 60
+
+# Local cache of device and account facts, and the number of seconds
+# they are trusted before being read from the device again
+FACTS_CACHE_DIR = '~/.ansible/bigip_facts'
+FACTS_TTL = 3600
+
+
+class UcsUploadError(Exception):
+    pass
+
+
 def test_icontrol(username, password, hostname):
-    api = bigsuds.BIGIP(
-        hostname=hostname,
-        username=username,
-        password=password,
-        debug=True
-    )
+    # A warm WSDL cache means that the BIG-IP was reached recently, so it
+    # is not probed again
+    if wsdl_cache_dir(hostname):
+        return True
 
     try:
+        api = icontrol_client(hostname, username, password)
         response = api.Management.LicenseAdministration.get_license_activation_status()
         if 'STATE' in response:
             return True
@@ -254,6 +370,115 @@ def test_icontrol(username, password, hostname):
         return False
 
 
+def icontrol_auth_failed(error):
+    """Checks whether an iControl connection error was caused by a bad login
+
+    The credentials are not probed up front when the WSDL cache is warm,
+    so a bad login only shows up on the first real call.
+    """
+    text = str(error)
+    return 'credentials' in text or '401' in text
+
+
+class DeviceFacts(object):
+    """Capabilities of a BIG-IP and of the connecting account
+
+    The facts are cached on the local host in one file per BIG-IP under
+    FACTS_CACHE_DIR, and are read from the device again once they are older
+    than FACTS_TTL seconds. The account facts (shell and roles) are kept per
+    user, while the device facts (version and provisioned modules) are
+    shared by every user of the device.
+    """
+
+    def __init__(self, server, user, password, validate_certs, ttl=FACTS_TTL):
+        self.server = server
+        self.user = user
+        self.password = password
+        self.validate_certs = validate_certs
+        self.ttl = ttl
+
+        directory = os.path.expanduser(FACTS_CACHE_DIR)
+        self.path = os.path.join(directory, '%s.json' % server)
+        self._cache = None
+
+    def _load(self):
+        if self._cache is None:
+            try:
+                with open(self.path) as fh:
+                    self._cache = json.load(fh)
+            except (IOError, ValueError):
+                self._cache = {}
+        return self._cache
+
+    def _save(self):
+        directory = os.path.dirname(self.path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory, 0700)
+
+        # Written to a temporary file first so that concurrent tasks for the
+        # same device never read a partially written cache
+        fd, tmp = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, 'w') as fh:
+            json.dump(self._cache, fh)
+        os.rename(tmp, self.path)
+
+    def _get(self, uri):
+        resp = requests.get('https://%s/mgmt/tm/%s' % (self.server, uri),
+                            auth=(self.user, self.password),
+                            verify=self.validate_certs)
+        if resp.status_code != 200:
+            raise Exception('Failed to query the REST API')
+        return resp.json()
+
+    def _cached(self, key, fetch, refresh):
+        cache = self._load()
+        entry = cache.get(key)
+        if refresh or not entry or time.time() - entry['fetched'] > self.ttl:
+            entry = fetch()
+            entry['fetched'] = time.time()
+            cache[key] = entry
+            self._save()
+        return entry
+
+    def _read_account(self):
+        result = self._get('auth/user/%s' % self.user)
+        roles = set([p['role'] for p in result.get('partitionAccess', [])])
+
+        # The REST API does not list a shell if the console has been
+        # deactivated for the account
+        return dict(shell=result.get('shell'), roles=sorted(roles))
+
+    def _read_device(self):
+        version = None
+        for entry in self._get('sys/version').get('entries', {}).values():
+            stats = entry.get('nestedStats', {}).get('entries', {})
+            if 'Version' in stats:
+                version = stats['Version']['description']
+
+        modules = []
+        for item in self._get('sys/provision').get('items', []):
+            if item.get('level', 'none') != 'none':
+                modules.append(item['name'])
+
+        return dict(version=version, modules=sorted(modules))
+
+    def account(self, refresh=False):
+        return self._cached('account:%s' % self.user, self._read_account, refresh)
+
+    def device(self, refresh=False):
+        return self._cached('device', self._read_device, refresh)
+
+    def invalidate(self):
+        self._cache = {}
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+    def appliance_mode(self):
+        return self.account()['shell'] == 'tmsh'
+
+
 class BigIpCommon(object):
     def __init__(self, module):
         self.result = {}
@@ -269,6 +494,9 @@ class BigIpCommon(object):
         self._force = module.params.get('force')
         self._validate_certs = module.params.get('validate_certs')
 
+        self.facts = DeviceFacts(self._hostname, self._username,
+                                 self._password, self._validate_certs)
+
         # Options available when loading a UCS
         self._include_clc = module.params.get('include_chassis_level_config')
         self._no_license = module.params.get('no_license')
@@ -288,86 +516,7 @@ class BigIpCommon(object):
         self._backup = 'cs_backup.ucs'
 
     def appliance_mode(self):
-        self._uri = 'https://%s/mgmt/tm/auth/user/%s' % (self._hostname, self._username)
-        self._headers = {
-            'Content-Type': 'application/json'
-        }
-
-        resp = requests.get(self._uri,
-                            auth=(self._username, self._password),
-                            verify=self._validate_certs)
-
-        if resp.status_code != 200:
-            raise Exception('Failed to query the REST API')
-        else:
-            result = resp.json()
-            if 'shell' in result and result['shell'] == 'tmsh':
-                return True
-            else:
-                return False
-
-
-class BigIpIControl(BigIpCommon):
-    def __init__(self, module):
-        super(BigIpIControl, self).__init__(module)
-
-        self.api = bigsuds.BIGIP(
-            hostname=self._hostname,
-            username=self._username,
-            password=self._password,
-            debug=True
-        )
-
-    def version(self):
-        """Check the BIG-IP version
-
-        Different versions of BIG-IP support different arguments to the load
-        command. This method will return the version of the system for
-        comparison.
-        """
-        version = self.api.System.SystemInfo.get_version()
-        return version
-
-    def read(self):
-        result = []
-
-        try:
-            resp = self.api.System.ConfigSync.get_configuration_list()
-            for ucs in resp:
-                result.append(ucs['file_name'])
-        except bigsuds.ServerError:
-            pass
-
-        return result
-
-    def _upload(self, filename):
-        fileobj = open(filename, 'rb')
-        done = False
-        first = True
-
-        while not done:
-            text = base64.b64encode(fileobj.read(self.chunk_size))
-
-            if first:
-                if len(text) < self.chunk_size:
-                    chain_type = 'FILE_FIRST_AND_LAST'
-                else:
-                    chain_type = 'FILE_FIRST'
-                first = False
-            else:
-                if len(text) < self.chunk_size:
-                    chain_type = 'FILE_LAST'
-                    done = True
-                else:
-                    chain_type = 'FILE_MIDDLE'
-
-            self.api.System.ConfigSync.upload_configuration(
-                config_name=self._basename,
-                file_context=dict(
-                    file_data=text,
-                    chain_type=chain_type
-                )
-            )
+        return self.facts.appliance_mode()
 
     def _is_ucs_available(self):
         ucss = self.read()
@@ -376,11 +525,13 @@ class BigIpIControl(BigIpCommon):
         else:
             return False
 
-    def _delete(self):
-        self.api.System.ConfigSync.delete_configuration(self._basename)
+    def _is_ucs_current(self):
+        """Checks that the UCS on the device is the one to be uploaded
 
-    def _rollback_ucs(self):
-        self.api.System.ConfigSync.install_configuration(self._backup)
+        By default only the name is compared. Connections that can checksum
+        the remote file override this.
+        """
+        return self._is_ucs_available()
 
     def _has_error(self, stdout, stderr):
         if stdout.channel.recv_exit_status() > 0 or stderr.channel.recv_exit_status() > 0:
@@ -440,6 +591,10 @@ class BigIpIControl(BigIpCommon):
                 cmd += ' %s' % (k)
 
         stdin, stdout, stderr = api.exec_command(cmd)
+
+        # The UCS may restore a different shell or roles for the account
+        self.facts.invalidate()
+
         self.result['stdout'] = stdout.read()
         self.result['stderr'] = stderr.read()
         self.result['command'] = cmd
@@ -468,7 +623,11 @@ class BigIpIControl(BigIpCommon):
         if self._force:
             self._delete()
 
-        if not self._is_ucs_available():
+        if not self._is_ucs_current():
+            if self._is_ucs_available():
+                # The remote file differs, so it is removed before uploading
+                # to ensure that no trailing bytes of it survive
+                self._delete()
             self._upload(self._ucs)
 
         self._install_ucs()
@@ -482,7 +641,11 @@ class BigIpIControl(BigIpCommon):
             self._delete()
             changed = True
 
-        if not self._is_ucs_available():
+        if not self._is_ucs_current():
+            if self._is_ucs_available():
+                # The remote file differs, so it is removed before uploading
+                # to ensure that no trailing bytes of it survive
+                self._delete()
             self._upload(self._ucs)
             changed = True
 
@@ -504,6 +667,204 @@ class BigIpIControl(BigIpCommon):
         self.result['changed'] = changed
 
 
+class BigIpIControl(BigIpCommon):
+    def __init__(self, module):
+        super(BigIpIControl, self).__init__(module)
+
+        self.api = icontrol_client(self._hostname, self._username, self._password)
+
+    def version(self):
+        """Check the BIG-IP version
+
+        Different versions of BIG-IP support different arguments to the load
+        command. This method will return the version of the system for
+        comparison.
+        """
+        version = self.api.System.SystemInfo.get_version()
+        return version
+
+    def read(self):
+        result = []
+
+        try:
+            resp = self.api.System.ConfigSync.get_configuration_list()
+            for ucs in resp:
+                result.append(ucs['file_name'])
+        except bigsuds.ServerError:
+            pass
+
+        return result
+
+    def _upload(self, filename):
+        size = os.path.getsize(filename)
+        offset = 0
+
+        with open(filename, 'rb') as fileobj:
+            while True:
+                # The chain type is decided by the number of bytes read from
+                # the file, not by the length of their base64 encoding
+                data = fileobj.read(self.chunk_size)
+                first = offset == 0
+                offset += len(data)
+                last = offset >= size
+
+                if first and last:
+                    chain_type = 'FILE_FIRST_AND_LAST'
+                elif first:
+                    chain_type = 'FILE_FIRST'
+                elif last:
+                    chain_type = 'FILE_LAST'
+                else:
+                    chain_type = 'FILE_MIDDLE'
+
+                self.api.System.ConfigSync.upload_configuration(
+                    config_name=self._basename,
+                    file_context=dict(
+                        file_data=base64.b64encode(data),
+                        chain_type=chain_type
+                    )
+                )
+
+                if last:
+                    break
+
+    def _delete(self):
+        self.api.System.ConfigSync.delete_configuration(self._basename)
+
+    def _rollback_ucs(self):
+        self.api.System.ConfigSync.install_configuration(self._backup)
+
+
+class BigIpRest(BigIpCommon):
+    def __init__(self, module):
+        super(BigIpRest, self).__init__(module)
+
+        self._base = 'https://%s/mgmt' % self._hostname
+        self.api = self._get_icr_session()
+
+    def _get_icr_session(self):
+        """ Get iControl REST Session """
+        icr_session = requests.session()
+        icr_session.auth = (self._username, self._password)
+        icr_session.verify = self._validate_certs
+        return icr_session
+
+    def _post_json(self, uri, payload):
+        return self.api.post(uri, data=json.dumps(payload),
+                             headers={'Content-Type': 'application/json'},
+                             timeout=CONNECTION_TIMEOUT)
+
+    def version(self):
+        return 'BIG-IP_v%s' % self.facts.device()['version']
+
+    def read(self):
+        result = []
+
+        resp = self.api.get(self._base + '/tm/sys/ucs',
+                            timeout=CONNECTION_TIMEOUT)
+        if resp.status_code >= 400:
+            return result
+
+        for item in resp.json().get('items', []):
+            values = item.get('apiRawValues', {})
+            if 'filename' in values:
+                result.append(os.path.basename(values['filename']))
+        return result
+
+    def _delete(self):
+        self.api.delete('%s/tm/sys/ucs/%s' % (self._base, self._basename),
+                        timeout=CONNECTION_TIMEOUT)
+
+    def _rollback_ucs(self):
+        self._post_json(self._base + '/tm/sys/ucs',
+                        dict(command='load', name=self._backup))
+
+    def _local_checksum(self, filename):
+        sha1 = hashlib.sha1()
+        with open(filename, 'rb') as fh:
+            for block in iter(lambda: fh.read(self.chunk_size), b''):
+                sha1.update(block)
+        return sha1.hexdigest()
+
+    def _remote_checksum(self):
+        """Returns the SHA1 of the UCS on the device
+
+        The checksum is computed on the device through the bash utility. When
+        that is not available, for example in Appliance Mode, or when the
+        file name holds characters that are not safe to pass to the shell,
+        None is returned and the file is compared by name only.
+        """
+        if not re.match(r'^[\w.-]+$', self._basename):
+            return None
+
+        payload = dict(
+            command='run',
+            utilCmdArgs="-c 'sha1sum /var/local/ucs/%s'" % self._basename
+        )
+        resp = self._post_json(self._base + '/tm/util/bash', payload)
+        if resp.status_code >= 400:
+            return None
+
+        output = resp.json().get('commandResult', '').split()
+        if output and len(output[0]) == 40:
+            return output[0]
+        return None
+
+    def _is_ucs_current(self):
+        if not self._is_ucs_available():
+            return False
+
+        remote = self._remote_checksum()
+        if remote is None:
+            return True
+        return remote == self._local_checksum(self._ucs)
+
+    def _upload(self, filename):
+        """Streams a UCS to the device as raw Content-Range chunks
+
+        Each chunk is read from the file as it is sent. A chunk that fails is
+        resent on its own, with an increasing delay, instead of restarting
+        the whole transfer.
+        """
+        uri = '%s/shared/file-transfer/ucs-uploads/%s' % (self._base, self._basename)
+        size = os.path.getsize(filename)
+        start = 0
+
+        with open(filename, 'rb') as fileobj:
+            while True:
+                data = fileobj.read(self.chunk_size)
+                end = start + len(data) - 1
+                headers = {
+                    'Content-Type': 'application/octet-stream',
+                    'Content-Range': '%s-%s/%s' % (start, end, size)
+                }
+                self._send_chunk(uri, data, headers)
+
+                start += len(data)
+                if start >= size:
+                    break
+
+    def _send_chunk(self, uri, data, headers):
+        for attempt in range(UPLOAD_RETRIES + 1):
+            try:
+                resp = self.api.post(uri, data=data, headers=headers,
+                                     timeout=CONNECTION_TIMEOUT)
+            except (requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout), e:
+                error = str(e)
+            else:
+                if resp.status_code < 400:
+                    return
+                elif resp.status_code < 500:
+                    raise UcsUploadError(resp.text)
+                error = resp.text
+            time.sleep(2 ** attempt)
+
+        raise UcsUploadError(
+            "Failed to upload bytes %s: %s" % (headers['Content-Range'], error)
+        )
+
+
 def main():
     icontrol = False
 
@@ -540,7 +901,10 @@ def main():
             if icontrol:
                 obj = BigIpIControl(module)
         elif connection == 'rest':
-            module.fail_json(msg='The REST connection is currently not supported')
+            if not requests_found:
+                raise Exception("The python requests module is required")
+
+            obj = BigIpRest(module)
 
         if state == "installed":
             if not paramiko_found:
@@ -552,7 +916,10 @@ def main():
         elif state == "absent":
             obj.absent()
     except (bigsuds.ConnectionError, bigsuds.ParseError), e:
-        module.fail_json(msg="Could not connect to BIG-IP host %s" % hostname)
+        if icontrol_auth_failed(e):
+            module.fail_json(msg="Could not log in with provided credentials")
+        else:
+            module.fail_json(msg="Could not connect to BIG-IP host %s" % hostname)
     except paramiko.ssh_exception.SSHException, e:
         if 'No existing session' in str(e):
             module.fail_json(msg='Could not log in with provided credentials')
@@ -51,6 +51,12 @@ options:
     description:
       - A directory to save the UCS file into.
     required: yes
+  download_concurrency:
+    description:
+      - The number of byte ranges of the UCS that may be downloaded at once
+        when using the C(rest) connection.
+    default: 4
+    required: False
   encryption_password:
     description:
       - Password to use to encrypt the UCS file if desired
@@ -75,10 +81,27 @@ options:
       - The name of the UCS file to create on the remote server for downloading
     required: false
     default: temporary file name
+  restore:
+    description:
+      - Date, in the form YYYY-MM-DD, of a backup in C(store) to reconstruct
+        into C(dest) instead of fetching a UCS from the device. If C(src) is
+        given, the backup of that name is restored; otherwise the most recent
+        backup of that date. The device is not contacted. A restored UCS has
+        the contents of the original, compressed again, and is not written
+        if C(dest) already has those contents.
+    required: False
   server:
     description:
       - BIG-IP host
     required: true
+  store:
+    description:
+      - A local directory to keep deduplicated backups in. Each fetched UCS
+        is decompressed and split into content-defined chunks, chunks that
+        are already in the store are not written again, and a manifest is
+        kept per device and date. Backups in the store can be reconstructed
+        with C(restore).
+    required: False
   user:
     description:
       - BIG-IP username
@@ -111,6 +134,27 @@ EXAMPLES = '''
       src: "cs_backup.ucs"
       dest: "/tmp/cs_backup.ucs"
   delegate_to: localhost
+
+- name: Download a new UCS and keep a deduplicated copy
+  bigip_ucs_fetch:
+      server: "bigip.localhost.localdomain"
+      user: "admin"
+      password: "admin"
+      src: "cs_backup.ucs"
+      dest: "/backups/latest/bigip.localhost.localdomain.ucs"
+      store: "/backups/store"
+  delegate_to: localhost
+
+- name: Reconstruct the backup taken on a given day
+  bigip_ucs_fetch:
+      server: "bigip.localhost.localdomain"
+      user: "admin"
+      password: "admin"
+      src: "cs_backup.ucs"
+      dest: "/tmp/cs_backup.ucs"
+      store: "/backups/store"
+      restore: "2016-03-01"
+  delegate_to: localhost
 '''
 
 RETURN = '''
@@ -171,12 +215,43 @@ size:
     returned: success
     type: int
     sample: 1220
+store_manifest:
+    description: Path of the manifest written to the backup store
+    returned: changed and if store is set
+    type: string
+    sample: "/backups/store/manifests/bigip01/2016-03-01/cs_backup.ucs.json"
+store_chunks:
+    description: Number of chunks the UCS was split into
+    returned: changed and if store is set
+    type: int
+    sample: 412
+store_new_chunks:
+    description: Number of chunks that were not already in the store
+    returned: changed and if store is set
+    type: int
+    sample: 3
+store_new_bytes:
+    description: Number of bytes written to the store for new chunks
+    returned: changed and if store is set
+    type: int
+    sample: 196608
 '''
 
 import socket
 import os
 import base64
+import datetime
+import gzip
+import hashlib
+import json
 import tempfile
+import threading
+import zlib
+
+try:
+    from Queue import Queue, Empty
+except ImportError:
+    from queue import Queue, Empty
 
 try:
     import bigsuds
@@ -196,6 +271,79 @@ else:
 CHUNK_SIZE = 512 * 1024
 SAVE_FULL = "SAVE_FULL"
 
+# Defaults for downloads done over iControl REST
+DOWNLOAD_CONCURRENCY = 4
+DOWNLOAD_RETRIES = 3
+CONNECTION_TIMEOUT = 60
+
+
+# Content-defined chunking of UCS archives in the backup store. Chunks end
+# after an occurrence of the anchor, but are never shorter than the minimum
+# or longer than the maximum size.
+STORE_ANCHOR = b'\x5a\xc3'
+STORE_MIN_CHUNK = 16 * 1024
+STORE_MAX_CHUNK = 1024 * 1024
+STORE_READ_SIZE = 4 * 1024 * 1024
+
+# Leading bytes of a gzip stream. UCS archives are gzip compressed tar files
+# unless they are encrypted.
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+class UcsDownloadError(Exception):
+    pass
+
+
+class UcsStoreError(Exception):
+    pass
+
+
+def new_hashers():
+    """Returns the hashers fed with the contents of a downloaded UCS"""
+    result = dict(sha1=hashlib.sha1())
+    try:
+        result['md5'] = hashlib.md5()
+    except ValueError:
+        # MD5 is not available on FIPS enabled hosts
+        result['md5'] = None
+    return result
+
+
+def update_hashers(hashers, data):
+    for hasher in hashers.values():
+        if hasher:
+            hasher.update(data)
+
+
+def hexdigests(hashers):
+    return dict(
+        (k, v.hexdigest() if v else None) for k, v in hashers.items()
+    )
+
+
+def file_digests(path):
+    """Returns the SHA1 and MD5 of a local file"""
+    hashers = new_hashers()
+    with open(path, 'rb') as fh:
+        for block in iter(lambda: fh.read(STORE_READ_SIZE), b''):
+            update_hashers(hashers, block)
+    return hexdigests(hashers)
+
+
+class HashingWriter(object):
+    """File object that hashes the data it writes to another file"""
+
+    def __init__(self, fh, hashers):
+        self.fh = fh
+        self.hashers = hashers
+
+    def write(self, data):
+        self.fh.write(data)
+        update_hashers(self.hashers, data)
+
+    def flush(self):
+        self.fh.flush()
+
 
 def test_icontrol(username, password, hostname, validate_certs):
     api = bigip_api(hostname, username, password, validate_certs)
@@ -213,6 +361,237 @@ def bigip_version():
     return version
 
 
+class UcsStore(object):
+    """Content addressed store of UCS backups
+
+    Archives are split into content-defined chunks. Each chunk is stored
+    once, under its SHA256, no matter how many backups contain it. Every
+    backup is described by a manifest of its chunks, kept per device and
+    date, from which the archive can be reconstructed.
+
+    A small change to the input of gzip changes all of its output that
+    follows, so compressed archives are chunked after decompression and
+    compressed again when they are restored. A restored archive then has
+    the same contents as the original, though not the same bytes. Archives
+    that are not compressed, such as encrypted ones, are chunked as they are.
+
+    The chunk boundaries are placed after occurrences of a fixed anchor
+    found with a plain substring search, rather than with a per-byte rolling
+    hash, because the search runs at C speed where a rolling hash written
+    in Python would take minutes on a large archive. Data inserted into one
+    part of an archive therefore only changes the chunks around it.
+
+    Layout of the store::
+
+        chunks/<first two hex digits>/<sha256>
+        manifests/<device>/<YYYY-MM-DD>/<ucs name>.json
+    """
+
+    def __init__(self, path):
+        self.path = os.path.expanduser(path)
+
+    def _chunk_path(self, digest):
+        return os.path.join(self.path, 'chunks', digest[:2], digest)
+
+    def _manifest_dir(self, device, date):
+        return os.path.join(self.path, 'manifests', device, date)
+
+    def _write_atomic(self, path, data):
+        dirname = os.path.dirname(path)
+        if not os.path.isdir(dirname):
+            try:
+                os.makedirs(dirname)
+            except OSError:
+                # Created by a concurrent task
+                if not os.path.isdir(dirname):
+                    raise
+        fd, tmp = tempfile.mkstemp(dir=dirname)
+        with os.fdopen(fd, 'wb') as fh:
+            fh.write(data)
+        os.rename(tmp, path)
+
+    def _open_contents(self, fh):
+        """Returns the encoding of an archive and a file object of its contents"""
+        magic = fh.read(len(GZIP_MAGIC))
+        fh.seek(0)
+        if magic == GZIP_MAGIC:
+            return 'gzip', gzip.GzipFile(fileobj=fh, mode='rb')
+        return 'raw', fh
+
+    def content_digest(self, filename):
+        """Returns the SHA1 of the contents of an archive"""
+        sha1 = hashlib.sha1()
+        with open(filename, 'rb') as fh:
+            encoding, contents = self._open_contents(fh)
+            try:
+                for block in iter(lambda: contents.read(STORE_READ_SIZE), b''):
+                    sha1.update(block)
+            except (IOError, zlib.error):
+                return None
+        return sha1.hexdigest()
+
+    def matches(self, manifest, filename):
+        """Checks that a local file has the contents of a stored backup"""
+        if not os.path.isfile(filename):
+            return False
+        expected = manifest.get('content_sha1', manifest['sha1'])
+        return self.content_digest(filename) == expected
+
+    def chunks(self, fh):
+        """Yields the content-defined chunks of a file"""
+        buf = b''
+        start = 0
+        eof = False
+
+        while True:
+            cut = self._find_cut(buf, start, eof)
+            if cut is not None:
+                yield buf[start:cut]
+                start = cut
+                continue
+            elif eof:
+                return
+
+            block = fh.read(STORE_READ_SIZE)
+            eof = not block
+            buf = buf[start:] + block
+            start = 0
+
+    def _find_cut(self, buf, start, eof):
+        remaining = len(buf) - start
+        if remaining == 0:
+            return None
+        elif remaining < STORE_MIN_CHUNK:
+            return len(buf) if eof else None
+
+        limit = start + STORE_MAX_CHUNK
+        pos = buf.find(STORE_ANCHOR, start + STORE_MIN_CHUNK - len(STORE_ANCHOR), limit)
+        if pos != -1:
+            return pos + len(STORE_ANCHOR)
+        elif remaining >= STORE_MAX_CHUNK:
+            return limit
+        elif eof:
+            return len(buf)
+        return None
+
+    def add(self, filename, device, src, digests):
+        """Stores a downloaded UCS and writes its manifest
+
+        Returns the path to the manifest and the number of chunks and bytes
+        that were not already in the store.
+        """
+        result = dict(chunks=0, new_chunks=0, new_bytes=0)
+        entries = []
+        size = 0
+        sha1 = hashlib.sha1()
+
+        with open(filename, 'rb') as fh:
+            encoding, contents = self._open_contents(fh)
+            try:
+                for chunk in self.chunks(contents):
+                    digest = hashlib.sha256(chunk).hexdigest()
+                    path = self._chunk_path(digest)
+                    if not os.path.exists(path):
+                        self._write_atomic(path, chunk)
+                        result['new_chunks'] += 1
+                        result['new_bytes'] += len(chunk)
+                    entries.append([digest, len(chunk)])
+                    size += len(chunk)
+                    sha1.update(chunk)
+            except (IOError, zlib.error), e:
+                raise UcsStoreError("%s could not be decompressed: %s" % (src, str(e)))
+
+        now = datetime.datetime.now()
+        manifest = dict(
+            device=device,
+            src=src,
+            created=now.strftime('%Y-%m-%dT%H:%M:%S'),
+            size=size,
+            sha1=digests['sha1'],
+            encoding=encoding,
+            content_sha1=sha1.hexdigest(),
+            chunks=entries
+        )
+
+        path = os.path.join(self._manifest_dir(device, now.strftime('%Y-%m-%d')),
+                            '%s.json' % src)
+        self._write_atomic(path, json.dumps(manifest))
+
+        result['chunks'] = len(entries)
+        result['manifest'] = path
+        return result
+
+    def find(self, device, date, src=None):
+        """Returns the manifest of a backup of a device made on a date
+
+        If no UCS name is given, the most recent backup of that date is used.
+        """
+        dirname = self._manifest_dir(device, date)
+        if src:
+            path = os.path.join(dirname, '%s.json' % src)
+            if not os.path.exists(path):
+                raise UcsStoreError("No backup of %s named %s was stored on %s" % (device, src, date))
+        else:
+            try:
+                names = [x for x in os.listdir(dirname) if x.endswith('.json')]
+            except OSError:
+                names = []
+            if not names:
+                raise UcsStoreError("No backup of %s was stored on %s" % (device, date))
+            paths = [os.path.join(dirname, x) for x in names]
+            path = max(paths, key=os.path.getmtime)
+
+        with open(path, 'r') as fh:
+            return json.load(fh)
+
+    def restore(self, manifest, dest):
+        """Reconstructs a backup from its manifest
+
+        The archive is assembled in a temporary file next to the destination
+        and only moved into place once the SHA1 of its contents matches the
+        manifest. Returns the SHA1 and MD5 of the restored file.
+        """
+        hashers = new_hashers()
+        sha1 = hashlib.sha1()
+        dirname = os.path.dirname(os.path.abspath(dest))
+        fd, tmp = tempfile.mkstemp(dir=dirname)
+
+        # Manifests written before archives were decompressed hold the
+        # archive as it was downloaded
+        encoding = manifest.get('encoding', 'raw')
+        expected = manifest.get('content_sha1', manifest['sha1'])
+
+        try:
+            with os.fdopen(fd, 'wb') as fh:
+                writer = HashingWriter(fh, hashers)
+                if encoding == 'gzip':
+                    # A fixed name and time keep the output the same on
+                    # every restore
+                    out = gzip.GzipFile(filename='', mode='wb', fileobj=writer, mtime=0)
+                else:
+                    out = writer
+
+                for digest, size in manifest['chunks']:
+                    try:
+                        with open(self._chunk_path(digest), 'rb') as chunk_fh:
+                            chunk = chunk_fh.read()
+                    except IOError:
+                        raise UcsStoreError("Chunk %s of the backup is missing from the store" % digest)
+                    out.write(chunk)
+                    sha1.update(chunk)
+
+                if out is not writer:
+                    out.close()
+
+            if sha1.hexdigest() != expected:
+                raise UcsStoreError("The restored backup does not match the checksum in its manifest")
+            os.rename(tmp, dest)
+        except Exception:
+            os.remove(tmp)
+            raise
+        return hexdigests(hashers)
+
+
 class BigIpCommon(object):
     def __init__(self, username, password, hostname, validate_certs=True,
                  check_mode=False):
@@ -263,89 +642,238 @@ class BigIpIControl(BigIpCommon):
             return False
 
     def download(self, src, dest):
-        fileobj = open(dest, 'wb')
+        """Downloads a UCS and returns the SHA1 and MD5 of its contents
+
+        Every chunk is fed to the hashers as it is written, so the file does
+        not need to be read back to checksum it.
+        """
+        hashers = new_hashers()
         offset = 0
-        done = False
 
-        while not done:
-            data = self.api.System.ConfigSync.download_configuration(
-                config_name=src,
-                chunk_size=CHUNK_SIZE,
-                file_offset=offset
+        with open(dest, 'wb') as fileobj:
+            while True:
+                data = self.api.System.ConfigSync.download_configuration(
+                    config_name=src,
+                    chunk_size=CHUNK_SIZE,
+                    file_offset=offset
+                )
+                chunk = base64.b64decode(data['return']['file_data'])
+                fileobj.write(chunk)
+                update_hashers(hashers, chunk)
+                offset = data['file_offset']
+                if data['return']['chain_type'] in ['FILE_LAST', 'FILE_FIRST_AND_LAST']:
+                    break
+
+        return hexdigests(hashers)
+
+
+class RangeDownloader(object):
+    """Downloads a file from the BIG-IP in parallel byte ranges
+
+    The destination file is preallocated to its final size and every range
+    is written at its own offset as soon as it arrives, so up to
+    ``concurrency`` ranges can be in flight on the pooled session at once.
+
+    Ranges are fed to the SHA1 and MD5 hashers in file order while the
+    download runs. A range that arrives ahead of its predecessors is held until they
+    have been hashed, and no more than twice ``concurrency`` ranges are
+    allowed to be outstanding, which bounds the memory used.
+    """
+
+    def __init__(self, session, uri, dest, size, chunk_size=CHUNK_SIZE,
+                 concurrency=DOWNLOAD_CONCURRENCY, retries=DOWNLOAD_RETRIES):
+        self.session = session
+        self.uri = uri
+        self.dest = dest
+        self.size = size
+        self.chunk_size = chunk_size
+        self.concurrency = max(1, concurrency)
+        self.retries = retries
+
+        self.hashers = new_hashers()
+
+        self._window = 2 * self.concurrency
+        self._next = 0
+        self._held = dict()
+        self._cond = threading.Condition()
+        self._errors = []
+
+    def run(self):
+        """Downloads the file and returns the SHA1 and MD5 of its contents"""
+        with open(self.dest, 'wb') as fh:
+            fh.truncate(self.size)
+
+        queue = Queue()
+        starts = range(0, self.size, self.chunk_size)
+        for index, start in enumerate(starts):
+            queue.put((index, start))
+
+        threads = []
+        for x in range(min(self.concurrency, len(starts))):
+            thread = threading.Thread(target=self._worker, args=(queue,))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+
+        for thread in threads:
+            thread.join()
+
+        if self._errors:
+            raise UcsDownloadError(self._errors[0])
+        elif self._next != len(starts):
+            raise UcsDownloadError(
+                "Only %s of %s ranges of %s were verified" % (
+                    self._next, len(starts), self.uri
+                )
             )
-            fileobj.write(base64.b64decode(data['return']['file_data']))
-            offset = data['file_offset']
-            if data['return']['chain_type'] in ['FILE_LAST', 'FILE_FIRST_AND_LAST']:
-                break
-        fileobj.close()
+        return hexdigests(self.hashers)
+
+    def fetch(self, start):
+        end = min(start + self.chunk_size, self.size) - 1
+        headers = {
+            'Content-Type': 'application/octet-stream',
+            'Content-Range': '%s-%s/%s' % (start, end, self.size)
+        }
+
+        for attempt in range(self.retries + 1):
+            try:
+                resp = self.session.get(self.uri, headers=headers,
+                                        timeout=CONNECTION_TIMEOUT)
+            except (requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout), e:
+                if attempt == self.retries:
+                    raise UcsDownloadError(str(e))
+                continue
+
+            if resp.status_code >= 400:
+                raise UcsDownloadError(resp.text)
+            elif len(resp.content) == end - start + 1:
+                return resp.content
+
+        raise UcsDownloadError(
+            "Received a short read for bytes %s-%s of %s" % (start, end, self.uri)
+        )
+
+    def _worker(self, queue):
+        # Each worker has a file object of its own, so that the file
+        # position used for writing is never shared between threads
+        with open(self.dest, 'r+b') as fh:
+            while not self._errors:
+                try:
+                    index, start = queue.get_nowait()
+                except Empty:
+                    return
+
+                with self._cond:
+                    while index >= self._next + self._window and not self._errors:
+                        self._cond.wait()
+                    if self._errors:
+                        return
+
+                try:
+                    data = self.fetch(start)
+                    self._write(fh, start, data)
+                except (UcsDownloadError, IOError, OSError), e:
+                    with self._cond:
+                        self._errors.append(str(e))
+                        self._cond.notify_all()
+                    return
+
+                with self._cond:
+                    self._held[index] = data
+                    while self._next in self._held:
+                        update_hashers(self.hashers, self._held.pop(self._next))
+                        self._next += 1
+                    self._cond.notify_all()
+
+    def _write(self, fh, offset, data):
+        if hasattr(os, 'pwrite'):
+            os.pwrite(fh.fileno(), data, offset)
+        else:
+            fh.seek(offset)
+            fh.write(data)
 
 
 class BigIpRest(BigIpCommon):
     def __init__(self, username, password, hostname,
-                 validate_certs=True, check_mode=False):
+                 validate_certs=True, check_mode=False,
+                 concurrency=DOWNLOAD_CONCURRENCY):
+
+        super(BigIpRest, self).__init__(username, password, hostname,
+                                        validate_certs, check_mode)
+
+        self._uri = 'https://%s/mgmt' % hostname
+        self._concurrency = concurrency
+        self.api = self._get_icr_session(username, password, validate_certs,
+                                         concurrency)
+
+    def _get_icr_session(self, username, password, validate_certs, pool_size):
+        """ Get iControl REST Session """
+        icr_session = requests.session()
+        icr_session.auth = (username, password)
+        icr_session.verify = validate_certs
+
+        # One pooled connection per range in flight
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=max(1, pool_size)
+        )
+        icr_session.mount('https://', adapter)
+        return icr_session
 
-        super(BigIpIControl, self).__init__(username, password, hostname,
-                                            validate_certs, check_mode)
+    def create(self, filename, encryption_password=None):
+        payload = dict(
+            command='save',
+            name=filename
+        )
+        if encryption_password:
+            payload['options'] = [dict(passphrase=encryption_password)]
+
+        resp = self.api.post(self._uri + '/tm/sys/ucs', data=json.dumps(payload),
+                             headers={'Content-Type': 'application/json'},
+                             timeout=CONNECTION_TIMEOUT)
+        if resp.status_code >= 400:
+            raise UcsDownloadError(resp.text)
+
+    def _list(self):
+        result = dict()
+
+        resp = self.api.get(self._uri + '/tm/sys/ucs', timeout=CONNECTION_TIMEOUT)
+        if resp.status_code >= 400:
+            return result
+
+        for item in resp.json().get('items', []):
+            values = item.get('apiRawValues', {})
+            if 'filename' not in values:
+                continue
+            name = os.path.basename(values['filename'])
+
+            # The size is reported as, for example, "75110 (in bytes)"
+            try:
+                size = int(str(values['file_size']).split()[0])
+            except (KeyError, ValueError, IndexError):
+                size = None
+            result[name] = size
+        return result
 
-    def download(self, filename):
-        headers = {
-            'Content-Type': 'application/octet-stream'
-        }
-        filename = os.path.basename(fp)
-        uri = 'https://%s/mgmt/cm/autodeploy/software-image-downloads/%s' % (host, filename)
-        requests.packages.urllib3.disable_warnings()
+    def read(self):
+        return list(self._list().keys())
 
-        with open(fp, 'wb') as f:
-            start = 0
-            end = CHUNK_SIZE - 1
-            size = 0
-            current_bytes = 0
+    def is_ucs_available(self, ucs):
+        if ucs in self.read():
+            return True
+        else:
+            return False
 
-            while True:
-                content_range = "%s-%s/%s" % (start, end, size)
-                headers['Content-Range'] = content_range
-
-                resp = requests.get(uri,
-                                    auth=creds,
-                                    headers=headers,
-                                    verify=False,
-                                    stream=True)
-
-                if resp.status_code == 200:
-                    # If the size is zero, then this is the first time through the
-                    # loop and we don't want to write data because we haven't yet
-                    # figured out the total size of the file.
-                    if size > 0:
-                        current_bytes += CHUNK_SIZE
-                        for chunk in resp.iter_content(CHUNK_SIZE):
-                            f.write(chunk)
-
-                    # Once we've downloaded the entire file, we can break out of
-                    # the loop
-                    if end == size:
-                        break
-
-                crange = resp.headers['Content-Range']
-
-                # Determine the total number of bytes to read
-                if size == 0:
-                    size = int(crange.split('/')[-1]) - 1
-
-                    # If the file is smaller than the chunk size, BIG-IP will
-                    # return an HTTP 400. So adjust the CHUNK_SIZE down to the
-                    # total file size...
-                    if CHUNK_SIZE > size:
-                        end = size
-
-                    # ...and pass on the rest of the code
-                    continue
-
-                start += CHUNK_SIZE
-
-                if (current_bytes + CHUNK_SIZE) > size:
-                    end = size
-                else:
-                    end = start + CHUNK_SIZE - 1
+    def download(self, src, dest):
+        size = self._list().get(src)
+        if size is None:
+            raise UcsDownloadError("The size of %s could not be determined" % src)
+
+        uri = '%s/shared/file-transfer/ucs-downloads/%s' % (self._uri, src)
+        downloader = RangeDownloader(self.api, uri, dest, size,
+                                     concurrency=self._concurrency)
+        return downloader.run()
 
 
 def main():
@@ -359,9 +887,12 @@ def main():
     argument_spec['create_on_missing'] = dict(required=False, default=True, type='bool', choices=BOOLEANS)
     argument_spec['encryption_password'] = dict(required=False)
     argument_spec['dest'] = dict(required=True)
+    argument_spec['download_concurrency'] = dict(required=False, type='int', default=DOWNLOAD_CONCURRENCY)
     argument_spec['force'] = dict(required=False, default=True, type='bool', choices=BOOLEANS)
     argument_spec['fail_on_missing'] = dict(required=False, default=False, type='bool', choices=BOOLEANS)
     argument_spec['src'] = dict()
+    argument_spec['store'] = dict(required=False, default=None)
+    argument_spec['restore'] = dict(required=False, default=None)
 
     module = AnsibleModule(
         argument_spec=argument_spec,
@@ -380,6 +911,40 @@ def main():
         force = module.params.get('force')
         fail_on_missing = module.params['fail_on_missing']
         src = module.params.get('src', None)
+        store = module.params['store']
+        restore = module.params['restore']
+
+        if restore:
+            if not store:
+                module.fail_json(msg="A store is required to restore a backup")
+
+            ucs_store = UcsStore(store)
+            manifest = ucs_store.find(server, restore, src)
+            if os.path.isdir(dest):
+                dest = os.path.join(dest, manifest['src'])
+
+            res_args = dict(
+                dest=dest,
+                src=manifest['src'],
+                changed=False
+            )
+            if ucs_store.matches(manifest, dest):
+                digests = file_digests(dest)
+            elif module.check_mode:
+                digests = None
+                res_args['changed'] = True
+            else:
+                digests = ucs_store.restore(manifest, dest)
+                res_args['changed'] = True
+
+            if digests:
+                res_args['md5sum'] = digests['md5']
+                res_args['checksum'] = digests['sha1']
+
+            if os.path.exists(dest):
+                file_args = module.load_file_common_arguments(module.params)
+                res_args['changed'] = module.set_fs_attributes_if_different(file_args, res_args['changed'])
+            module.exit_json(**res_args)
 
         # Generates a random filename if no 'src' argument was provided
         #
@@ -397,7 +962,11 @@ def main():
             test_icontrol(user, password, server, validate_certs)
             obj = BigIpIControl(user, password, server, validate_certs)
         elif connection == 'rest':
-            module.fail_json(msg='The REST connection is currently not supported')
+            if not REQUESTS_AVAILABLE:
+                raise Exception("The python requests module is required")
+
+            obj = BigIpRest(user, password, server, validate_certs,
+                            concurrency=module.params['download_concurrency'])
 
         if fail_on_missing and not obj.is_ucs_available(src):
             module.exit_json(msg="UCS was not found", src=src, dest=dest, changed=False)
@@ -434,16 +1003,15 @@ def main():
             if backup:
                 if os.path.exists(dest):
                     backup_file = module.backup_local(dest)
-            obj.download(src, dest)
+            digests = obj.download(src, dest)
         except IOError:
             module.fail_json(msg="Failed to copy: %s to %s" % (src, dest))
+        except UcsDownloadError, e:
+            module.fail_json(msg="Failed to copy: %s to %s: %s" % (src, dest, str(e)))
 
         changed = True
-        checksum_dest = module.sha1(dest)
-        try:
-            md5sum_dest = module.md5(dest)
-        except ValueError:
-            md5sum_dest = None
+        checksum_dest = digests['sha1']
+        md5sum_dest = digests['md5']
 
         res_args = dict(
             dest=dest,
@@ -454,11 +1022,24 @@ def main():
         )
         if backup_file:
             res_args['backup_file'] = backup_file
-    except (bigsuds.ConnectionError, bigsuds.ParseError), e:
-        module.fail_json(msg="Could not connect to BIG-IP host %s" % server)
+
+        if store:
+            stored = UcsStore(store).add(dest, server, src, digests)
+            res_args['store_manifest'] = stored['manifest']
+            res_args['store_chunks'] = stored['chunks']
+            res_args['store_new_chunks'] = stored['new_chunks']
+            res_args['store_new_bytes'] = stored['new_bytes']
+    except UcsStoreError, e:
+        module.fail_json(msg=str(e))
     except socket.timeout, e:
         module.fail_json(msg="Timed out connecting to the BIG-IP")
-    except socket.timeout, e:
+    except Exception, e:
+        # bigsuds and requests are optional, so their exceptions can only
+        # be named when they are installed
+        if BIGSUDS_AVAILABLE and isinstance(e, (bigsuds.ConnectionError, bigsuds.ParseError)):
+            module.fail_json(msg="Could not connect to BIG-IP host %s" % server)
+        elif REQUESTS_AVAILABLE and isinstance(e, requests.exceptions.RequestException):
+            module.fail_json(msg="Could not connect to BIG-IP host %s: %s" % (server, str(e)))
         module.fail_json(msg=str(e))
 
     file_args = module.load_file_common_arguments(module.params)
@@ -211,6 +211,7 @@ shell:
     sample: "tmsh"
 '''
 
+import atexit
 import json
 
 try:
@@ -225,6 +226,91 @@ try:
 except ImportError:
     REQUESTS_AVAILABLE = False
 
+
+# Largest number of connections that a REST session keeps open to the BIG-IP
+REST_POOL_SIZE = 4
+
+# Upper bounds, in milliseconds, of the buckets of the REST latency histogram
+LATENCY_BUCKETS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# Seconds to wait for the device to release a login token
+LOGOUT_TIMEOUT = 10
+
+
+def icr_session(hostname, username, password, validate_certs=True):
+    """Returns a pooled iControl REST session
+
+    Connections are kept alive and reused by every request made with the
+    session, so that the TLS handshake happens once per connection rather
+    than once per request. The session logs in once and sends the token it
+    is given with each request, falling back to basic auth on BIG-IPs that
+    do not hand out tokens. The token is released when the module exits,
+    rather than being left to expire.
+
+    Responses may be compressed, and the time taken by each request is
+    counted in the session.latency histogram.
+    """
+    session = requests.session()
+    session.verify = validate_certs
+    session.headers.update({
+        'Content-Type': 'application/json',
+        'Accept-Encoding': 'gzip, deflate'
+    })
+
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1,
+                                            pool_maxsize=REST_POOL_SIZE)
+    session.mount('https://', adapter)
+
+    session.latency = dict((str(x), 0) for x in LATENCY_BUCKETS)
+    session.latency['inf'] = 0
+
+    def record_latency(resp, *args, **kwargs):
+        elapsed = resp.elapsed.total_seconds() * 1000
+        for bound in LATENCY_BUCKETS:
+            if elapsed <= bound:
+                session.latency[str(bound)] += 1
+                break
+        else:
+            session.latency['inf'] += 1
+
+    session.hooks['response'].append(record_latency)
+
+    payload = dict(
+        username=username,
+        password=password,
+        loginProviderName='tmos'
+    )
+    resp = session.post('https://%s/mgmt/shared/authn/login' % hostname,
+                        data=json.dumps(payload))
+    try:
+        token = resp.json()['token']['token']
+    except (ValueError, KeyError, TypeError):
+        session.auth = (username, password)
+    else:
+        session.headers['X-F5-Auth-Token'] = token
+        atexit.register(icr_logout, session, hostname, token)
+
+    return session
+
+
+def icr_logout(session, hostname, token):
+    """Releases the login token of a session"""
+    try:
+        session.delete('https://%s/mgmt/shared/authz/tokens/%s' % (hostname, token),
+                       timeout=LOGOUT_TIMEOUT)
+    except requests.exceptions.RequestException:
+        # The token expires on its own
+        pass
+
+
+def icr_stats(obj):
+    """Returns the REST latency histogram of obj for the module result"""
+    session = getattr(obj, 'api', None)
+    if REQUESTS_AVAILABLE and isinstance(session, requests.Session):
+        return dict(rest_latency=session.latency)
+    return dict()
+
+
 TRANSPORTS = ['rest', 'soap']
 
 # These are the roles that are available to be set in the BIG-IP
@@ -280,6 +366,35 @@ class RestrictedToSinglePartitionError(Exception):
     pass
 
 
+class SoapBatch(object):
+    """Collects the iControl calls that change one object
+
+    The calls are submitted together in a single iControl transaction, so
+    that they are applied all at once or, if any of them fails, not at all.
+    Reads are not collected and should be made before the calls are
+    submitted.
+    """
+
+    def __init__(self, api):
+        self.api = api
+        self.calls = []
+
+    def add(self, method, *args, **kwargs):
+        self.calls.append((method, args, kwargs))
+
+    def submit(self):
+        """Submits the collected calls and returns whether there were any"""
+        if not self.calls:
+            return False
+
+        with bigsuds.Transaction(self.api):
+            for method, args, kwargs in self.calls:
+                method(*args, **kwargs)
+
+        self.calls = []
+        return True
+
+
 class BigIpApiFactory(object):
     def factory(module):
         connection = module.params.get('connection')
@@ -562,48 +677,53 @@ class BigIpSoapApi(BigIpCommon):
             result[partition] = role
         return result
 
-    def delete_all_permissions(self):
+    def delete_all_permissions(self, batch):
         username_credential = self.params['username_credential']
 
-        permissions = self.get_user_permission()
-        for partition, role in permissions.iteritems():
-            permission = dict(role=role, partition=partition)
-            self.api.Management.UserManagement.delete_user_permission(
+        permissions = []
+        for partition, role in self.get_user_permission().iteritems():
+            permissions.append(dict(role=role, partition=partition))
+
+        if permissions:
+            batch.add(
+                self.api.Management.UserManagement.delete_user_permission,
                 user_names=[username_credential],
-                permissions=[[permission]]
+                permissions=[permissions]
             )
 
-    def set_permission(self, role, partition):
+    def set_permissions(self, permissions, batch):
         username_credential = self.params['username_credential']
 
-        permission = dict(role=role, partition=partition)
-        self.api.Management.UserManagement.set_user_permission(
+        batch.add(
+            self.api.Management.UserManagement.set_user_permission,
             user_names=[username_credential],
-            permissions=[[permission]]
+            permissions=[permissions]
         )
 
-    def set_fullname(self):
+    def set_fullname(self, batch):
         username_credential = self.params['username_credential']
         full_name = self.params['full_name']
 
-        self.api.Management.UserManagement.set_fullname(
+        batch.add(
+            self.api.Management.UserManagement.set_fullname,
             user_names=[username_credential],
             fullnames=[full_name]
         )
         return True
 
-    def set_login_shell(self):
+    def set_login_shell(self, batch):
         username_credential = self.params['username_credential']
         shell = self.params['shell']
         shell = self.SHELL_MAP[shell]
 
-        self.api.Management.UserManagement.set_login_shell(
+        batch.add(
+            self.api.Management.UserManagement.set_login_shell,
             user_names=[username_credential],
             shells=[shell]
         )
         return True
 
-    def set_password(self):
+    def set_password(self, batch):
         is_encrypted = self.params['is_encrypted']
         password_credential = self.params['password_credential']
         username_credential = self.params['username_credential']
@@ -612,7 +732,8 @@ class BigIpSoapApi(BigIpCommon):
             is_encrypted=is_encrypted,
             password=password_credential
         )
-        self.api.Management.UserManagement.change_password_2(
+        batch.add(
+            self.api.Management.UserManagement.change_password_2,
             user_names=[username_credential],
             passwords=[passwords]
         )
@@ -693,47 +814,39 @@ class BigIpSoapApi(BigIpCommon):
             return True
 
     def update(self):
-        changed = False
         updates = self._determine_updates()
 
         shell = self.params['shell']
 
+        if updates['shell']:
+            if shell == self.SHELL_BASH and not self.can_have_advanced_shell():
+                raise CustomShellError()
+
+        if self.params['check_mode']:
+            return any(updates.values())
+
+        # The changes to the account are submitted together so that it is
+        # never left half updated, for example without any permissions
+        batch = SoapBatch(self.api)
+
         if updates['full_name']:
-            if self.params['check_mode']:
-                changed = True
-            else:
-                changed = self.set_fullname()
+            self.set_fullname(batch)
 
         if updates['password']:
-            if self.params['check_mode']:
-                changed = True
-            else:
-                changed = self.set_password()
+            self.set_password(batch)
 
         if updates['shell']:
-            if shell == self.SHELL_BASH and not self.can_have_advanced_shell():
-                raise CustomShellError()
-            else:
-                if self.params['check_mode']:
-                    changed = True
-                else:
-                    changed = self.set_login_shell()
+            self.set_login_shell(batch)
 
-        if updates['partition_access']:
+        if updates.get('partition_access'):
             permissions = self.determine_partition_access()
 
-            if self.params['check_mode']:
-                changed = True
-            else:
-                # Start by zeroing out the permissions
-                self.delete_all_permissions()
-
-                # Now, add all the permissions to the user account
-                for permission in permissions:
-                    self.set_permission(permission['role'], permission['partition'])
-                changed = True
+            # Start by zeroing out the permissions, then add all the
+            # permissions to the user account
+            self.delete_all_permissions(batch)
+            self.set_permissions(permissions, batch)
 
-        return changed
+        return batch.submit()
 
     def determine_partition_access(self):
         result = []
@@ -831,6 +944,10 @@ class BigIpRestApi(BigIpCommon):
     def __init__(self, *args, **kwargs):
         super(BigIpRestApi, self).__init__(*args, **kwargs)
 
+        self.api = icr_session(self.params['server'], self.params['user'],
+                               self.params['password'],
+                               self.params['validate_certs'])
+
         server = self.params['server']
 
         self._uri = 'https://%s/mgmt/tm/auth/user' % (server)
@@ -839,12 +956,12 @@ class BigIpRestApi(BigIpCommon):
         }
 
     def did_password_change(self):
-        server = self.params['server']
         user = self.params['username_credential']
         password = self.params['password_credential']
         validate_certs = self.params['validate_certs']
 
         try:
+            # The credentials being checked are not those of the session
             url = "%s/%s" % (self._uri, user)
             resp = requests.get(url,
                                 auth=(user, password),
@@ -859,14 +976,11 @@ class BigIpRestApi(BigIpCommon):
         result = {}
         tmp = []
 
-        user = self.params['user']
         username_credential = self.params['username_credential']
-        password = self.params['password']
         validate_certs = self.params['validate_certs']
 
         url = "%s/%s" % (self._uri, username_credential)
-        resp = requests.get(url,
-                            auth=(user, password),
+        resp = self.api.get(url,
                             verify=validate_certs)
 
         if resp.status_code == 200:
@@ -895,14 +1009,11 @@ class BigIpRestApi(BigIpCommon):
         return result
 
     def exists(self):
-        user = self.params['user']
         username_credential = self.params['username_credential']
-        password = self.params['password']
         validate_certs = self.params['validate_certs']
 
         url = "%s/%s" % (self._uri, username_credential)
-        resp = requests.get(url,
-                            auth=(user, password),
+        resp = self.api.get(url,
                             verify=validate_certs)
 
         if resp.status_code != 200:
@@ -928,9 +1039,7 @@ class BigIpRestApi(BigIpCommon):
         updates = self._determine_updates()
 
         is_encrypted = self.params['is_encrypted']
-        user = self.params['user']
         username_credential = self.params['username_credential']
-        password = self.params['password']
         password_credential = self.params['password_credential']
         shell = self.params['shell']
         validate_certs = self.params['validate_certs']
@@ -958,8 +1067,7 @@ class BigIpRestApi(BigIpCommon):
                 return True
 
             uri = "%s/%s" % (self._uri, username_credential)
-            resp = requests.patch(uri,
-                                  auth=(user, password),
+            resp = self.api.patch(uri,
                                   data=json.dumps(payload),
                                   verify=validate_certs,
                                   headers=self._headers)
@@ -991,9 +1099,7 @@ class BigIpRestApi(BigIpCommon):
 
     def create(self):
         full_name = self.params['full_name']
-        user = self.params['user']
         username_credential = self.params['username_credential']
-        password = self.params['password']
         password_credential = self.params['password_credential']
         validate_certs = self.params['validate_certs']
         is_encrypted = self.params['is_encrypted']
@@ -1031,8 +1137,7 @@ class BigIpRestApi(BigIpCommon):
             else:
                 payload['shell'] = shell
 
-        resp = requests.post(self._uri,
-                             auth=(user, password),
+        resp = self.api.post(self._uri,
                              data=json.dumps(payload),
                              verify=validate_certs,
                              headers=self._headers)
@@ -1043,9 +1148,7 @@ class BigIpRestApi(BigIpCommon):
             raise Exception(res['message'])
 
     def absent(self):
-        user = self.params['user']
         username_credential = self.params['username_credential']
-        password = self.params['password']
         validate_certs = self.params['validate_certs']
 
         if not self.exists():
@@ -1055,8 +1158,7 @@ class BigIpRestApi(BigIpCommon):
             return True
 
         uri = "%s/%s" % (self._uri, username_credential)
-        resp = requests.delete(uri,
-                               auth=(user, password),
+        resp = self.api.delete(uri,
                                verify=validate_certs)
         if resp.status_code == 200:
             return True
@@ -1093,6 +1195,7 @@ def main():
     try:
         obj = BigIpApiFactory.factory(module)
         result = obj.flush()
+        result.update(icr_stats(obj))
 
         module.exit_json(**result)
     except bigsuds.ConnectionError:
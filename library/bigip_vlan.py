@@ -45,7 +45,8 @@ options:
     description:
       - The VLAN to manage. If the special VLAN C(ALL) is specified with
         the C(state) value of C(absent) then all VLANs will be removed.
-    required: true
+        Required unless C(vlans) is given
+    required: false
   password:
     description:
       - BIG-IP password
@@ -88,6 +89,17 @@ options:
     required: true
     aliases:
       - tag
+  vlans:
+    description:
+      - List of VLANs to provision in one task, each a dictionary with the
+        C(name), C(vlan_id), C(interface), C(description) and
+        C(route_domain) keys of the options of the same names. The VLANs of
+        the Common partition are read, with their interfaces, in a single
+        request, and the VLANs that differ are then created or updated
+        together in one iControl REST transaction. With C(state=absent),
+        the listed VLANs are removed in one transaction
+    required: false
+    version_added: "2.1"
 notes:
    - Requires the bigsuds Python package on the host if using the iControl
      interface. This is as easy as pip install bigsuds
@@ -97,11 +109,49 @@ author: Tim Rupp <caphrim007@gmail.com> (@caphrim007)
 '''
 
 EXAMPLES = """
+- name: Provision the tenant VLANs
+  bigip_vlan:
+      server: "lb.mydomain.com"
+      user: "admin"
+      password: "secret"
+      vlans:
+          - name: "tenant-1"
+            vlan_id: 101
+            interface: "1.1"
+            description: "Tenant 1"
+          - name: "tenant-2"
+            vlan_id: 102
+            interface: "1.1"
+            description: "Tenant 2"
+  delegate_to: localhost
+"""
+
+RETURN = """
+created:
+    description: The VLANs created from C(vlans)
+    returned: changed and vlans is given
+    type: list
+    sample: ["tenant-1"]
+updated:
+    description: The VLANs updated from C(vlans)
+    returned: changed and vlans is given
+    type: list
+    sample: ["tenant-2"]
+deleted:
+    description: The VLANs deleted for C(vlans)
+    returned: changed, vlans is given and state is absent
+    type: list
+    sample: ["tenant-2"]
 """
 
+import atexit
 import json
 import socket
 import os
+import shutil
+import tempfile
+import threading
+import time
 
 try:
     import bigsuds
@@ -110,6 +160,97 @@ except ImportError:
 else:
     bigsuds_found = True
 
+
+# WSDLs downloaded by iControl clients are cached here, per BIG-IP version
+WSDL_CACHE_DIR = '~/.ansible/bigip_wsdl'
+
+# Seconds that the recorded version of a BIG-IP is trusted
+WSDL_CACHE_TTL = 86400
+
+
+def wsdl_cache_dir(hostname):
+    """Returns the WSDL cache of hostname, or None when it is not known
+
+    The cache is not known until the version of the BIG-IP has been
+    recorded, and again once the recorded version is older than
+    WSDL_CACHE_TTL, since the BIG-IP may have been upgraded.
+    """
+    base = os.path.expanduser(WSDL_CACHE_DIR)
+    try:
+        with open(os.path.join(base, 'versions.json')) as fh:
+            entry = json.load(fh)[hostname]
+    except (IOError, ValueError, KeyError):
+        return None
+
+    if time.time() - entry['checked'] > WSDL_CACHE_TTL:
+        return None
+    return os.path.join(base, '%s-%s' % (hostname, entry['version']))
+
+
+def remember_version(hostname, version):
+    base = os.path.expanduser(WSDL_CACHE_DIR)
+    path = os.path.join(base, 'versions.json')
+
+    try:
+        with open(path) as fh:
+            versions = json.load(fh)
+    except (IOError, ValueError):
+        versions = {}
+
+    versions[hostname] = dict(version=version, checked=time.time())
+
+    if not os.path.isdir(base):
+        os.makedirs(base, 0700)
+
+    fd, tmp = tempfile.mkstemp(dir=base)
+    with os.fdopen(fd, 'w') as fh:
+        json.dump(versions, fh)
+    os.rename(tmp, path)
+
+
+def icontrol_client(hostname, username, password):
+    """Returns a bigsuds client that keeps the WSDLs it parses on disk
+
+    Each iControl interface otherwise downloads and parses its WSDL every
+    time a module runs. The cache is kept per BIG-IP and version, so the
+    version is looked up first when it is not yet known. The WSDL parsed
+    to look it up is cached in a directory of its own, which is moved into
+    place once the version is known.
+    """
+    cachedir = wsdl_cache_dir(hostname)
+    if cachedir is None:
+        base = os.path.expanduser(WSDL_CACHE_DIR)
+        if not os.path.isdir(base):
+            os.makedirs(base, 0700)
+
+        tmpdir = tempfile.mkdtemp(dir=base)
+        try:
+            api = bigsuds.BIGIP(
+                hostname=hostname,
+                username=username,
+                password=password,
+                debug=True,
+                cachedir=tmpdir
+            )
+            remember_version(hostname, api.System.SystemInfo.get_version())
+            cachedir = wsdl_cache_dir(hostname)
+            try:
+                os.rename(tmpdir, cachedir)
+            except OSError:
+                # The cache of this version already exists
+                pass
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+    return bigsuds.BIGIP(
+        hostname=hostname,
+        username=username,
+        password=password,
+        debug=True,
+        cachedir=cachedir
+    )
+
+
 try:
     import requests
 except ImportError:
@@ -117,7 +258,95 @@ except ImportError:
 else:
     requests_found = True
 
+
+# Largest number of connections that a REST session keeps open to the BIG-IP
+REST_POOL_SIZE = 4
+
+# Upper bounds, in milliseconds, of the buckets of the REST latency histogram
+LATENCY_BUCKETS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# Seconds to wait for the device to release a login token
+LOGOUT_TIMEOUT = 10
+
+
+def icr_session(hostname, username, password, validate_certs=True):
+    """Returns a pooled iControl REST session
+
+    Connections are kept alive and reused by every request made with the
+    session, so that the TLS handshake happens once per connection rather
+    than once per request. The session logs in once and sends the token it
+    is given with each request, falling back to basic auth on BIG-IPs that
+    do not hand out tokens. The token is released when the module exits,
+    rather than being left to expire.
+
+    Responses may be compressed, and the time taken by each request is
+    counted in the session.latency histogram.
+    """
+    session = requests.session()
+    session.verify = validate_certs
+    session.headers.update({
+        'Content-Type': 'application/json',
+        'Accept-Encoding': 'gzip, deflate'
+    })
+
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1,
+                                            pool_maxsize=REST_POOL_SIZE)
+    session.mount('https://', adapter)
+
+    session.latency = dict((str(x), 0) for x in LATENCY_BUCKETS)
+    session.latency['inf'] = 0
+
+    def record_latency(resp, *args, **kwargs):
+        elapsed = resp.elapsed.total_seconds() * 1000
+        for bound in LATENCY_BUCKETS:
+            if elapsed <= bound:
+                session.latency[str(bound)] += 1
+                break
+        else:
+            session.latency['inf'] += 1
+
+    session.hooks['response'].append(record_latency)
+
+    payload = dict(
+        username=username,
+        password=password,
+        loginProviderName='tmos'
+    )
+    resp = session.post('https://%s/mgmt/shared/authn/login' % hostname,
+                        data=json.dumps(payload))
+    try:
+        token = resp.json()['token']['token']
+    except (ValueError, KeyError, TypeError):
+        session.auth = (username, password)
+    else:
+        session.headers['X-F5-Auth-Token'] = token
+        atexit.register(icr_logout, session, hostname, token)
+
+    return session
+
+
+def icr_logout(session, hostname, token):
+    """Releases the login token of a session"""
+    try:
+        session.delete('https://%s/mgmt/shared/authz/tokens/%s' % (hostname, token),
+                       timeout=LOGOUT_TIMEOUT)
+    except requests.exceptions.RequestException:
+        # The token expires on its own
+        pass
+
+
+def icr_stats(obj):
+    """Returns the REST latency histogram of obj for the module result"""
+    session = getattr(obj, 'api', None)
+    if requests_found and isinstance(session, requests.Session):
+        return dict(rest_latency=session.latency)
+    return dict()
+
+
 CONNECTION_TIMEOUT = 30
+
+# Seconds to wait for the BIG-IP to validate and apply a REST transaction
+TRANSACTION_TIMEOUT = 300
 OBJ_PREFIX = 'uuid_'
 BIGIP_VE_PLATFORM_ID = 'Z100'
 
@@ -157,6 +386,21 @@ class RouteUpdateException(Exception):
     pass
 
 
+class VLANBulkException(Exception):
+    """VLANBulkException"""
+    pass
+
+
+def rest_error(error):
+    """ Get the message of a REST error, or its raw text if it has none """
+    text = str(error)
+    try:
+        body = json.loads(text)
+        return body.get('message') or body.get('failureReason') or text
+    except (ValueError, AttributeError):
+        return text
+
+
 def strip_folder_and_prefix(path):
     """ Strip folder and prefix """
     if isinstance(path, list):
@@ -179,14 +423,13 @@ def strip_folder_and_prefix(path):
 
 
 def test_icontrol(username, password, hostname):
-    api = bigsuds.BIGIP(
-        hostname=hostname,
-        username=username,
-        password=password,
-        debug=True
-    )
+    # A warm WSDL cache means that the BIG-IP was reached recently, so it
+    # is not probed again
+    if wsdl_cache_dir(hostname):
+        return True
 
     try:
+        api = icontrol_client(hostname, username, password)
         response = api.Management.LicenseAdministration.get_license_activation_status()
         if 'STATE' in response:
             return True
@@ -196,6 +439,152 @@ def test_icontrol(username, password, hostname):
         return False
 
 
+class RouteDomainIndex(object):
+    """ Route domains of a partition by id and by name
+
+    The route domains of a partition are listed with a single query the
+    first time one of them is looked up. The vlans of each route domain are
+    kept as a set, which writes made through the index update in place
+    instead of the route domains being listed again.
+    """
+
+    def __init__(self, api, uri):
+        self.api = api
+        self._uri = uri
+        self._partitions = dict()
+        self._lock = threading.RLock()
+
+    def _load(self, folder):
+        folder = str(folder).replace('/', '')
+        with self._lock:
+            if folder in self._partitions:
+                return self._partitions[folder]
+
+            request_url = self._uri + \
+                '/net/route-domain?$select=id,name,partition,vlans'
+            if folder:
+                request_filter = 'partition eq ' + folder
+                request_url += '&$filter=' + request_filter
+            response = self.api.get(request_url, timeout=CONNECTION_TIMEOUT)
+
+            by_id = dict()
+            by_name = dict()
+            if response.status_code < 400:
+                response_obj = json.loads(response.text)
+                for item in response_obj.get('items', []):
+                    route_domain = dict(
+                        id=int(item['id']),
+                        name=item['name'],
+                        partition=folder,
+                        vlans=set(item.get('vlans', []))
+                    )
+                    by_id[route_domain['id']] = route_domain
+                    by_name[route_domain['name']] = route_domain
+            elif response.status_code != 404:
+                raise RouteQueryException(response.text)
+
+            self._partitions[folder] = (by_id, by_name)
+            return self._partitions[folder]
+
+    def by_id(self, folder='Common', route_domain_id=0):
+        """ Get route domain by id """
+        return self._load(folder)[0].get(int(route_domain_id))
+
+    def by_name(self, folder='Common', name=None):
+        """ Get route domain by name """
+        return self._load(folder)[1].get(name)
+
+    def add_vlan(self, route_domain, name):
+        """ Add VLAN to route domain """
+        with self._lock:
+            if name in route_domain['vlans']:
+                return False
+
+            vlans = dict()
+            vlans['vlans'] = sorted(route_domain['vlans'] | set([name]))
+            request_url = self._uri + '/net/route-domain/'
+            request_url += '~' + route_domain['partition']
+            request_url += '~' + route_domain['name']
+            response = self.api.put(
+                request_url, data=json.dumps(vlans),
+                timeout=CONNECTION_TIMEOUT)
+            if response.status_code < 400:
+                route_domain['vlans'].add(name)
+                return True
+            else:
+                raise RouteUpdateException(response.text)
+
+
+class RestTransaction(object):
+    """ iControl REST transaction
+
+    Requests made through the transaction are queued on the BIG-IP, and
+    are applied together, or not at all, when the transaction is committed.
+    The transaction is started by the first request made through it.
+    """
+
+    def __init__(self, api, uri):
+        self.api = api
+        self._uri = uri
+        self.id = None
+
+    def request(self, method, request_url, payload=None):
+        """ Queue request in transaction """
+        if self.id is None:
+            self._begin()
+
+        headers = {'X-F5-REST-Coordination-Id': str(self.id)}
+        if payload is not None:
+            payload = json.dumps(payload)
+        response = self.api.request(
+            method, request_url, data=payload, headers=headers,
+            timeout=CONNECTION_TIMEOUT)
+        if response.status_code >= 400:
+            raise VLANUpdateException(response.text)
+
+    def commit(self):
+        """ Commit transaction """
+        if self.id is None:
+            return False
+
+        request_url = self._uri + '/transaction/%s' % self.id
+        response = self.api.patch(
+            request_url, data=json.dumps(dict(state='VALIDATING')),
+            timeout=TRANSACTION_TIMEOUT)
+        if response.status_code >= 400:
+            raise VLANUpdateException(response.text)
+
+        # A transaction can be accepted and still not be applied, which is
+        # only told by its state
+        try:
+            state = response.json().get('state')
+        except (ValueError, AttributeError):
+            state = None
+        if state != 'COMPLETED':
+            raise VLANUpdateException(response.text)
+        return True
+
+    def abort(self):
+        """ Discard transaction """
+        if self.id is None:
+            return
+
+        request_url = self._uri + '/transaction/%s' % self.id
+        try:
+            self.api.delete(request_url, timeout=CONNECTION_TIMEOUT)
+        except Exception:
+            pass
+
+    def _begin(self):
+        request_url = self._uri + '/transaction'
+        response = self.api.post(
+            request_url, data=json.dumps(dict()),
+            timeout=CONNECTION_TIMEOUT)
+        if response.status_code >= 400:
+            raise VLANUpdateException(response.text)
+        self.id = json.loads(response.text)['transId']
+
+
 class BigIpCommon(object):
     def __init__(self, module):
         self._username = module.params.get('user')
@@ -218,12 +607,7 @@ class BigIpIControl(BigIpCommon):
     def __init__(self, module):
         super(BigIpIControl, self).__init__(module)
 
-        self.api = bigsuds.BIGIP(
-            hostname=self._hostname,
-            username=self._username,
-            password=self._password,
-            debug=True
-        )
+        self.api = icontrol_client(self._hostname, self._username, self._password)
 
 
 class BigIpRest(BigIpCommon):
@@ -236,6 +620,7 @@ class BigIpRest(BigIpCommon):
             self._hostname, self._username, self._password,
             validate_certs=self._validate_certs
         )
+        self.domains = RouteDomainIndex(self.api, self._uri)
         self.icontrol = BigIpIControl(module)
 
     def icr_link(self, selfLink):
@@ -244,16 +629,12 @@ class BigIpRest(BigIpCommon):
 
     def _get_icr_session(self, hostname, username, password, validate_certs=False, timeout=None):
         """ Get iControl REST Session """
-        icr_session = requests.session()
-        icr_session.auth = (username, password)
-        icr_session.verify = validate_certs
-        icr_session.headers.update({'Content-Type': 'application/json'})
         if timeout:
             socket.setdefaulttimeout(timeout)
         else:
             socket.setdefaulttimeout(CONNECTION_TIMEOUT)
 
-        return icr_session
+        return icr_session(hostname, username, password, validate_certs)
 
     def absent(self):
         if self._name == 'ALL':
@@ -303,6 +684,184 @@ class BigIpRest(BigIpCommon):
 
         return changed
 
+    def reconcile(self, vlans, folder='Common'):
+        """ Create or update the vlans of the vlans list
+
+        The vlans of the partition are read once, with their interfaces,
+        and every change is then made in a single transaction.
+        """
+        folder = str(folder).replace('/', '')
+        current = self.read_all(folder=folder)
+        wanted = [self._desired(x) for x in vlans]
+
+        created = []
+        updated = set()
+        domains = dict()
+
+        transaction = RestTransaction(self.api, self._uri)
+        try:
+            for want in wanted:
+                name = want['name']
+
+                if name not in current:
+                    payload = dict()
+                    payload['name'] = name
+                    payload['partition'] = folder
+                    payload['tag'] = want['tag'] or 0
+                    if want['interfaces']:
+                        payload['interfaces'] = \
+                            self._interfaces_payload(want['interfaces'])
+                    if want['description']:
+                        payload['description'] = want['description']
+                    transaction.request(
+                        'POST', self._uri + '/net/vlan/', payload)
+                    created.append(name)
+                else:
+                    payload = self.changes(current[name], want)
+                    if payload:
+                        request_url = self._uri + '/net/vlan/'
+                        request_url += '~' + folder + '~' + name
+                        transaction.request('PATCH', request_url, payload)
+                        updated.add(name)
+
+                if want['route_domain']:
+                    route_domain = self.domains.by_name(
+                        folder=want['route_domain'], name=want['route_domain'])
+                    if not route_domain:
+                        raise VLANBulkException(
+                            "Cannot get route domain %s" % want['route_domain'])
+
+                    member = '/' + folder + '/' + name
+                    if member not in route_domain['vlans']:
+                        key = (route_domain['partition'], route_domain['name'])
+                        domains.setdefault(key, (route_domain, set()))
+                        domains[key][1].add(member)
+                        if name in current:
+                            updated.add(name)
+
+            # The vlans of each route domain are replaced once, with all of
+            # the vlans added to it
+            for route_domain, members in domains.values():
+                request_url = self._uri + '/net/route-domain/'
+                request_url += '~' + route_domain['partition']
+                request_url += '~' + route_domain['name']
+                payload = dict(
+                    vlans=sorted(route_domain['vlans'] | members)
+                )
+                transaction.request('PUT', request_url, payload)
+
+            transaction.commit()
+        except Exception:
+            transaction.abort()
+            raise
+
+        for route_domain, members in domains.values():
+            route_domain['vlans'] |= members
+
+        return dict(
+            created=sorted(created),
+            updated=sorted(updated)
+        )
+
+    def remove(self, vlans, folder='Common'):
+        """ Delete the vlans of the vlans list """
+        folder = str(folder).replace('/', '')
+        current = self.read_all(folder=folder)
+        deleted = [x['name'] for x in vlans if x.get('name') in current]
+
+        transaction = RestTransaction(self.api, self._uri)
+        try:
+            for name in deleted:
+                request_url = self._uri + '/net/vlan/'
+                request_url += '~' + folder + '~' + name
+                transaction.request('DELETE', request_url)
+            transaction.commit()
+        except Exception:
+            transaction.abort()
+            raise
+
+        return dict(deleted=sorted(deleted))
+
+    def read_all(self, folder='Common'):
+        """ Get vlans with their interfaces """
+        folder = str(folder).replace('/', '')
+        request_url = self._uri + '/net/vlan/'
+        request_url += '?expandSubcollections=true'
+        if folder:
+            request_filter = 'partition eq ' + folder
+            request_url += '&$filter=' + request_filter
+        response = self.api.get(
+            request_url, timeout=CONNECTION_TIMEOUT)
+        result = dict()
+        if response.status_code < 400:
+            return_obj = json.loads(response.text)
+            for vlan in return_obj.get('items', []):
+                reference = vlan.get('interfacesReference', dict())
+                interfaces = [(x['name'], bool(x.get('tagged')))
+                              for x in reference.get('items', [])]
+                result[strip_folder_and_prefix(vlan['name'])] = dict(
+                    tag=int(vlan.get('tag', 0)),
+                    description=vlan.get('description'),
+                    interfaces=sorted(interfaces)
+                )
+        elif response.status_code != 404:
+            raise VLANQueryException(response.text)
+        return result
+
+    def changes(self, current, want):
+        """ Get the vlan attributes that differ from those read """
+        payload = dict()
+
+        if want['tag'] is not None and current['tag'] != want['tag']:
+            payload['tag'] = want['tag']
+
+        if want['interfaces'] is not None and \
+           current['interfaces'] != want['interfaces']:
+            payload['interfaces'] = \
+                self._interfaces_payload(want['interfaces'])
+
+        if want['description'] is not None and \
+           current['description'] != want['description']:
+            payload['description'] = want['description']
+
+        return payload
+
+    def _desired(self, item):
+        """ Fill in the defaults of an entry of vlans """
+        if not item.get('name'):
+            raise VLANBulkException("The name of every entry in vlans is required")
+
+        tag = item.get('vlan_id', item.get('tag'))
+        if tag is not None:
+            try:
+                tag = int(tag)
+            except (TypeError, ValueError):
+                raise VLANBulkException(
+                    "The vlan_id of %s must be a number, not %s" % (item['name'], tag))
+
+        # As with a single vlan, the interface is tagged when the vlan has
+        # a tag
+        interfaces = None
+        if item.get('interface'):
+            interfaces = [(item['interface'], bool(tag))]
+
+        return dict(
+            name=item['name'],
+            tag=tag,
+            interfaces=interfaces,
+            description=item.get('description'),
+            route_domain=item.get('route_domain')
+        )
+
+    def _interfaces_payload(self, interfaces):
+        result = []
+        for name, tagged in interfaces:
+            if tagged:
+                result.append({'name': name, 'tagged': True})
+            else:
+                result.append({'name': name, 'untagged': True})
+        return result
+
     def create(self, name=None, vlanid=None, interface=None,
                folder='Common', description=None, route_domain_id=0):
         """ Create vlan.
@@ -549,92 +1108,46 @@ class BigIpRest(BigIpCommon):
     def add_vlan_to_domain_by_id(
             self, name=None, folder='Common', route_domain_id=0):
         """ Add VLANs to Domain """
-        folder = str(folder).replace('/', '')
-        existing_vlans = self.get_vlans_in_domain_by_id(
-            folder=folder, route_domain_id=route_domain_id)
         route_domain = self.get_domain_by_id(
             folder=folder, route_domain_id=route_domain_id)
         if not route_domain:
             raise RouteUpdateException("Cannot get route domain %s" % route_domain_id)
-        if name not in existing_vlans:
-            existing_vlans.append(name)
-            vlans = dict()
-            vlans['vlans'] = existing_vlans
-            request_url = self._uri + '/net/route-domain/'
-            request_url += '~' + folder + '~' + route_domain['name']
-            response = self.api.put(
-                request_url, data=json.dumps(vlans),
-                timeout=CONNECTION_TIMEOUT)
-            if response.status_code < 400:
-                return True
-            else:
-                raise RouteUpdateException(response.text)
-        return False
+        return self.domains.add_vlan(route_domain, name)
 
     def get_vlans_in_domain_by_id(self, folder='/Common', route_domain_id=0):
         """ Get VLANs in Domain """
         route_domain = self.get_domain_by_id(
             folder=folder, route_domain_id=route_domain_id)
-        vlans = []
-        if 'vlans' in route_domain:
-            for vlan in route_domain['vlans']:
-                vlans.append(vlan)
-        return vlans
+        if not route_domain:
+            return []
+        return sorted(route_domain['vlans'])
 
     def get_domain_by_id(self, folder='/Common', route_domain_id=0):
-        """ Get VLANs in Domain """
-        folder = str(folder).replace('/', '')
-        request_url = self._uri + \
-            '/net/route-domain?$select=id,name,partition,vlans'
-        if folder:
-            request_filter = 'partition eq ' + folder
-            request_url += '&$filter=' + request_filter
-        response = self.api.get(request_url, timeout=CONNECTION_TIMEOUT)
-
-        if response.status_code < 400:
-            response_obj = json.loads(response.text)
-            if 'items' in response_obj:
-                for route_domain in response_obj['items']:
-                    if int(route_domain['id']) == route_domain_id:
-                        return route_domain
-            return None
-        else:
-            if response.status_code != 404:
-                raise RouteQueryException(response.text)
-        return None
+        """ Get route domain by id """
+        return self.domains.by_id(folder=folder,
+                                  route_domain_id=route_domain_id)
 
     def get_domain(self, folder='Common'):
         """ Get route domain """
         folder = str(folder).replace('/', '')
         if folder == 'Common':
             return 0
-        if folder in self.domain_index:
-            return self.domain_index[folder]
-        else:
-            request_url = self._uri + '/net/route-domain/'
-            request_url += '~' + folder + '~' + folder
-            request_url += '?$select=id'
-            response = self.api.get(
-                request_url, timeout=CONNECTION_TIMEOUT)
-            if response.status_code < 400:
-                response_obj = json.loads(response.text)
-                if 'id' in response_obj:
-                    self.domain_index[folder] = int(response_obj['id'])
-                    return self.domain_index[folder]
-            elif response.status_code != 404:
-                raise RouteQueryException(response.text)
-            return 0
+        route_domain = self.domains.by_name(folder=folder, name=folder)
+        if route_domain:
+            return route_domain['id']
+        return 0
 
 
 def main():
     changed = False
+    result = dict()
 
     module = AnsibleModule(
         argument_spec=dict(
             description=dict(required=False, default=None),
             interface=dict(required=False, default=None),
             interfaces=dict(required=False, default=None),
-            name=dict(required=True, default=None),
+            name=dict(required=False, default=None),
             password=dict(required=True),
             route_domain=dict(required=False, default=None),
             server=dict(required=True),
@@ -642,13 +1155,19 @@ def main():
             user=dict(required=True, aliases=['username']),
             validate_certs=dict(default='yes', type='bool'),
             vlan_id=dict(required=False, default=None, aliases=['tag']),
+            vlans=dict(required=False, type='list')
         ),
         mutually_exclusive=[
-            ['interface', 'interfaces']
+            ['interface', 'interfaces'],
+            ['name', 'vlans']
+        ],
+        required_one_of=[
+            ['name', 'vlans']
         ]
     )
 
     state = module.params.get('state')
+    vlans = module.params.get('vlans')
 
     try:
         if not requests_found:
@@ -659,7 +1178,13 @@ def main():
 
         obj = BigIpRest(module)
 
-        if state == "present":
+        if vlans:
+            if state == "present":
+                result = obj.reconcile(vlans)
+            else:
+                result = obj.remove(vlans)
+            changed = any(result.values())
+        elif state == "present":
             if obj.present():
                 changed = True
         elif state == "absent":
@@ -667,13 +1192,17 @@ def main():
                 changed = True
     except socket.timeout, e:
         module.fail_json(msg="Timed out connecting to the BIG-IP")
-    except VLANUpdateException, e:
-        response_obj = json.loads(str(e))
-        module.fail_json(msg=response_obj['message'])
+    except (VLANCreationException, VLANDeleteException, VLANQueryException,
+            VLANUpdateException, RouteQueryException, RouteUpdateException,
+            SystemQueryException), e:
+        module.fail_json(msg=rest_error(e))
+    except VLANBulkException, e:
+        module.fail_json(msg=str(e))
     except MemoryError, e:
         module.fail_json(msg=str(e))
 
-    module.exit_json(changed=changed)
+    result.update(icr_stats(obj))
+    module.exit_json(changed=changed, **result)
 
 from ansible.module_utils.basic import *
 
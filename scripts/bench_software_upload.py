@@ -0,0 +1,133 @@
+#!/usr/bin/python
+#
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Measures the throughput of the REST upload engine in bigip_software
+# against a local HTTP server that stands in for the BIG-IP
+# software-image-uploads endpoint.
+#
+# Usage:
+#
+#    python scripts/bench_software_upload.py --size 256 --latency 20
+#
+
+import filecmp
+import os
+import sys
+import time
+import optparse
+import tempfile
+import threading
+
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+import requests
+
+sys.path.insert(1, os.path.join(os.path.dirname(__file__), '..', 'library'))
+import bigip_software
+
+
+class UploadServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    latency = 0
+    dest = None
+
+
+class UploadHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        length = int(self.headers['Content-Length'])
+        crange = self.headers['Content-Range']
+        start = int(crange.split('-')[0])
+        data = self.rfile.read(length)
+
+        # Simulates the round trip time to a remote device
+        time.sleep(self.server.latency)
+
+        with open(self.server.dest, 'r+b') as fh:
+            fh.seek(start)
+            fh.write(data)
+
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def run(server, source, concurrency, chunk_size):
+    session = requests.session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1,
+                                            pool_maxsize=concurrency)
+    session.mount('http://', adapter)
+
+    with open(server.dest, 'wb'):
+        pass
+
+    uri = 'http://127.0.0.1:%s/mgmt/cm/autodeploy/software-image-uploads/%s' % (
+        server.server_port, os.path.basename(source)
+    )
+    uploader = bigip_software.RestUploader(session, uri, source,
+                                           chunk_size=chunk_size,
+                                           concurrency=concurrency)
+    start = time.time()
+    uploader.run()
+    return time.time() - start
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--size', type='int', default=128,
+                      help='Size of the test image in MiB')
+    parser.add_option('--chunk', type='int', default=512,
+                      help='Chunk size in KiB')
+    parser.add_option('--latency', type='int', default=10,
+                      help='Simulated per-request latency in ms')
+    parser.add_option('--concurrency', default='1,2,4,8',
+                      help='Comma separated list of concurrency levels')
+    options, args = parser.parse_args()
+
+    source = tempfile.NamedTemporaryFile(suffix='.iso')
+    block = os.urandom(1024 * 1024)
+    for x in range(options.size):
+        source.write(block)
+    source.flush()
+
+    dest = tempfile.NamedTemporaryFile()
+
+    server = UploadServer(('127.0.0.1', 0), UploadHandler)
+    server.latency = options.latency / 1000.0
+    server.dest = dest.name
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    print('%-12s %-10s %-10s' % ('concurrency', 'seconds', 'MiB/s'))
+    for concurrency in options.concurrency.split(','):
+        concurrency = int(concurrency)
+        elapsed = run(server, source.name, concurrency, options.chunk * 1024)
+        if not filecmp.cmp(source.name, dest.name, shallow=False):
+            sys.exit('Uploaded file does not match the source')
+        print('%-12s %-10.2f %-10.1f' % (concurrency, elapsed,
+                                         options.size / elapsed))
+
+    server.shutdown()
+
+if __name__ == '__main__':
+    main()
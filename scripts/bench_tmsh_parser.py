@@ -0,0 +1,92 @@
+#!/usr/bin/python
+#
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Measures the tmsh output parser in bigip_command against the sample
+# outputs in tests/fixtures/tmsh. Each sample is repeated, with the object
+# names made unique, to build outputs of increasing size so that the
+# parse time can be checked to grow linearly.
+#
+# Usage:
+#
+#    python scripts/bench_tmsh_parser.py --objects 1000,10000,50000
+#
+
+import glob
+import os
+import sys
+import time
+import optparse
+
+sys.path.insert(1, os.path.join(os.path.dirname(__file__), '..', 'library'))
+import bigip_command
+
+FIXTURES = os.path.join(os.path.dirname(__file__), '..', 'tests', 'fixtures', 'tmsh')
+
+
+def load_corpus():
+    """Returns the top level objects of every sample, as lists of lines"""
+    objects = []
+    for path in sorted(glob.glob(os.path.join(FIXTURES, '*.txt'))):
+        with open(path) as fh:
+            current = []
+            for line in fh:
+                current.append(line)
+                if line.rstrip() == '}':
+                    objects.append(current)
+                    current = []
+    return objects
+
+
+def build(corpus, count):
+    """Returns count objects copied from the corpus under unique names"""
+    lines = []
+    for x in range(count):
+        sample = corpus[x % len(corpus)]
+        header = sample[0].split()
+        if len(header) > 3:
+            header[-2] = '%s-%d' % (header[-2], x)
+        lines.append(' '.join(header) + '\n')
+        lines.extend(sample[1:])
+    return lines
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--objects', default='1000,10000,50000',
+                      help='Comma separated list of object counts')
+    options, args = parser.parse_args()
+
+    corpus = load_corpus()
+    if not corpus:
+        sys.exit('No samples found in %s' % FIXTURES)
+
+    print('%-10s %-10s %-10s %-12s' % ('objects', 'MiB', 'seconds', 'objects/s'))
+    for count in options.objects.split(','):
+        count = int(count)
+        lines = build(corpus, count)
+        size = sum(len(x) for x in lines) / 1048576.0
+
+        tmsh = bigip_command.TmshParser()
+        start = time.time()
+        tmsh.parse(lines)
+        elapsed = time.time() - start
+
+        print('%-10s %-10.1f %-10.2f %-12.0f' % (count, size, elapsed,
+                                                 count / elapsed))
+
+if __name__ == '__main__':
+    main()
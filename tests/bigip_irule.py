@@ -147,3 +147,51 @@
         assert:
             that:
                 - not result|changed
+
+      - name: Synchronize iRules in LTM from a directory
+        bigip_irule:
+            server: "{{ inventory_hostname }}"
+            user: "{{ bigip_username }}"
+            password: "{{ bigip_password }}"
+            validate_certs: "{{ validate_certs }}"
+            module: "ltm"
+            src_dir: "fixtures"
+        register: result
+
+      - name: Assert Synchronize iRules in LTM from a directory
+        assert:
+            that:
+                - result|changed
+                - result.created|length == 2
+
+      - name: Synchronize iRules in LTM from a directory - Idempotent check
+        bigip_irule:
+            server: "{{ inventory_hostname }}"
+            user: "{{ bigip_username }}"
+            password: "{{ bigip_password }}"
+            validate_certs: "{{ validate_certs }}"
+            module: "ltm"
+            src_dir: "fixtures"
+        register: result
+
+      - name: Assert Synchronize iRules in LTM from a directory - Idempotent check
+        assert:
+            that:
+                - not result|changed
+
+      - name: Remove synchronized iRules in LTM
+        bigip_irule:
+            server: "{{ inventory_hostname }}"
+            user: "{{ bigip_username }}"
+            password: "{{ bigip_password }}"
+            validate_certs: "{{ validate_certs }}"
+            module: "ltm"
+            src_dir: "fixtures"
+            state: "absent"
+        register: result
+
+      - name: Assert Remove synchronized iRules in LTM
+        assert:
+            that:
+                - result|changed
+                - result.removed|length == 2